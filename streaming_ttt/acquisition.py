@@ -0,0 +1,141 @@
+import threading
+import time
+import logging
+import numpy as np
+from metrics import ADQ_JITTER, ADQ_ATRASADAS
+
+# --- CONFIGURACIÓN ---
+FRECUENCIA_HZ = 100.0        # Cadencia fija de muestreo del hilo de adquisición
+CAPACIDAD_BUFFER = 1 << 16   # Muestras retenidas (potencia de 2, ~11 min a 100 Hz)
+TIMEOUT_LECTURA = 0.0        # Sin espera activa: si no hay movimiento la muestra es (0, 0) con movimiento=False
+
+
+class BufferCircular:
+    # Buffer circular de un único productor y múltiples lectores, sin locks.
+    # El hilo de adquisición escribe la muestra en su slot y recién después
+    # publica el contador `escritos`; los lectores copian un rango y verifican
+    # que el productor no lo haya pisado mientras copiaban.
+    # `movimiento` marca si el sensor reportó desplazamiento: un (0, 0) sin
+    # movimiento es una lectura vencida, no un reposo medido.
+    # `perdidas_previas` guarda, en la primera muestra de un bloque, cuántas se
+    # perdieron antes de llegar (p. ej. descartadas por el servidor): cada
+    # lector las suma al leer esa muestra, junto con las que él mismo pisó.
+    def __init__(self, capacidad=CAPACIDAD_BUFFER):
+        if capacidad <= 0 or capacidad & (capacidad - 1):
+            raise ValueError(f"La capacidad debe ser potencia de 2: {capacidad}")
+        self.capacidad = capacidad
+        self._mascara = capacidad - 1
+        self.t_ns = np.zeros(capacidad, dtype=np.int64)
+        self.dx = np.zeros(capacidad, dtype=np.int32)
+        self.dy = np.zeros(capacidad, dtype=np.int32)
+        self.movimiento = np.zeros(capacidad, dtype=bool)
+        self.perdidas_previas = np.zeros(capacidad, dtype=np.int64)
+        self._perdidas_pendientes = 0   # Informadas sin muestras detrás: van a la próxima
+        self.escritos = 0
+
+    def escribir(self, t_ns, dx, dy, movimiento=True):
+        i = self.escritos & self._mascara
+        self.t_ns[i] = t_ns
+        self.dx[i] = dx
+        self.dy[i] = dy
+        self.movimiento[i] = movimiento
+        self.perdidas_previas[i] = 0
+        self.escritos += 1  # Publicación: a partir de acá la muestra es visible
+
+    def escribir_bloque(self, t_ns, dx, dy, movimiento=None, perdidas=0):
+        # Igual que escribir() para n muestras; se publican todas juntas al final.
+        # `perdidas`: muestras que faltan antes de este bloque (aguas arriba)
+        n = len(t_ns)
+        if n == 0:
+            self._perdidas_pendientes += perdidas
+            return
+        m = min(n, self.capacidad)   # Si no entra, solo sobreviven las últimas
+        idx = np.arange(self.escritos + n - m, self.escritos + n, dtype=np.int64) & self._mascara
+        self.t_ns[idx] = t_ns[-m:]
+        self.dx[idx] = dx[-m:]
+        self.dy[idx] = dy[-m:]
+        self.movimiento[idx] = True if movimiento is None else movimiento[-m:]
+        self.perdidas_previas[idx] = 0
+        self.perdidas_previas[idx[0]] = perdidas + self._perdidas_pendientes
+        self._perdidas_pendientes = 0
+        self.escritos += n
+
+    def leer_desde(self, desde):
+        # Devuelve (t_ns, dx, dy, movimiento, siguiente, perdidas): copias de las muestras
+        # escritas desde el índice absoluto `desde`, el índice a usar en la
+        # próxima lectura y la cantidad de muestras perdidas: las pisadas antes
+        # de leerlas más las que ya faltaban al escribir las leídas.
+        fin = self.escritos
+        inicio = max(desde, fin - self.capacidad)
+        idx = np.arange(inicio, fin, dtype=np.int64) & self._mascara
+        t_ns = self.t_ns[idx]
+        dx = self.dx[idx]
+        dy = self.dy[idx]
+        movimiento = self.movimiento[idx]
+        previas = self.perdidas_previas[idx]
+
+        # Si el productor avanzó durante la copia, descartamos lo pisado
+        pisadas = max(0, self.escritos - self.capacidad - inicio)
+        if pisadas:
+            t_ns, dx, dy, movimiento, previas = t_ns[pisadas:], dx[pisadas:], dy[pisadas:], movimiento[pisadas:], previas[pisadas:]
+        perdidas = (inicio - desde) + min(pisadas, fin - inicio) + int(previas.sum())
+        return t_ns, dx, dy, movimiento, fin, perdidas
+
+    def ultimo_indice(self):
+        return self.escritos
+
+
+class AdquisidorSensor(threading.Thread):
+    # Hilo dueño del sensor: llama a read_sample a cadencia fija y publica las
+    # lecturas crudas en el buffer circular. La UI nunca toca el SPI.
+    def __init__(self, sensor, frecuencia_hz=FRECUENCIA_HZ, buffer=None, nombre="adquisicion-sensor"):
+        super().__init__(name=nombre, daemon=True)
+        self.sensor = sensor
+        self.periodo = 1.0 / frecuencia_hz
+        self.buffer = buffer if buffer is not None else BufferCircular()
+        self.atrasadas = 0   # Ciclos que no llegaron a su deadline
+        self.errores = 0
+        self.ultimo_error = None
+        self._detener = threading.Event()
+
+    def run(self):
+        logging.info(f"Adquisición iniciada a {1.0 / self.periodo:.1f} Hz")
+        proximo = time.monotonic()
+        anterior = None
+        while not self._detener.is_set():
+            try:
+                movimiento, dx, dy = self.sensor.read_sample(timeout=TIMEOUT_LECTURA)
+            except Exception as e:
+                self.errores += 1
+                self.ultimo_error = e
+                logging.error(f"Error de lectura en el hilo de adquisición: {e}")
+                break
+            self.buffer.escribir(time.time_ns(), dx, dy, movimiento)
+
+            ahora = time.perf_counter()
+            if anterior is not None:
+                ADQ_JITTER.observe(abs(ahora - anterior - self.periodo))
+            anterior = ahora
+
+            proximo += self.periodo
+            espera = proximo - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)
+            else:
+                self.atrasadas += 1
+                ADQ_ATRASADAS.inc()
+                if espera < -self.periodo:
+                    proximo = time.monotonic()  # Resincroniza si se perdió más de un ciclo
+        logging.info("Adquisición detenida")
+
+    def detener(self, timeout=1.0):
+        self._detener.set()
+        self.join(timeout)
+
+    def estadisticas(self):
+        return {
+            "muestras": self.buffer.ultimo_indice(),
+            "atrasadas": self.atrasadas,
+            "errores": self.errores,
+            "activo": self.is_alive(),
+        }
@@ -1,22 +1,63 @@
+import time
+INICIO_RERUN = time.perf_counter()
+from arranque import RELOJ
 import streamlit as st
-import matplotlib.pyplot as plt
-import altair as alt
 import pandas as pd
-import time
+import numpy as np
 import os
-import json
-from io import StringIO
+import logging
 from datetime import datetime
-from sensor import SpiSensor
-from report_generator import generar_reporte_pdf
-from histograms import generar_histogramas
+from multisensor import gestor_desde_entorno, FUSIONADO
+from servidor import GestorRemoto
+from columnar import AlmacenColumnar
+from formato_binario import EscritorCrudo, EXTENSION as EXTENSION_CRUDO
+from exportacion import (ExportacionResultados, ExportacionCrudo, contenido_archivo, nombre_exportacion,
+                         limpiar_exportaciones, EXPORTACION_DIR)
+from downsampling import ResumenMinMax
+from thresholds import IndiceUmbrales, tabla_resumen
+from segmentacion import SegmentadorConexiones, CERRADA
+from filtros import FiltroDeltas, TAU_SUAVIZADO_S
+from report_worker import ColaReportes, TERMINADO, ERROR, CANCELADO, FINALES
+from journal import Journal, JournalOcupado, sesion_activa, recuperar
+from historico import HistoricoConexiones, DIAS_POR_MES
+from estadisticas import EstadisticasPozo
+from calibracion import AlmacenCalibraciones
+from metrics import REGISTRO, ADQ_PERDIDAS, UI_RERUN, UI_FRAGMENTO, PUERTO_METRICAS, iniciar_servidor
+# altair se importa en el primer gráfico; matplotlib/WeasyPrint solo en el proceso de reportes
+RELOJ.marcar("imports")
 
 # ==============================
 # CARGA DE CONFIGURACIONES
 # ==============================
 THRESHOLDS_PATH = "thresholds.json"
-with open(THRESHOLDS_PATH, "r") as f:
-    THRESHOLDS = json.load(f)
+
+@st.cache_resource
+def obtener_umbrales():
+    # Índice compartido entre reruns; cada rerun solo verifica el mtime del archivo
+    return IndiceUmbrales(THRESHOLDS_PATH)
+
+@st.cache_resource
+def preparar_directorios(*directorios):
+    # Una vez por proceso, no en cada rerun
+    for directorio in directorios:
+        os.makedirs(directorio, exist_ok=True)
+
+@st.cache_resource
+def limpiar_exportaciones_huerfanas():
+    # Una vez por proceso: las exportaciones no se retoman del journal, así que
+    # los CSV viejos ya no son de ninguna sesión. El directorio es compartido:
+    # los recientes pueden ser de otra pestaña u otro proceso que sigue escribiendo
+    return limpiar_exportaciones()
+
+@st.cache_resource
+def iniciar_servidor_metricas():
+    # Endpoint local /metrics (Prometheus) y /metrics.json, uno por proceso
+    puerto = int(os.environ.get("TTT_METRICAS_PUERTO", PUERTO_METRICAS))
+    try:
+        return iniciar_servidor(puerto)
+    except OSError as e:
+        logging.warning(f"No se pudo iniciar el servidor de métricas en el puerto {puerto}: {e}")
+        return None
 
 # ==============================
 # CONFIGURACIÓN INICIAL
@@ -24,23 +65,62 @@ with open(THRESHOLDS_PATH, "r") as f:
 st.set_page_config(page_title="Monitor de desplazamiento", layout="wide")
 st.title("Monitor de desplazamiento")
 
+UMBRALES = obtener_umbrales()
+UMBRALES.recargar_si_cambio()
+iniciar_servidor_metricas()
+RELOJ.marcar("umbrales y métricas")
+
 # ==== VARIABLES DE SESIÓN ====
+COLUMNAS_DATOS = {"timestamp": "int64", "dx_mm": "float64", "dy_mm": "float64", "x_mm": "float64", "y_mm": "float64", "desp_total": "float64"}
+COLUMNAS_RESULTADOS = {"id_conexion": "int64", "diametro": object, "grado_acero": object, "umbral_min": "float64", "umbral_max": "float64", "desplazamiento": "float64", "comentario": object, "sensor": object}
+
 defaults = {
     "medicion_activa": False,
-    "datos": pd.DataFrame(columns=["timestamp", "dx_mm", "dy_mm", "x_mm", "y_mm", "desp_total"]),
+    "datos": AlmacenColumnar(COLUMNAS_DATOS),
     "factor": 6.46,
+    "calibracion": None,          # Perfil vigente del sensor (calibracion.py); sin perfil, `factor`
+    "usar_calibracion": True,
     "x_acum": 0.0,
     "y_acum": 0.0,
     "sensor_value": 0.0,
     "sensor_inicializado": False,
     "sensor": None,
+    "adquisidor": None,
+    "fuente_sensor": FUSIONADO,
+    "cursor_buffer": 0,
+    "muestras_perdidas": 0,
+    "resumen_grafico": ResumenMinMax(),
+    "trabajo_pdf": None,
     "ultima_lectura": (0.0, 0.0, 0.0, 0.0, 0.0),
     "pozo_df": None,
+    "nombre_pozo": "",
+    "numero_parte": "",
+    "pozo_file_id": None,
+    "version_umbrales": 0,
+    "umbrales_faltantes": [],
     "total_conexiones": 0,
     "conexiones_realizadas": 0,
     "flag_terminado":False,
-    "resultados":pd.DataFrame(columns=["id_conexion", "diametro", "grado_acero", "umbral_min", "umbral_max", "desplazamiento", "comentario"])
+    "resultados": AlmacenColumnar(COLUMNAS_RESULTADOS, capacidad=256),
+    "estadisticas": EstadisticasPozo(),
+    "journal": None,
+    "journal_revisado": False,
+    "journal_ajeno": None,        # Pozo en curso que escribe otra pestaña (esta sesión no lo retoma)
+    "inicio_conexion": 0,
+    "archivo_crudo": None,
+    "archivos_crudos": [],
+    "exportacion_crudo": None,
+    "muestras_csv": 0,
+    "exportacion_resultados": None,
+    "segmentador": SegmentadorConexiones(),
+    "modo_segmentacion": "proponer",
+    "propuesta_cierre": None,
+    "filtro": FiltroDeltas(),
 }
+# Escalares de sesión que se guardan en el journal para poder retomar el pozo
+ESTADO_JOURNAL = ("factor", "x_acum", "y_acum", "sensor_value", "conexiones_realizadas", "total_conexiones",
+                  "flag_terminado", "fuente_sensor", "inicio_conexion", "archivos_crudos", "nombre_pozo", "numero_parte",
+                  "usar_calibracion")
 for k, v in defaults.items():
     if k not in st.session_state:
         st.session_state[k] = v
@@ -48,56 +128,203 @@ for k, v in defaults.items():
 # ==== CONFIGURACIÓN DE DIRECTORIOS ====
 HIST_DIR = "data/histogramas"
 PDF_DIR = "data/pdf"
-os.makedirs(HIST_DIR, exist_ok=True)
-os.makedirs(PDF_DIR, exist_ok=True)
+CRUDO_DIR = "data/crudo"
+preparar_directorios(HIST_DIR, PDF_DIR, CRUDO_DIR, EXPORTACION_DIR)
+limpiar_exportaciones_huerfanas()
+RELOJ.marcar("sesión y directorios")
+
+# ==== REFRESCO DE LA UI ====
+# Solo el gráfico y las lecturas se refrescan solos (fragmentos); el resto de
+# la página se reconstruye únicamente ante una interacción o un cambio de estado
+INTERVALO_REFRESCO_S = 0.05   # 20 Hz, independiente de la frecuencia de muestreo
+INTERVALO_INFORME_S = 0.5     # Sondeo del estado del informe en segundo plano
 
 
 # ==============================
 # FUNCIONES
 # ==============================
+@st.cache_resource
+def obtener_gestor():
+    # Un hilo de adquisición por sensor y por proceso, compartidos entre reruns y sesiones.
+    # TTT_SENSORES="0:0,0:1" abre varios sensores (ver multisensor.py);
+    # TTT_SENSOR=replay|sintetico permite correr la app sin hardware (ver backends.py);
+    # con TTT_SERVIDOR los sensores los maneja servidor.py y la app solo se suscribe
+    with RELOJ.medir("inicializar sensor"):
+        gestor = GestorRemoto(os.environ["TTT_SERVIDOR"]) if os.environ.get("TTT_SERVIDOR") else gestor_desde_entorno()
+        gestor.iniciar(timeout=10)
+    return gestor
+
+
+@st.cache_resource
+def obtener_calibraciones():
+    # Perfiles de calibración por sensor (calibracion.json), uno por proceso
+    return AlmacenCalibraciones()
+
+
+@st.cache_resource
+def journals_abiertos():
+    # path -> Journal abierto en este proceso; el flock de journal.py impide un
+    # segundo escritor y esto permite que otra pestaña tome el control del pozo
+    return {}
+
+
+def abrir_journal(path = None):
+    # Sesión nueva o la de `path`; JournalOcupado si otra la tiene abierta
+    journal = Journal.nueva(COLUMNAS_DATOS) if path is None else Journal(path, COLUMNAS_DATOS)
+    journals_abiertos()[journal.path] = journal
+    return journal
+
+
+@st.cache_resource
+def obtener_historico():
+    # Base de conexiones de todos los pozos (ver historico.py), una por proceso
+    return HistoricoConexiones()
+
+
+@st.cache_data(ttl=60)
+def combinaciones_historico(escritas):
+    # Recorre todo el índice: se recalcula cuando este proceso escribió
+    # conexiones nuevas o, por las de otros procesos, una vez por minuto
+    return obtener_historico().combinaciones()
+
+
+@st.cache_resource
+def obtener_cola_reportes():
+    # Worker de reportes compartido: el PDF se genera en otro proceso sin frenar la UI ni la adquisición
+    return ColaReportes()
+
+
+def seleccionar_fuente(nombre):
+    # Cambia el flujo que consume la UI (un sensor o la fusión); arranca desde la última muestra
+    adquisidor = obtener_gestor().fuente(nombre)
+    st.session_state.fuente_sensor = nombre
+    # La fusión no tiene perfil propio: si todos los sensores tienen uno, ya publica
+    # cuentas calibradas de escala fija (FusionSensores.perfil); si no, cuentas crudas
+    st.session_state.calibracion = obtener_calibraciones().vigente(nombre) or getattr(adquisidor, "perfil", None)
+    st.session_state.adquisidor = adquisidor
+    st.session_state.sensor = adquisidor.sensor
+    st.session_state.cursor_buffer = adquisidor.buffer.ultimo_indice()
+    st.session_state.filtro.reiniciar()
+    cerrar_crudo()  # El archivo crudo lleva el id del sensor en la cabecera
+    guardar_estado()
+
+
 def inicializar_sensor():
     try:
-        sensor = SpiSensor()
-        sensor.initialize(timeout=10)
-        st.session_state.sensor = sensor
+        gestor = obtener_gestor()
+        fuente = st.session_state.fuente_sensor
+        seleccionar_fuente(fuente if fuente in gestor.fuentes() else gestor.fuentes()[0])
         st.session_state.sensor_inicializado = True
-        _,_ = sensor.read_sensor()
     except Exception as e:
         st.error(f"Error al inicializar el sensor: {e}")
         st.session_state.sensor_inicializado = False
 
 
 def leer_sensor():
+    # Solo consume las muestras que el hilo de adquisición dejó en el buffer
+    if st.session_state.journal is not None and not st.session_state.journal.abierto:
+        # Otra pestaña tomó el control del pozo: la corrida completa reinicia esta sesión
+        st.session_state.medicion_activa = False
+        st.rerun()
     try:
-        sensor = st.session_state.sensor
-        if sensor is None:
+        adquisidor = st.session_state.adquisidor
+        if adquisidor is None:
             return
+        if not adquisidor.is_alive():
+            raise RuntimeError(f"El hilo de adquisición se detuvo ({adquisidor.ultimo_error})")
 
-        dx_raw, dy_raw = sensor.read_sensor(timeout=0.2)
-        factor = st.session_state.factor
-
-        dx_mm = dx_raw * factor / 1000.0 if dx_raw else 0.0
-        dy_mm = dy_raw * factor / 1000.0 if dy_raw else 0.0
+        t_ns, dx_raw, dy_raw, movimiento, cursor, perdidas = adquisidor.buffer.leer_desde(st.session_state.cursor_buffer)
+        st.session_state.cursor_buffer = cursor
+        st.session_state.muestras_perdidas += perdidas
+        if perdidas:
+            ADQ_PERDIDAS.inc(perdidas)
+        if len(t_ns) == 0:
+            return
 
-        st.session_state.x_acum += dx_mm
-        st.session_state.y_acum += dy_mm
+        # Outliers y suavizado sobre las cuentas crudas, antes de acumular; el .ttt guarda las crudas
+        dx_f, dy_f = st.session_state.filtro.procesar(t_ns, dx_raw, dy_raw, movimiento)
+        perfil = perfil_calibracion()
+        if perfil is not None:
+            # Escala, acople entre ejes y offset del sensor; el offset va solo en las muestras con cuentas
+            dx_mm, dy_mm = perfil.aplicar(dx_f, dy_f, movimiento=(dx_raw != 0) | (dy_raw != 0))
+        else:
+            factor = st.session_state.factor
+            dx_mm = dx_f * factor / 1000.0
+            dy_mm = dy_f * factor / 1000.0
 
-        desp_total = round((st.session_state.x_acum**2 + st.session_state.y_acum**2) ** 0.5, 3)
-        st.session_state.sensor_value = desp_total
-        st.session_state.ultima_lectura = (dx_mm, dy_mm, st.session_state.x_acum, st.session_state.y_acum, desp_total)
+        x_mm = st.session_state.x_acum + np.cumsum(dx_mm)
+        y_mm = st.session_state.y_acum + np.cumsum(dy_mm)
+        desp_total = np.round(np.hypot(x_mm, y_mm), 3)
 
-        ts = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-        row = pd.DataFrame([[ts, dx_mm, dy_mm, st.session_state.x_acum, st.session_state.y_acum, desp_total]],
-                           columns=["timestamp", "dx_mm", "dy_mm", "x_mm", "y_mm", "desp_total"])
-        if len(st.session_state.datos)>0:
-            st.session_state.datos = pd.concat([st.session_state.datos, row], ignore_index=True)
-        else:
-            st.session_state.datos = row
+        # El bloque se guarda por tramos: si la segmentación automática cierra la
+        # conexión en la muestra i, t_ns[:i + 1] queda en la conexión que cierra
+        # y el resto se guarda ya medido desde el punto de cierre (la nueva)
+        desde = 0
+        while desde < len(t_ns):
+            cierre = segmentar(t_ns[desde:], desp_total[desde:])
+            hasta = len(t_ns) if cierre is None else desde + cierre.indice + 1
+            tramo = slice(desde, hasta)
+            guardar_muestras(t_ns[tramo], dx_raw[tramo], dy_raw[tramo], dx_mm[tramo], dy_mm[tramo], x_mm[tramo], y_mm[tramo], desp_total[tramo])
+            if cierre is not None:
+                cerrar_conexion(desplazamiento=cierre.desplazamiento)
+                x_mm[hasta:] -= x_mm[hasta - 1]
+                y_mm[hasta:] -= y_mm[hasta - 1]
+                desp_total[hasta:] = np.round(np.hypot(x_mm[hasta:], y_mm[hasta:]), 3)
+            desde = hasta
+        st.session_state.archivo_crudo.flush()  # Visible para lecturas por memmap (preparar CSV, análisis)
 
     except Exception as e:
         st.error(f"Error durante la lectura: {e}")
         st.session_state.medicion_activa = False
 
+def guardar_muestras(t_ns, dx_raw, dy_raw, dx_mm, dy_mm, x_mm, y_mm, desp_total):
+    # Un tramo de la conexión en curso: acumuladores, datos, .ttt, journal y resumen del gráfico
+    st.session_state.x_acum = float(x_mm[-1])
+    st.session_state.y_acum = float(y_mm[-1])
+    st.session_state.sensor_value = float(desp_total[-1])
+    st.session_state.ultima_lectura = (float(dx_mm[-1]), float(dy_mm[-1]), st.session_state.x_acum, st.session_state.y_acum, st.session_state.sensor_value)
+
+    st.session_state.datos.extender(timestamp=t_ns, dx_mm=dx_mm, dy_mm=dy_mm, x_mm=x_mm, y_mm=y_mm, desp_total=desp_total)
+    escritor_crudo().agregar(t_ns, dx_raw, dy_raw, x_mm, y_mm)
+    if st.session_state.journal is not None:
+        st.session_state.journal.agregar_muestras(timestamp=t_ns, dx_mm=dx_mm, dy_mm=dy_mm, x_mm=x_mm, y_mm=y_mm, desp_total=desp_total)
+    st.session_state.resumen_grafico.agregar_bloque(t_ns, desp_total)
+
+def perfil_calibracion():
+    return st.session_state.calibracion if st.session_state.usar_calibracion else None
+
+def escritor_crudo():
+    # Archivo .ttt de la sesión; se abre una parte nueva al cambiar el factor, la calibración o la fuente.
+    # Con perfil, la cabecera lleva las escalas por eje (el .ttt no guarda acople ni offset;
+    # x/y ya van calibrados)
+    perfil = perfil_calibracion()
+    factores = (perfil.escala_x, perfil.escala_y) if perfil is not None else (st.session_state.factor, st.session_state.factor)
+    escritor = st.session_state.archivo_crudo
+    if escritor is None or (escritor.factor_x, escritor.factor_y) != factores:
+        cerrar_crudo()
+        nombre = f"crudo_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{st.session_state.fuente_sensor}{EXTENSION_CRUDO}"
+        escritor = EscritorCrudo(os.path.join(CRUDO_DIR, nombre), *factores, sensor_id=st.session_state.fuente_sensor)
+        st.session_state.archivo_crudo = escritor
+        st.session_state.archivos_crudos = st.session_state.archivos_crudos + [escritor.path]
+        guardar_estado()
+    return escritor
+
+def cerrar_crudo():
+    if st.session_state.archivo_crudo is not None:
+        st.session_state.archivo_crudo.cerrar()
+        st.session_state.archivo_crudo = None
+
+def asignar_umbrales(df_expandido):
+    # Umbrales de todas las conexiones del pozo en un solo join
+    df_expandido, faltantes = UMBRALES.asignar(df_expandido)
+    st.session_state.df_expandido = df_expandido
+    st.session_state.umbrales_faltantes = faltantes
+    st.session_state.version_umbrales = UMBRALES.version
+    if st.session_state.journal is not None:
+        # Se guardan los umbrales vigentes: al recuperar se retoma con los mismos
+        st.session_state.journal.registrar("pozo", pozo_df=st.session_state.pozo_df.to_dict(orient="list"),
+                                           df_expandido=df_expandido.to_dict(orient="list"))
+
 def actualizar_umbral_actual():
     idx = st.session_state.conexiones_realizadas
     if "df_expandido" not in st.session_state or st.session_state.df_expandido.empty:
@@ -108,63 +335,282 @@ def actualizar_umbral_actual():
         return
     
     fila = st.session_state.df_expandido.iloc[idx]
-    grado = str(fila["Grado de acero"]).strip()
-    diametro = str(fila["Diametro"]).strip()
-
-    try:
-        umbrales = THRESHOLDS[grado][diametro]
-        st.session_state.umbral_min = umbrales["min"]
-        st.session_state.umbral_max = umbrales["max"]
-    except KeyError:
+    if pd.isna(fila["umbral_min"]):
         st.session_state.umbral_min = None
         st.session_state.umbral_max = None
-        st.warning(f"No hay umbrales definidos para {grado} - {diametro}")
-
-def registrar_resultado(id_conexion, diametro, grado_acero, umbral_min, umbral_max, desplazamiento, comentario):
-    row = {
-        "id_conexion": id_conexion+1,
-        "diametro": diametro,
-        "grado_acero": grado_acero,
-        "umbral_min": umbral_min,
-        "umbral_max": umbral_max,
-        "desplazamiento": desplazamiento,
-        "comentario": comentario
+        st.warning(f"No hay umbrales definidos para {fila['grado_acero']} - {fila['diametro']}")
+    else:
+        st.session_state.umbral_min = float(fila["umbral_min"])
+        st.session_state.umbral_max = float(fila["umbral_max"])
+
+def exportacion_resultados():
+    # CSV de conexiones al día con `resultados` (ver exportacion.py): solo se
+    # agregan las filas nuevas; tras recuperar una sesión se completa la primera vez
+    exportacion = st.session_state.exportacion_resultados
+    if exportacion is None or not exportacion.existe():
+        if exportacion is not None:
+            exportacion.cerrar()     # Borrado por limpiar_exportaciones: se rehace
+        # Sesiones abandonadas (pestañas cerradas) no avisan: sus CSV se borran por antigüedad
+        limpiar_exportaciones()
+        st.session_state.exportacion_resultados = ExportacionResultados(nombre_exportacion("conexiones"), COLUMNAS_RESULTADOS)
+    return st.session_state.exportacion_resultados.sincronizar(st.session_state.resultados)
+
+def registrar_resultado(id_conexion, diametro, grado_acero, umbral_min, umbral_max, desplazamiento, comentario, sensor=None):
+    fila = dict(
+        id_conexion=id_conexion+1,
+        diametro=diametro,
+        grado_acero=grado_acero,
+        umbral_min=np.nan if umbral_min is None else umbral_min,
+        umbral_max=np.nan if umbral_max is None else umbral_max,
+        desplazamiento=desplazamiento,
+        comentario=comentario,
+        sensor=sensor or st.session_state.fuente_sensor,
+    )
+    st.session_state.resultados.agregar(**fila)
+    exportacion_resultados()
+    # Distribución, tasas y carta de control del grupo: O(1) por conexión
+    alarma = st.session_state.estadisticas.agregar(diametro, grado_acero, desplazamiento, comentario, fila["umbral_min"], fila["umbral_max"])
+    if alarma is not None:
+        logging.warning(f"Carta de control {grado_acero} {diametro}, conexión {fila['id_conexion']}: {alarma}")
+    if st.session_state.journal is not None:
+        st.session_state.journal.registrar("resultado", **fila)
+    # Histórico de flota: solo se encola, lo inserta por lotes el hilo de historico.py.
+    # Lo registra solo el dueño del journal, así dos pestañas no duplican conexiones
+    if st.session_state.journal is not None:
+        sesion = os.path.basename(st.session_state.journal.path)
+        obtener_historico().registrar(pozo=st.session_state.nombre_pozo, numero_parte=st.session_state.numero_parte, sesion=sesion, **fila)
+    publicar = getattr(st.session_state.adquisidor, "publicar_resultado", None)
+    if publicar is not None:
+        try:
+            publicar(**fila)   # Los demás suscriptores del servidor ven la conexión cerrada
+        except OSError as e:
+            logging.warning(f"No se pudo publicar el resultado en el servidor de adquisición: {e}")
+
+def cerrar_conexion(desplazamiento=None, reassembly=False):
+    # Cierra la conexión en curso (botones o segmentación automática) después de
+    # la última muestra guardada; la siguiente arranca desde cero
+    idx = st.session_state.conexiones_realizadas
+    fila = st.session_state.df_expandido.iloc[idx]
+
+    umbral_min = st.session_state.umbral_min
+    umbral_max = st.session_state.umbral_max
+    if desplazamiento is None:
+        desplazamiento = st.session_state.sensor_value
+    if reassembly:
+        comentario = "NO OK - reassembly"
+    else:
+        comentario = UMBRALES.clasificar(desplazamiento, np.nan if umbral_min is None else umbral_min, np.nan if umbral_max is None else umbral_max)
+    registrar_resultado(idx, fila["diametro"], fila["grado_acero"], umbral_min, umbral_max, desplazamiento, comentario)
+
+    st.session_state.x_acum = st.session_state.y_acum = 0.0
+    st.session_state.sensor_value = 0.0
+    st.session_state.inicio_conexion = len(st.session_state.datos)
+    st.session_state.resumen_grafico.reiniciar()
+    st.session_state.segmentador.reiniciar()
+    st.session_state.propuesta_cierre = None
+
+    if reassembly:
+        if st.session_state.conexiones_realizadas==st.session_state.total_conexiones:
+            st.session_state.flag_terminado=False
+            st.session_state.medicion_activa = True
+    else:
+        st.session_state.conexiones_realizadas += 1
+        if st.session_state.conexiones_realizadas==st.session_state.total_conexiones:
+            st.session_state.flag_terminado=True
+            st.session_state.medicion_activa = False
+        actualizar_umbral_actual()
+    guardar_estado()
+
+def segmentar(t_ns, desp_total):
+    # Alimenta el segmentador con un tramo todavía sin guardar. En modo
+    # "proponer" ofrece el cierre; en "automatico", cuando la meseta del hombro
+    # se sostuvo t_cierre_s, devuelve el evento CERRADA: la conexión cierra en
+    # esa muestra (`indice`, dentro del tramo) y leer_sensor guarda lo que sigue
+    # medido desde ahí, ya en la conexión nueva, y lo vuelve a segmentar
+    if (st.session_state.modo_segmentacion == "manual" or st.session_state.flag_terminado
+            or "df_expandido" not in st.session_state
+            or st.session_state.conexiones_realizadas >= st.session_state.total_conexiones):
+        return None
+    for evento in st.session_state.segmentador.procesar_bloque(t_ns, desp_total):
+        if evento.tipo != CERRADA:
+            continue
+        if st.session_state.modo_segmentacion == "automatico":
+            return evento
+        st.session_state.propuesta_cierre = evento
+    return None
+
+def guardar_estado():
+    if st.session_state.journal is not None:
+        st.session_state.journal.registrar("estado", **{k: st.session_state[k] for k in ESTADO_JOURNAL})
+
+def estado_journal():
+    # Estado completo para el checkpoint (mismo formato que devuelve journal.recuperar)
+    pozo = None
+    if st.session_state.pozo_df is not None and "df_expandido" in st.session_state:
+        pozo = {"pozo_df": st.session_state.pozo_df.to_dict(orient="list"),
+                "df_expandido": st.session_state.df_expandido.to_dict(orient="list")}
+    return {
+        "valores": {k: st.session_state[k] for k in ESTADO_JOURNAL},
+        "resultados": st.session_state.resultados.a_dataframe().to_dict(orient="records"),
+        "pozo": pozo,
     }
-    if len(row)>0:
-        if len(st.session_state.resultados)>0:
-            st.session_state.resultados = pd.concat(
-                [st.session_state.resultados, pd.DataFrame([row])],
-                ignore_index=True,
-            )
-        else:
-            st.session_state.resultados = pd.DataFrame([row])
+
+def recuperar_sesion(path):
+    # Reconstruye la sesión desde el journal: muestras, resultados, pozo con
+    # sus umbrales y la conexión en curso; el sensor se vuelve a inicializar a mano.
+    # Primero toma el journal: si otra pestaña lo tiene, JournalOcupado sin tocar nada
+    journal = abrir_journal(path)
+    try:
+        restaurar_sesion(path)
+    except Exception:
+        journal.cerrar()
+        raise
+    st.session_state.journal = journal
+    st.session_state.journal_ajeno = None
+    st.toast(f"Sesión recuperada: {st.session_state.conexiones_realizadas}/{st.session_state.total_conexiones} conexiones, {len(st.session_state.datos)} muestras")
+
+def restaurar_sesion(path):
+    estado, muestras = recuperar(path, COLUMNAS_DATOS)
+    if len(muestras):
+        st.session_state.datos.extender(**{c: muestras[c] for c in COLUMNAS_DATOS})
+    for fila in estado["resultados"]:
+        st.session_state.resultados.agregar(**{c: fila.get(c) for c in COLUMNAS_RESULTADOS})
+    st.session_state.estadisticas = EstadisticasPozo.desde_resultados(st.session_state.resultados.a_dataframe())
+    if estado["pozo"] is not None:
+        st.session_state.pozo_df = pd.DataFrame(estado["pozo"]["pozo_df"])
+        df_expandido = pd.DataFrame(estado["pozo"]["df_expandido"])
+        st.session_state.df_expandido = df_expandido
+        sin_umbral = df_expandido["umbral_min"].isna()
+        st.session_state.umbrales_faltantes = list(df_expandido.loc[sin_umbral, ["grado_acero", "diametro"]].drop_duplicates().itertuples(index=False, name=None))
+        st.session_state.version_umbrales = UMBRALES.version
+    for k, v in estado["valores"].items():
+        st.session_state[k] = v
+
+    if len(muestras) > st.session_state.inicio_conexion:
+        # Los acumuladores de la conexión en curso son los de la última muestra
+        ultima = muestras[-1]
+        st.session_state.x_acum = float(ultima["x_mm"])
+        st.session_state.y_acum = float(ultima["y_mm"])
+        st.session_state.sensor_value = float(ultima["desp_total"])
+        st.session_state.ultima_lectura = (float(ultima["dx_mm"]), float(ultima["dy_mm"]), st.session_state.x_acum, st.session_state.y_acum, st.session_state.sensor_value)
+        conexion = muestras[st.session_state.inicio_conexion:]
+        st.session_state.resumen_grafico.agregar_bloque(conexion["timestamp"], conexion["desp_total"])
+    actualizar_umbral_actual()
+
+def reiniciar_sesion():
+    # Vuelve esta sesión del navegador a cero (con el journal ya cerrado); lo
+    # usan "Nueva sesión" y la sesión a la que otra pestaña le tomó el pozo
+    if st.session_state.journal is not None and journals_abiertos().get(st.session_state.journal.path) is st.session_state.journal:
+        del journals_abiertos()[st.session_state.journal.path]
+    cerrar_crudo()
+    for k in ("exportacion_crudo", "exportacion_resultados"):
+        if st.session_state[k] is not None:
+            st.session_state[k].eliminar()
+    for k, v in defaults.items():
+        if k not in ("adquisidor", "sensor", "sensor_inicializado", "fuente_sensor", "cursor_buffer", "journal_revisado"):
+            st.session_state[k] = v
+    for k in ("df_expandido", "umbral_min", "umbral_max"):
+        st.session_state.pop(k, None)
 
 # ==============================
 # INTERFAZ DE USUARIO
 # ==============================
+# ==== RECUPERACIÓN DE SESIÓN ====
+# Una sola vez por sesión del navegador: si quedó un pozo sin cerrar, se retoma.
+# Si lo tiene abierto otra pestaña, esta queda sin pozo y puede tomar el control
+if st.session_state.journal is not None and not st.session_state.journal.abierto:
+    path_journal = st.session_state.journal.path
+    reiniciar_sesion()
+    st.session_state.journal_ajeno = path_journal
+if not st.session_state.journal_revisado:
+    st.session_state.journal_revisado = True
+    path_journal = sesion_activa()
+    if path_journal is not None:
+        try:
+            recuperar_sesion(path_journal)
+        except JournalOcupado:
+            st.session_state.journal_ajeno = path_journal
+        except Exception as e:
+            st.error(f"No se pudo recuperar la sesión anterior ({path_journal}): {e}")
+
 col_controles, col_grafico, col_metricas = st.columns([1, 3, 1])
 
 # ---- Columna 1: Controles, calibración y descarga ----
 with col_controles:
     st.subheader("Diseño de pozo")
 
+    # Identifican las conexiones en el histórico y precargan la cabecera del informe
+    subcol1, subcol2 = st.columns(2)
+    with subcol1:
+        nombre_pozo = st.text_input("Pozo", value=st.session_state.nombre_pozo)
+    with subcol2:
+        numero_parte = st.text_input("Número de parte", value=st.session_state.numero_parte)
+    if (nombre_pozo, numero_parte) != (st.session_state.nombre_pozo, st.session_state.numero_parte):
+        st.session_state.nombre_pozo, st.session_state.numero_parte = nombre_pozo, numero_parte
+        guardar_estado()
+
     # === Subir archivo CSV ===
     uploaded_file = st.file_uploader("Subir diseño de pozo (.csv)", type=["csv"])
 
     if uploaded_file is not None:
-        pozo_df = pd.read_csv(uploaded_file)
-        if not {"Cantidad", "Diametro", "Grado de acero"}.issubset(pozo_df.columns):
-            st.error("El archivo CSV debe contener las columnas: Cantidad, Diámetro, Grado de acero.")
-        else:
-            st.session_state.pozo_df = pozo_df
-            df_expandido = pozo_df.loc[pozo_df.index.repeat(pozo_df["Cantidad"])].reset_index(drop=True)
-            st.session_state.df_expandido = df_expandido
-            st.session_state.total_conexiones = pozo_df["Cantidad"].sum()
+        # El diseño se procesa una vez por archivo subido, no en cada rerun
+        if st.session_state.pozo_file_id != uploaded_file.file_id:
+            pozo_df = pd.read_csv(uploaded_file)
+            if not {"Cantidad", "Diametro", "Grado de acero"}.issubset(pozo_df.columns):
+                st.error("El archivo CSV debe contener las columnas: Cantidad, Diámetro, Grado de acero.")
+            else:
+                st.session_state.pozo_df = pozo_df
+                if st.session_state.journal is None:
+                    st.session_state.journal = abrir_journal()
+                    st.session_state.journal_ajeno = None
+                df_expandido = pozo_df.loc[pozo_df.index.repeat(pozo_df["Cantidad"])].reset_index(drop=True)
+                asignar_umbrales(df_expandido)
+                st.session_state.total_conexiones = pozo_df["Cantidad"].sum()
+                st.session_state.pozo_file_id = uploaded_file.file_id
+                actualizar_umbral_actual()
+                guardar_estado()
+        if st.session_state.pozo_file_id == uploaded_file.file_id:
             st.success(f"Diseño cargado correctamente, ({st.session_state.total_conexiones} conexiones por realizar).")
-            actualizar_umbral_actual()
-    else:
+    elif st.session_state.journal is None:
         st.info("Esperando archivo de diseño de pozo...")
 
+    if st.session_state.journal is None and st.session_state.journal_ajeno is not None:
+        path_journal = st.session_state.journal_ajeno
+        st.warning(f"El pozo {os.path.basename(path_journal)} está abierto en otra pestaña: esta sesión no lo retoma ni registra sus conexiones.")
+        if st.button("Tomar el control", use_container_width=True,
+                     help="Cierra el pozo en la otra pestaña y lo continúa en esta"):
+            if sesion_activa() != path_journal:
+                st.session_state.journal_ajeno = None    # Ya se cerró: no hay nada que retomar
+                st.rerun()
+            dueno = journals_abiertos().get(path_journal)
+            if dueno is not None:
+                dueno.cerrar()   # La otra pestaña lo nota en su próxima corrida y se reinicia
+            try:
+                recuperar_sesion(path_journal)
+            except JournalOcupado:
+                st.error("Lo tiene abierto otro proceso de la app: hay que cerrarlo allí.")
+            except Exception as e:
+                st.error(f"No se pudo recuperar la sesión ({path_journal}): {e}")
+            else:
+                st.rerun()
+
+    if st.session_state.journal is not None:
+        st.caption(f"Sesión: {os.path.basename(st.session_state.journal.path)}")
+        if st.button("🆕 Nueva sesión", use_container_width=True, disabled=st.session_state.medicion_activa,
+                     help="Cierra el pozo actual: deja de retomarse al reiniciar la app"):
+            st.session_state.journal.cerrar(finalizar=True)
+            reiniciar_sesion()
+            st.rerun()
+
+    if "df_expandido" in st.session_state:
+        # Si thresholds.json cambió en disco, se recalculan los umbrales del pozo
+        if st.session_state.version_umbrales != UMBRALES.version:
+            asignar_umbrales(st.session_state.df_expandido)
+            actualizar_umbral_actual()
+        if st.session_state.umbrales_faltantes:
+            faltantes = ", ".join(f"{g} - {d}" for g, d in st.session_state.umbrales_faltantes)
+            st.warning(f"Sin umbrales definidos para: {faltantes}")
+
     # Deshabilitar botones si no hay CSV cargado
     botones_habilitados = st.session_state.pozo_df is not None
 
@@ -173,6 +619,15 @@ with col_controles:
 
     if st.button("🔌 Inicializar sensor", use_container_width=True, disabled=not botones_habilitados):
         inicializar_sensor()
+    RELOJ.marcar("controles")
+    RELOJ.listo()   # El operador ya puede inicializar el sensor
+
+    if st.session_state.sensor_inicializado and len(obtener_gestor().fuentes()) > 1:
+        fuentes = obtener_gestor().fuentes()
+        fuente = st.selectbox("Fuente de desplazamiento", fuentes, index=fuentes.index(st.session_state.fuente_sensor),
+                              help="Promedio alineado de todos los sensores o un sensor individual")
+        if fuente != st.session_state.fuente_sensor:
+            seleccionar_fuente(fuente)
 
     subcol1, subcol2 = st.columns(2)
     with subcol1:
@@ -185,34 +640,89 @@ with col_controles:
         if st.button("⏸ Pausa", use_container_width=True, disabled=not botones_habilitados or not st.session_state.sensor_inicializado or not st.session_state.medicion_activa):
             st.session_state.medicion_activa = False
 
+    with st.expander("Segmentación automática"):
+        modos = {"manual": "Manual (botones)", "proponer": "Proponer cierre", "automatico": "Cierre automático"}
+        modo = st.radio("Modo", list(modos), format_func=modos.get, index=list(modos).index(st.session_state.modo_segmentacion))
+        segmentador = st.session_state.segmentador
+        sensibilidad = st.slider("Sensibilidad", 0.25, 4.0, float(segmentador.sensibilidad), 0.25,
+                                 help="Mayor sensibilidad detecta enrosques más lentos (y también más ruido)")
+        t_cierre = st.slider("Espera en el hombro antes de cerrar [s]", 0.5, 10.0, float(segmentador.t_cierre_s), 0.5)
+        if modo != st.session_state.modo_segmentacion:
+            st.session_state.modo_segmentacion = modo
+            st.session_state.propuesta_cierre = None
+        if (sensibilidad, t_cierre) != (segmentador.sensibilidad, segmentador.t_cierre_s):
+            segmentador.configurar(sensibilidad=sensibilidad, t_cierre_s=t_cierre)
+
+    with st.expander("Filtrado del sensor"):
+        filtro = st.session_state.filtro
+        hampel = st.checkbox("Descartar lecturas espurias (Hampel)", value=filtro.hampel is not None)
+        tau = st.slider("Suavizado [s]", 0.0, 1.0, float(filtro.suavizador.tau_s if filtro.suavizador else TAU_SUAVIZADO_S), 0.05,
+                        help="Constante de tiempo del suavizado exponencial; 0 lo desactiva")
+        if (hampel, tau) != (filtro.hampel is not None, filtro.suavizador.tau_s if filtro.suavizador else 0.0):
+            st.session_state.filtro = FiltroDeltas(hampel=hampel, tau_s=tau)
+
     st.divider()
 
     st.subheader("Calibración")
+    perfil = st.session_state.calibracion
+    if perfil is not None:
+        etiqueta = ("Usar los perfiles de calibración de cada sensor" if perfil.sensor == FUSIONADO
+                    else f"Usar perfil de calibración v{perfil.version} ({perfil.fecha})")
+        usar = st.checkbox(etiqueta, value=st.session_state.usar_calibracion, disabled=st.session_state.medicion_activa)
+        if usar != st.session_state.usar_calibracion:
+            st.session_state.usar_calibracion = usar
+            guardar_estado()
+        st.caption(perfil.descripcion())
+    elif (st.session_state.sensor_inicializado and st.session_state.fuente_sensor == FUSIONADO
+          and len(obtener_gestor().fuentes()) > 1):
+        st.warning("Fusión sin calibrar: no todos los sensores tienen perfil, se promedian cuentas crudas con el factor único.")
     factor_input = st.number_input(
         "Factor de calibración (mm por unidad)",
         min_value=0.001, max_value=100.0,
         value=st.session_state.factor,
         step=0.001,
-        disabled=not botones_habilitados
+        disabled=not botones_habilitados or perfil_calibracion() is not None
     )
-    st.session_state.factor = factor_input
+    if factor_input != st.session_state.factor:
+        st.session_state.factor = factor_input
+        guardar_estado()
 
 
 # ---- Columna 2: Gráficos ----
-with col_grafico:
-    st.subheader("Gráfico de desplazamiento de conexiones")
-    if st.session_state.datos.empty:
-        df_plot = pd.DataFrame({"timestamp": [0], "desp_total": [0.0]})
+def estado_pagina():
+    # Lo que la región en vivo puede cambiar y se muestra fuera de ella (botones, propuesta de cierre)
+    return (st.session_state.medicion_activa, st.session_state.conexiones_realizadas,
+            st.session_state.flag_terminado, st.session_state.propuesta_cierre is not None)
+
+@st.fragment(run_every=INTERVALO_REFRESCO_S if st.session_state.medicion_activa else None)
+def panel_grafico():
+    # Región en vivo: consume el buffer y redibuja el gráfico sin re-ejecutar el script
+    inicio = time.perf_counter()
+    with RELOJ.medir("import altair"):
+        import altair as alt
+    if st.session_state.medicion_activa:
+        antes = estado_pagina()
+        leer_sensor()
+        # Checkpoint periódico: acota cuántos eventos hay que reproducir al recuperar
+        if st.session_state.journal is not None and st.session_state.journal.checkpoint_vencido():
+            st.session_state.journal.checkpoint(estado_journal())
+        if estado_pagina() != antes:
+            st.rerun()   # Cierre de conexión, propuesta o error: se reconstruye la página completa
+
+    # Resumen min/max de toda la conexión actual: tamaño fijo sin importar su duración
+    t_plot, desp_plot = st.session_state.resumen_grafico.puntos()
+    if len(t_plot) == 0:
+        df_plot = pd.DataFrame({"t_s": [0.0], "desp_total": [0.0]})
     else:
-        df_plot = st.session_state.datos[["timestamp", "desp_total"]].tail(100)
+        df_plot = pd.DataFrame({"t_s": np.round(t_plot, 3), "desp_total": desp_plot})
 
     base_chart = (
         alt.Chart(df_plot)
         .mark_line()
         .encode(
-            x=alt.X("timestamp", title="Tiempo"),
-            y=alt.Y("desp_total", title="Desplazamiento [mm]"),
-            tooltip=["timestamp", "desp_total"]
+            x=alt.X("t_s:Q", title="Tiempo [s]"),
+            y=alt.Y("desp_total:Q", title="Desplazamiento [mm]"),
+            tooltip=["t_s", "desp_total"]
         )
     )
     if st.session_state.get("umbral_min") is not None:
@@ -223,49 +733,135 @@ with col_grafico:
         chart = base_chart.properties(width="container", height=400)
 
     st.altair_chart(chart, use_container_width=True)
+    UI_FRAGMENTO.observe(time.perf_counter() - inicio)
+
+def panel_informe(sondeando):
+    # Progreso del informe: mientras está en curso se sondea solo este bloque
+    cola_reportes = obtener_cola_reportes()
+    trabajo = cola_reportes.estado(st.session_state.trabajo_pdf)
+    if trabajo is None:
+        st.session_state.trabajo_pdf = None
+    elif sondeando and trabajo["estado"] in FINALES:
+        st.rerun()   # Terminó: una ejecución completa deja de sondear
+    elif trabajo["estado"] == TERMINADO:
+        pdf_bytes = contenido_archivo(trabajo["pdf_path"])   # Una lectura por informe, no por rerun
+        st.success(f"Informe generado correctamente ({trabajo['duracion_s']:.1f} s).")
+        st.download_button(
+            "Descargar informe PDF",
+            data=pdf_bytes,
+            file_name=os.path.basename(trabajo["pdf_path"]),
+            mime="application/pdf",
+            use_container_width=True,
+        )
+    elif trabajo["estado"] == ERROR:
+        st.error(f"Error al generar PDF: {trabajo['detalle']}")
+    elif trabajo["estado"] == CANCELADO:
+        st.warning("Generación del informe cancelada.")
+    else:
+        st.progress(trabajo["progreso"], text=f"Generando informe ({trabajo['etapa']})...")
+        if st.button("Cancelar informe", use_container_width=True):
+            cola_reportes.cancelar(st.session_state.trabajo_pdf)
+            st.rerun(scope="fragment")
+
+def panel_estadisticas():
+    # Distribución en vivo del pozo: sale del estado que registrar_resultado
+    # actualiza en cada conexión, sin recorrer los resultados
+    estadisticas = st.session_state.estadisticas
+    if not len(estadisticas):
+        st.info("Todavía no hay conexiones registradas.")
+        return
+    tabla = estadisticas.resumen().drop(columns=["ultima_alarma"])
+    for columna in ("tasa_ok", "tasa_no_ok", "tasa_reassembly"):
+        tabla[columna] *= 100
+    columnas_mm = {"media": "Media", "desvio": "Desvío", "minimo": "Mín.", "maximo": "Máx.", "p05": "P5",
+                   "p50": "P50", "p95": "P95", "lci": "LCI", "lcs": "LCS"}
+    st.dataframe(tabla, hide_index=True, use_container_width=True, column_config={
+        "diametro": "Diámetro", "grado_acero": "Grado", "cantidad": "Conexiones",
+        **{c: st.column_config.NumberColumn(etiqueta, format="%.3f") for c, etiqueta in columnas_mm.items()},
+        "tasa_ok": st.column_config.NumberColumn("% OK", format="%.0f"),
+        "tasa_no_ok": st.column_config.NumberColumn("% NO OK", format="%.0f"),
+        "tasa_reassembly": st.column_config.NumberColumn("% Reassembly", format="%.0f"),
+        "alarmas": "Alarmas SPC",
+    })
+
+    # Histograma del grupo en curso (o del último registrado al terminar el pozo)
+    if botones_habilitados and st.session_state.conexiones_realizadas < st.session_state.total_conexiones:
+        fila = st.session_state.df_expandido.iloc[st.session_state.conexiones_realizadas]
+        grupo = estadisticas.grupo(fila["diametro"], fila["grado_acero"])
+    else:
+        grupo = next(reversed(estadisticas.grupos.values()))
+    if grupo is None or grupo.n == 0:
+        return
+    cuentas, bordes = grupo.histograma(20)
+    import altair as alt
+    df_histo = pd.DataFrame({"desde": np.round(bordes[:-1], 3), "hasta": np.round(bordes[1:], 3), "conexiones": cuentas})
+    st.caption(f"Distribución {grupo.grado_acero} {grupo.diametro}")
+    st.altair_chart(
+        alt.Chart(df_histo).mark_bar().encode(
+            x=alt.X("desde:Q", title="Desplazamiento [mm]"), x2="hasta:Q",
+            y=alt.Y("conexiones:Q", title="Conexiones"), tooltip=["desde", "hasta", "conexiones"]),
+        use_container_width=True)
+
+@st.fragment
+def panel_historico():
+    # Distribución de un grado/diámetro en todos los pozos; cambiar el filtro
+    # re-ejecuta solo este bloque. Los agregados se calculan en SQLite
+    combinaciones = combinaciones_historico(obtener_historico().escritas)
+    if not combinaciones:
+        st.info("Todavía no hay conexiones en el histórico.")
+        return
+    subcol1, subcol2 = st.columns(2)
+    with subcol1:
+        grado, diametro = st.selectbox("Grado y diámetro", combinaciones, format_func=lambda c: f"{c[0]} {c[1]}")
+    with subcol2:
+        meses = st.slider("Últimos meses", 1, 24, 6)
+    filtro = dict(grado=grado, diametro=diametro, desde=time.time() - meses * DIAS_POR_MES * 86400)
+    historico = obtener_historico()
+    resumen = historico.resumen(**filtro)
+    if resumen.empty:
+        st.info("Sin conexiones en el período.")
+        return
+    fila = resumen.iloc[0]
+    st.caption(f"{fila['cantidad']} conexiones | Media {fila['media']:.3f} mm | Desvío {fila['desvio']:.3f} mm | "
+               f"Rango {fila['minimo']:.3f} - {fila['maximo']:.3f} mm | OK {fila['fraccion_ok']:.0%}")
+    cuentas, bordes = historico.histograma(**filtro)
+    import altair as alt
+    df_histo = pd.DataFrame({"desde": np.round(bordes[:-1], 3), "hasta": np.round(bordes[1:], 3), "conexiones": cuentas})
+    st.altair_chart(
+        alt.Chart(df_histo).mark_bar().encode(
+            x=alt.X("desde:Q", title="Desplazamiento [mm]"), x2="hasta:Q",
+            y=alt.Y("conexiones:Q", title="Conexiones"), tooltip=["desde", "hasta", "conexiones"]),
+        use_container_width=True)
+
+with col_grafico:
+    st.subheader("Gráfico de desplazamiento de conexiones")
+    panel_grafico()
 
     subcol1, subcol2 = st.columns(2)
     with subcol1:    
         if st.button("🔄 Repetir conexión", use_container_width=True, disabled=not botones_habilitados or not st.session_state.sensor_inicializado or st.session_state.flag_terminado or not st.session_state.medicion_activa):
-            idx = st.session_state.conexiones_realizadas
-            fila = st.session_state.df_expandido.iloc[idx]
-            
-            grado_acero = str(fila["Grado de acero"]).strip()
-            diametro = str(fila["Diametro"]).strip()
-            umbral_min = st.session_state.umbral_min
-            umbral_max = st.session_state.umbral_max
-            desplazamiento = st.session_state.sensor_value 
-            comentario = "NO OK - reassembly"
-
-            registrar_resultado(idx, diametro, grado_acero, umbral_min, umbral_max, desplazamiento, comentario)
-        
-            st.session_state.x_acum = 0.0
-            st.session_state.y_acum = 0.0
-            
-            if st.session_state.conexiones_realizadas==st.session_state.total_conexiones:
-                st.session_state.flag_terminado=False
-                st.session_state.medicion_activa = True
+            cerrar_conexion(reassembly=True)
     with subcol2:
         if st.button("➡️ Siguiente conexión", use_container_width=True, disabled=not botones_habilitados or not st.session_state.sensor_inicializado or st.session_state.flag_terminado or not st.session_state.medicion_activa):
-            idx = st.session_state.conexiones_realizadas
-            fila = st.session_state.df_expandido.iloc[idx]
-            
-            grado_acero = str(fila["Grado de acero"]).strip()
-            diametro = str(fila["Diametro"]).strip()
-            umbral_min = st.session_state.umbral_min
-            umbral_max = st.session_state.umbral_max
-            desplazamiento = st.session_state.sensor_value 
-            comentario = "OK" if umbral_min <= desplazamiento <= umbral_max else "NO OK"
-
-            registrar_resultado(idx, diametro, grado_acero, umbral_min, umbral_max, desplazamiento, comentario)
-        
-            st.session_state.x_acum = 0.0
-            st.session_state.y_acum = 0.0
-            st.session_state.conexiones_realizadas += 1
-            if st.session_state.conexiones_realizadas==st.session_state.total_conexiones:
-                st.session_state.flag_terminado=True
-                st.session_state.medicion_activa = False
-            actualizar_umbral_actual()
+            cerrar_conexion()
+
+    # Cierre detectado por la segmentación automática, a confirmar por el operador
+    propuesta = st.session_state.propuesta_cierre
+    if propuesta is not None and st.session_state.medicion_activa:
+        st.info(f"Hombro detectado: {propuesta.desplazamiento:.3f} mm. ¿Cerrar la conexión con este valor?")
+        subcol1, subcol2 = st.columns(2)
+        with subcol1:
+            if st.button("✅ Confirmar cierre", use_container_width=True):
+                cerrar_conexion(desplazamiento=propuesta.desplazamiento)
+        with subcol2:
+            if st.button("✖️ Descartar", use_container_width=True):
+                st.session_state.propuesta_cierre = None
+                st.session_state.segmentador.reiniciar()
+
+    for grado, diametro, alarma in st.session_state.estadisticas.alarmas():
+        st.warning(f"Carta de control {grado} {diametro}: {alarma}")
+    with st.expander("Estadísticas del pozo"):
+        panel_estadisticas()
 
     st.divider()
 
@@ -277,15 +873,33 @@ with col_grafico:
     # --- CSV RAW ---
     with subcol1:
         st.markdown("**CSV RAW**")
-        if not st.session_state.datos.empty and botones_habilitados:
-            csv_bytes = st.session_state.datos.to_csv(index=False).encode("utf-8")
-            st.download_button(
-                "Descargar CSV",
-                data=csv_bytes,
-                file_name=f"raw_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-                mime="text/csv",
-                use_container_width=True
-            )
+        archivos_crudos = [p for p in st.session_state.archivos_crudos if os.path.exists(p)]
+        if archivos_crudos and botones_habilitados:
+            # El CSV se genera recién al pedirlo; cada vez solo se convierten
+            # las muestras nuevas de los .ttt
+            if st.button("Preparar CSV", use_container_width=True):
+                if st.session_state.archivo_crudo is not None:
+                    st.session_state.archivo_crudo.flush()
+                if st.session_state.exportacion_crudo is None or not st.session_state.exportacion_crudo.existe():
+                    if st.session_state.exportacion_crudo is not None:
+                        st.session_state.exportacion_crudo.cerrar()
+                    st.session_state.exportacion_crudo = ExportacionCrudo(nombre_exportacion("raw"))
+                with st.spinner("Convirtiendo muestras a CSV..."):
+                    st.session_state.exportacion_crudo.sincronizar(archivos_crudos)
+                st.session_state.muestras_csv = len(st.session_state.datos)
+            exportacion = st.session_state.exportacion_crudo
+            if exportacion is not None and exportacion.existe():
+                st.download_button(
+                    "Descargar CSV",
+                    data=exportacion.contenido(),     # Del archivo: no se guarda en la sesión
+                    file_name=os.path.basename(exportacion.path),
+                    mime="text/csv",
+                    use_container_width=True
+                )
+                st.caption(f"{len(exportacion)} muestras · sha256 {exportacion.huella()[:12]}")
+                if len(st.session_state.datos) > st.session_state.muestras_csv:
+                    st.caption("Hay muestras nuevas desde que se preparó el CSV.")
+            st.caption(f"Binario: {', '.join(os.path.basename(p) for p in archivos_crudos)}")
         else:
             st.info("No hay datos para descargar.")
 
@@ -293,14 +907,16 @@ with col_grafico:
     with subcol2:
         st.markdown("**CSV Conexiones**")
         if not st.session_state.resultados.empty and botones_habilitados:
-            csv_bytes = st.session_state.resultados.to_csv(index=False).encode("utf-8")
+            # Se escribe a medida que se cierran conexiones: acá no se re-serializa nada
+            exportacion = exportacion_resultados()
             st.download_button(
                 "Descargar CSV",
-                data=csv_bytes,
-                file_name=f"conexiones_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                data=exportacion.contenido(),
+                file_name=os.path.basename(exportacion.path),
                 mime="text/csv",
                 use_container_width=True
             )
+            st.caption(f"{len(exportacion)} conexiones · sha256 {exportacion.huella()[:12]}")
         else:
             st.info("No hay datos para descargar.")
 
@@ -332,9 +948,9 @@ with col_grafico:
                     equipo = st.text_input("Equipo", value="")
                     responsable_tenaris = st.text_input("Resp. Tenaris (FISE)", value="")
                 with col2:
-                    numero_parte = st.text_input("Número de parte", value="")
+                    numero_parte = st.text_input("Número de parte", value=st.session_state.numero_parte)
                     responsable_cliente = st.text_input("Responsable cliente", value="")
-                    pozo = st.text_input("Pozo", value="")
+                    pozo = st.text_input("Pozo", value=st.session_state.nombre_pozo)
                     motivo = st.text_input("Motivo de intervención", value="")
                     unidad_ligera = st.text_input("Unidad liviana (patente)", value="")
 
@@ -342,18 +958,11 @@ with col_grafico:
 
             if enviar:
                 # === Construcción de resumen ===
-                total = int(len(st.session_state.resultados))
-                ok = int((st.session_state.resultados["comentario"] == "OK").sum())
-                nok = int((st.session_state.resultados["comentario"] == "NO OK").sum())
-                nok_r = total - ok - nok
+                resultados_df = st.session_state.resultados.a_dataframe()
 
                 hist_dir = HIST_DIR
                 os.makedirs(hist_dir, exist_ok=True)
 
-                with st.spinner("Generando histogramas..."):
-                    rutas_histo = generar_histogramas(st.session_state.resultados, output_dir=hist_dir)
-
-
                 datos = {
                     "cabecera": {
                         "Numero_de_parte": numero_parte,
@@ -367,44 +976,33 @@ with col_grafico:
                         "Nombre_de_FISE": responsable_tenaris,
                         "Patente_vehículo": unidad_ligera,
                     },
-                    "tabla_resumen": {
-                        "Total": total,
-                        "OK": ok,
-                        "NO_OK": nok,
-                        "NO_OK_Reassembly": nok_r,
-                    },
-                    "histograms": rutas_histo,
-                    "mediciones": st.session_state.resultados.to_dict(orient="records"),
+                    "tabla_resumen": tabla_resumen(UMBRALES.clasificar_resultados(resultados_df)),
+                    # "histograms" y "mediciones" los completa el worker de reportes
                 }
                 
                 pdf_name = f"Informe_Parte_{datos['cabecera']['Numero_de_parte']}_{datetime.now().strftime('%Y%m%d')}.pdf"
                 pdf_path = os.path.join(PDF_DIR, pdf_name)
-                with st.spinner("Generando PDF..."):
-                    try:
-                        generar_reporte_pdf(datos=datos, pdf_path=pdf_path)
-                    except Exception as e:
-                        st.error(f"Error al generar PDF: {e}")
-                        raise
-
-                with open(pdf_path, "rb") as f:
-                    pdf_bytes = f.read()
-                    st.success("Informe generado correctamente.")
-                    st.download_button(
-                        "Descargar informe PDF",
-                        data=pdf_bytes,
-                        file_name=pdf_name,
-                        mime="application/pdf",
-                        use_container_width=True,
-                    )
+                st.session_state.trabajo_pdf = obtener_cola_reportes().encolar(resultados_df, datos, pdf_path, hist_dir,
+                                                                               st.session_state.estadisticas.copia())
+
+    # --- Estado del informe en segundo plano ---
+    if st.session_state.trabajo_pdf is not None:
+        trabajo = obtener_cola_reportes().estado(st.session_state.trabajo_pdf)
+        sondeando = trabajo is not None and trabajo["estado"] not in FINALES
+        st.fragment(panel_informe, run_every=INTERVALO_INFORME_S if sondeando else None)(sondeando)
+
+    with st.expander("Histórico de conexiones (todos los pozos)"):
+        panel_historico()
 
 
 # ---- Columna 3: Métricas ----
-with col_metricas:
-    st.subheader("Lecturas en tiempo real")
+@st.fragment(run_every=INTERVALO_REFRESCO_S if st.session_state.medicion_activa else None)
+def panel_lecturas():
+    # Región en vivo: solo muestra el estado que actualiza panel_grafico
     if botones_habilitados and st.session_state.conexiones_realizadas < st.session_state.total_conexiones:
         fila_actual = st.session_state.df_expandido.iloc[st.session_state.conexiones_realizadas]
-        grado_actual = str(fila_actual["Grado de acero"]).strip()
-        diametro_actual = str(fila_actual["Diametro"]).strip()
+        grado_actual = fila_actual["grado_acero"]
+        diametro_actual = fila_actual["diametro"]
         st.markdown(f"**Conexión actual:** Grado {grado_actual} | Diámetro {diametro_actual}")
     else:
         st.markdown("**Conexión actual:** N/A")
@@ -416,14 +1014,28 @@ with col_metricas:
     else:
         st.metric("Desplazamiento [mm]", f"{desplazamiento:.3f}")
 
+    if st.session_state.modo_segmentacion != "manual":
+        st.caption(f"Segmentación: {st.session_state.segmentador.estado}")
     st.metric("Conexiones realizadas", f"{st.session_state.conexiones_realizadas}/{st.session_state.total_conexiones}")
+    if st.session_state.adquisidor is not None:
+        stats = st.session_state.adquisidor.estadisticas()
+        st.caption(f"Muestras: {stats['muestras']} | Perdidas: {st.session_state.muestras_perdidas} | Atrasadas: {stats['atrasadas']}")
+        filtro = st.session_state.filtro.estadisticas()
+        st.caption(f"Filtro: {filtro['rechazadas']} descartadas | {filtro['sin_movimiento']} lecturas sin movimiento")
+        for nombre, s in stats.get("por_sensor", {}).items():
+            st.caption(f"{nombre}: {s['muestras']} muestras | {s['atrasadas']} atrasadas")
+
+with col_metricas:
+    st.subheader("Lecturas en tiempo real")
+    panel_lecturas()
+    with st.expander("Métricas"):
+        st.json(REGISTRO.instantanea(), expanded=False)
+        st.caption("Arranque")
+        st.json(RELOJ.informe(), expanded=False)
 
 
-# ---- Loop de adquisición discreta ----
-if st.session_state.medicion_activa:
-    leer_sensor()
-    time.sleep(0.05)  # 20 Hz
-    st.rerun()
+# Duración de la ejecución completa del script (los refrescos de los fragmentos se miden aparte)
+UI_RERUN.observe(time.perf_counter() - INICIO_RERUN)
 
 # ---- Pie de página ----
 st.markdown("---")
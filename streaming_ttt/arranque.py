@@ -0,0 +1,148 @@
+import os
+import ast
+import sys
+import time
+import logging
+import argparse
+import subprocess
+from contextlib import contextmanager
+from metrics import REGISTRO
+
+# Tiempos de arranque: cuánto tarda la app en quedar usable (botón
+# "Inicializar sensor" visible) y en qué se va ese tiempo.
+#   - En la app: RELOJ mide las etapas de la primera ejecución del script en
+#     el proceso (imports, umbrales, UI) y las cargas diferidas (altair al
+#     primer gráfico, el sensor al inicializarlo); el resumen va al log y a
+#     la sección Métricas.
+#   - Por línea de comandos: python arranque.py importa los módulos de app.py
+#     en un intérprete nuevo (arranque en frío), en el mismo orden, y lista
+#     el costo de cada uno.
+
+# --- CONFIGURACIÓN ---
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(DIRECTORIO, "app.py")
+DIFERIDOS = ("altair", "matplotlib.pyplot", "histograms", "report_generator")   # Se cargan recién al usarse
+
+ARRANQUE_LISTO = REGISTRO.medidor("ttt_arranque_listo_segundos", "Desde el inicio del proceso hasta la UI usable")
+ARRANQUE_SCRIPT = REGISTRO.medidor("ttt_arranque_script_segundos", "Duración de la primera ejecución del script hasta la UI usable")
+
+
+def edad_proceso():
+    # Segundos desde que arrancó el proceso (incluye el arranque del servidor
+    # de Streamlit, anterior al script); None fuera de Linux
+    try:
+        with open("/proc/self/stat") as f:
+            inicio_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        return time.clock_gettime(time.CLOCK_BOOTTIME) - inicio_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class RelojArranque:
+    # Etapas del arranque, registradas una sola vez por proceso: en los reruns
+    # siguientes marcar() y medir() no agregan nada
+    def __init__(self, inicio = None):
+        self.inicio = time.perf_counter() if inicio is None else inicio
+        self.etapas = {}
+        self.listo_s = None
+        self.proceso_s = None
+        self._anterior = self.inicio
+
+    def marcar(self, etapa):
+        # Tiempo desde la marca anterior, solo durante la primera ejecución
+        ahora = time.perf_counter()
+        if self.listo_s is None and etapa not in self.etapas:
+            self.etapas[etapa] = ahora - self._anterior
+        self._anterior = ahora
+
+    @contextmanager
+    def medir(self, etapa):
+        # Carga diferida: se registra la primera vez que ocurre
+        if etapa in self.etapas:
+            yield
+            return
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.etapas[etapa] = time.perf_counter() - t0
+            if self.listo_s is not None:
+                logging.info(f"Carga diferida '{etapa}': {self.etapas[etapa] * 1000:.0f} ms")
+
+    def listo(self):
+        # La UI ya se puede usar; se llama en cada rerun pero solo cuenta el primero
+        if self.listo_s is not None:
+            return
+        self.listo_s = time.perf_counter() - self.inicio
+        edad = edad_proceso()
+        self.proceso_s = edad if edad is not None else self.listo_s
+        ARRANQUE_SCRIPT.set(round(self.listo_s, 4))
+        ARRANQUE_LISTO.set(round(self.proceso_s, 4))
+        logging.info(f"Arranque: UI usable a {self.proceso_s:.2f} s del inicio del proceso "
+                     f"(script {self.listo_s:.2f} s: {self.resumen()})")
+
+    def resumen(self):
+        return ", ".join(f"{etapa} {s * 1000:.0f} ms" for etapa, s in self.etapas.items())
+
+    def informe(self):
+        return {"listo_s": self.listo_s, "proceso_s": self.proceso_s,
+                "etapas_ms": {etapa: round(s * 1000, 1) for etapa, s in self.etapas.items()}}
+
+
+# Uno por proceso: se crea al primer import, al comienzo de la primera ejecución del script
+RELOJ = RelojArranque()
+
+
+def modulos_de_app(path = APP_PATH):
+    # Imports de nivel superior de app.py, en orden
+    modulos = []
+    for nodo in ast.parse(open(path, encoding="utf-8").read(), path).body:
+        if isinstance(nodo, ast.Import):
+            modulos += [alias.name for alias in nodo.names]
+        elif isinstance(nodo, ast.ImportFrom) and nodo.module:
+            modulos.append(nodo.module)
+    return list(dict.fromkeys(modulos))
+
+
+def medir_imports(modulos, diferidos = DIFERIDOS):
+    # Arranque en frío en un intérprete nuevo: costo incremental de cada import
+    # en el orden de app.py (lo que ya cargó uno anterior no se vuelve a contar)
+    # y después el de cada carga diferida. Devuelve ({módulo: s}, {diferido: s | None})
+    codigo = (
+        "import sys, time, importlib\n"
+        "for etiqueta, modulos in (('MODULO', sys.argv[1].split(',')), ('DIFERIDO', sys.argv[2].split(','))):\n"
+        "    for m in modulos:\n"
+        "        t0 = time.perf_counter()\n"
+        "        try:\n"
+        "            importlib.import_module(m)\n"
+        "        except Exception:\n"
+        "            print(etiqueta, m, -1)\n"
+        "            continue\n"
+        "        print(etiqueta, m, time.perf_counter() - t0)\n"
+    )
+    entorno = {**os.environ, "MPLBACKEND": "Agg"}
+    proc = subprocess.run([sys.executable, "-c", codigo, ",".join(modulos), ",".join(diferidos)],
+                          cwd=DIRECTORIO, env=entorno, capture_output=True, text=True, check=True)
+    tiempos = {"MODULO": {}, "DIFERIDO": {}}
+    for linea in proc.stdout.splitlines():
+        partes = linea.split()
+        if len(partes) == 3 and partes[0] in tiempos:
+            segundos = float(partes[2])
+            tiempos[partes[0]][partes[1]] = segundos if segundos >= 0 else None
+    return tiempos["MODULO"], tiempos["DIFERIDO"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Costo de importación en frío de los módulos de app.py")
+    parser.add_argument("--top", type=int, default=10, help="módulos más caros a listar")
+    args = parser.parse_args()
+
+    modulos, diferidos = medir_imports(modulos_de_app())
+    total = sum(s for s in modulos.values() if s is not None)
+    print(f"Imports de app.py ({len(modulos)} módulos): {total:.2f} s en frío")
+    for nombre, segundos in sorted(modulos.items(), key=lambda m: m[1] or 0.0, reverse=True)[:args.top]:
+        print(f"  {nombre:30s} " + ("no disponible" if segundos is None else f"{segundos * 1000:8.0f} ms"))
+    print("Cargas diferidas (después de los imports de la app):")
+    for nombre, segundos in diferidos.items():
+        print(f"  {nombre:30s} " + ("no disponible" if segundos is None else f"{segundos * 1000:8.0f} ms"))
+    print(f"[OK] Arranque medido con {sys.executable}")
@@ -0,0 +1,261 @@
+import os
+import re
+import math
+import time
+import logging
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from sensor import SpiSensor, DEFAULT_TIMEOUT, POLL_INTERVAL
+
+# Todos los backends exponen la interfaz de SpiSensor que usa el resto del
+# proyecto: initialize(timeout), read_sensor(timeout) -> (dx, dy) en cuentas
+# crudas, read_sample(timeout) -> (movimiento, dx, dy), read_many(n) -> [(dx, dy), ...]
+# y close().
+
+# --- CONFIGURACIÓN ---
+BACKENDS = ("spi", "replay", "sintetico")
+PERFILES = ("reposo", "constante", "enrosque", "senoidal")
+FORMATO_TS_CSV = "%Y-%m-%d %H:%M:%S.%f"       # Formato que escribe read_continuous
+PATRON_FACTORES = re.compile(r"-(\d+\.\d+)-(\d+\.\d+)\.csv$")  # <fecha>-<fx>-<fy>.csv
+FILAS_POR_CHUNK = 50_000
+INT16_MIN, INT16_MAX = -(1 << 15), (1 << 15) - 1
+
+
+def _saturar(valor):
+    # El PAT9130 reporta deltas de 16 bits con signo
+    return int(min(max(valor, INT16_MIN), INT16_MAX))
+
+
+class SensorSimulado:
+    # Base de los backends sin hardware. Las muestras tienen un tiempo simulado
+    # (segundos desde el inicio); con `velocidad` se reproducen a N× tiempo real
+    # y con velocidad=None se entregan una por lectura, sin esperas (CI).
+    # Como el sensor real, read_sensor acumula todo el movimiento pendiente.
+    def __init__(self, velocidad = 1.0):
+        self.velocidad = velocidad
+        self.terminado = False
+        self._t0 = None
+
+    def _pendientes(self, hasta_s, max_n):
+        # Consume y devuelve (dx, dy) de las muestras con tiempo <= hasta_s
+        raise NotImplementedError
+
+    def _tiempo_simulado(self):
+        if self.velocidad is None:
+            return math.inf
+        if self._t0 is None:
+            self._t0 = time.monotonic()
+        return (time.monotonic() - self._t0) * self.velocidad
+
+    def initialize(self, timeout = DEFAULT_TIMEOUT):
+        self._t0 = time.monotonic()
+        logging.info(f"{type(self).__name__} inicializado (velocidad={self.velocidad})")
+
+    def read_sensor(self, timeout = DEFAULT_TIMEOUT):
+        _, dx, dy = self.read_sample(timeout)
+        return dx, dy
+
+    def read_sample(self, timeout = DEFAULT_TIMEOUT):
+        start = time.monotonic()
+        while True:
+            dx, dy = self._pendientes(self._tiempo_simulado(), None if self.velocidad else 1)
+            if np.any(dx) or np.any(dy):
+                return True, _saturar(dx.sum()), _saturar(dy.sum())
+            if self.terminado or time.monotonic() - start > timeout:
+                return False, 0, 0
+            if self.velocidad is not None:
+                time.sleep(POLL_INTERVAL)
+
+    def read_many(self, n):
+        dx, dy = self._pendientes(self._tiempo_simulado(), n)
+        return [(int(x), int(y)) for x, y in zip(dx, dy) if x or y]
+
+    def close(self):
+        pass
+
+
+class SensorReplay(SensorSimulado):
+    # Reproduce un CSV de read_continuous (timestamp, delta_x, delta_y, ...).
+    # Los deltas están en mm ya calibrados: se vuelven a cuentas crudas con los
+    # factores del nombre del archivo (o los indicados). Se lee por chunks.
+    def __init__(self, csv_path, velocidad = 1.0, factor_x = None, factor_y = None, repetir = False):
+        super().__init__(velocidad)
+        self.csv_path = csv_path
+        self.repetir = repetir
+        m = PATRON_FACTORES.search(os.path.basename(csv_path))
+        fx, fy = (float(m.group(1)), float(m.group(2))) if m else (1.0, 1.0)
+        self.factor_x = factor_x if factor_x is not None else fx
+        self.factor_y = factor_y if factor_y is not None else fy
+        self._ts0 = None
+        self._offset_s = 0.0  # Corrimiento acumulado al repetir el archivo
+        self._abrir()
+
+    def _abrir(self):
+        self._chunks = pd.read_csv(self.csv_path, usecols=["timestamp", "delta_x", "delta_y"], chunksize=FILAS_POR_CHUNK)
+        self._t = np.empty(0)
+        self._dx = self._dy = np.empty(0, dtype=np.int64)
+        self._pos = 0
+
+    def _cargar_chunk(self):
+        try:
+            chunk = next(self._chunks)
+        except StopIteration:
+            if not self.repetir or self._ts0 is None:
+                self.terminado = True
+                return False
+            paso = float(np.median(np.diff(self._t))) if len(self._t) > 1 else 0.0
+            self._offset_s = (self._t[-1] if len(self._t) else self._offset_s) + paso
+            self._ts0 = None
+            self._abrir()
+            return self._cargar_chunk()
+        ts = pd.to_datetime(chunk["timestamp"], format=FORMATO_TS_CSV).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        if self._ts0 is None:
+            self._ts0 = ts[0]
+        self._t = (ts - self._ts0) / 1e9 + self._offset_s
+        self._dx = np.rint(chunk["delta_x"].to_numpy() * 1000.0 / self.factor_x).astype(np.int64)
+        self._dy = np.rint(chunk["delta_y"].to_numpy() * 1000.0 / self.factor_y).astype(np.int64)
+        self._pos = 0
+        return True
+
+    def _pendientes(self, hasta_s, max_n):
+        partes_x, partes_y = [], []
+        restante = max_n if max_n is not None else math.inf
+        while restante > 0:
+            if self._pos >= len(self._t):
+                if not self._cargar_chunk():
+                    break
+                continue
+            fin = int(np.searchsorted(self._t, hasta_s, side="right"))
+            fin = int(min(fin, self._pos + restante))
+            if fin <= self._pos:
+                break
+            partes_x.append(self._dx[self._pos:fin])
+            partes_y.append(self._dy[self._pos:fin])
+            restante -= fin - self._pos
+            self._pos = fin
+        if not partes_x:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        return np.concatenate(partes_x), np.concatenate(partes_y)
+
+
+class SensorSintetico(SensorSimulado):
+    # Generador determinístico de movimiento a `frecuencia_hz`. La posición es
+    # una función analítica del tiempo (por perfil) y los deltas son sus
+    # diferencias enteras, así el resultado no depende de cómo se lea.
+    # perfil "enrosque": reposo -> rampa de `amplitud` cuentas -> hombro, en ciclos de `periodo_s`.
+    def __init__(self, perfil = "enrosque", frecuencia_hz = 1000.0, velocidad = 1.0, amplitud = 1900.0,
+                 periodo_s = 20.0, ruido = 0.0, proporcion_y = 0.1, duracion_s = None, seed = 0):
+        super().__init__(velocidad)
+        if perfil not in PERFILES:
+            raise ValueError(f"Perfil desconocido: {perfil} (opciones: {', '.join(PERFILES)})")
+        self.perfil = perfil
+        self.frecuencia_hz = frecuencia_hz
+        self.amplitud = amplitud
+        self.periodo_s = periodo_s
+        self.ruido = ruido
+        self.proporcion_y = proporcion_y
+        self.total = int(duracion_s * frecuencia_hz) if duracion_s is not None else None
+        self._rng = np.random.default_rng(seed)
+        self._k = 0
+
+    def _posicion(self, t):
+        if self.perfil == "reposo":
+            return np.zeros_like(t)
+        if self.perfil == "constante":
+            return self.amplitud * t / self.periodo_s
+        if self.perfil == "senoidal":
+            return self.amplitud * np.sin(2 * np.pi * t / self.periodo_s)
+        # enrosque: 25% reposo, 50% rampa, 25% hombro
+        ciclo, fase = np.divmod(t / self.periodo_s, 1.0)
+        rampa = np.clip((fase - 0.25) / 0.5, 0.0, 1.0)
+        return self.amplitud * (ciclo + rampa)
+
+    def _pendientes(self, hasta_s, max_n):
+        fin = self._k + max_n if max_n is not None else math.inf
+        if hasta_s != math.inf:
+            fin = min(fin, math.floor(hasta_s * self.frecuencia_hz) + 1)
+        if self.total is not None:
+            fin = min(fin, self.total)
+            self.terminado = fin >= self.total
+        fin = int(fin)
+        if fin <= self._k:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        t = np.arange(self._k, fin + 1) / self.frecuencia_hz
+        pos = self._posicion(t)
+        dx = np.diff(np.floor(pos)).astype(np.int64)
+        dy = np.diff(np.floor(pos * self.proporcion_y)).astype(np.int64)
+        if self.ruido:
+            # Una fila (x, y) por muestra: el stream no depende del tamaño de lectura
+            ruido = np.rint(self._rng.normal(0.0, self.ruido, (fin - self._k, 2))).astype(np.int64)
+            dx += ruido[:, 0]
+            dy += ruido[:, 1]
+        self._k = fin
+        return dx, dy
+
+
+def crear_sensor(tipo = "spi", **opciones):
+    if tipo == "spi":
+        return SpiSensor(**opciones)
+    if tipo == "replay":
+        return SensorReplay(**opciones)
+    if tipo == "sintetico":
+        return SensorSintetico(**opciones)
+    raise ValueError(f"Backend de sensor desconocido: {tipo} (opciones: {', '.join(BACKENDS)})")
+
+
+def sensor_desde_entorno(tipo = None, **opciones):
+    # TTT_SENSOR=spi|replay|sintetico; TTT_REPLAY_CSV, TTT_VELOCIDAD, TTT_PERFIL, TTT_FRECUENCIA_HZ
+    tipo = tipo or os.environ.get("TTT_SENSOR", "spi")
+    if tipo in ("replay", "sintetico") and "TTT_VELOCIDAD" in os.environ:
+        velocidad = os.environ["TTT_VELOCIDAD"]
+        opciones["velocidad"] = None if velocidad.lower() == "max" else float(velocidad)
+    if tipo == "replay":
+        opciones["csv_path"] = os.environ["TTT_REPLAY_CSV"]
+        opciones["repetir"] = True
+    elif tipo == "sintetico":
+        opciones["perfil"] = os.environ.get("TTT_PERFIL", "enrosque")
+        opciones["frecuencia_hz"] = float(os.environ.get("TTT_FRECUENCIA_HZ", 1000.0))
+    return crear_sensor(tipo, **opciones)
+
+
+def generar_csv_sintetico(directorio, duracion_s, factor_x = 6.46, factor_y = 6.46, **opciones):
+    # Escribe una sesión sintética con el formato y el nombre de archivo de
+    # read_continuous, para usarla luego como entrada de SensorReplay
+    sensor = SensorSintetico(velocidad=None, duracion_s=duracion_s, **opciones)
+    t0 = pd.Timestamp(datetime.now())
+    path = os.path.join(directorio, f"{t0.strftime('%Y%m%d_%H%M%S')}-{factor_x:.3f}-{factor_y:.3f}.csv")
+    x_sum = y_sum = 0.0
+    primero = True
+    while not sensor.terminado:
+        inicio = sensor._k
+        dx, dy = sensor._pendientes(math.inf, FILAS_POR_CHUNK)
+        if len(dx) == 0:
+            break
+        dx_mm = dx * factor_x / 1000
+        dy_mm = dy * factor_y / 1000
+        acum_x = x_sum + np.cumsum(dx_mm)
+        acum_y = y_sum + np.cumsum(dy_mm)
+        x_sum, y_sum = acum_x[-1], acum_y[-1]
+        ts = t0 + pd.to_timedelta(np.arange(inicio, inicio + len(dx)) / sensor.frecuencia_hz, unit="s")
+        bloque = pd.DataFrame({"timestamp": ts.strftime(FORMATO_TS_CSV).str[:-3], "delta_x": dx_mm, "delta_y": dy_mm,
+                               "acumulado_x": acum_x, "acumulado_y": acum_y})
+        bloque.to_csv(path, mode="w" if primero else "a", header=primero, index=False)
+        primero = False
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera una sesión sintética en formato CSV de read_continuous")
+    parser.add_argument("directorio")
+    parser.add_argument("--duracion", type=float, default=60.0, help="segundos simulados")
+    parser.add_argument("--perfil", choices=PERFILES, default="enrosque")
+    parser.add_argument("--frecuencia", type=float, default=1000.0, help="Hz")
+    parser.add_argument("--ruido", type=float, default=0.0, help="desvío del ruido en cuentas")
+    parser.add_argument("--factor", type=float, default=6.46, help="factor de calibración (um por cuenta)")
+    args = parser.parse_args()
+    os.makedirs(args.directorio, exist_ok=True)
+    path = generar_csv_sintetico(args.directorio, args.duracion, factor_x=args.factor, factor_y=args.factor,
+                                 perfil=args.perfil, frecuencia_hz=args.frecuencia, ruido=args.ruido)
+    logging.info(f"Sesión sintética guardada en {path}")
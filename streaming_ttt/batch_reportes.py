@@ -0,0 +1,126 @@
+import os
+import sys
+import glob
+import json
+import time
+import logging
+import argparse
+import multiprocessing
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Regeneración de informes PDF en lote, sin pasar por la UI (p. ej. después de
+# cambiar templates/report_template.html):
+#   python batch_reportes.py data/conexiones --cabecera cabecera.json --salida data/pdf/lote
+# Cada pozo (un conexiones_*.csv) es un trabajo independiente; los trabajos se
+# reparten entre procesos que compilan la plantilla y cargan el logo una sola
+# vez al arrancar. Cada proceso renderiza sus histogramas en serie: el
+# paralelismo es entre pozos, así no se anidan pools.
+#
+# cabecera.json: un diccionario con los campos de la cabecera del informe, o
+# {"*": {comunes}, "<nombre del csv sin extensión>": {propios del pozo}, ...}
+
+# --- CONFIGURACIÓN ---
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+PATRON_CSV = "conexiones_*.csv"
+SALIDA_DIR = os.path.join("data", "pdf", "lote")
+COLUMNAS_TEXTO = {"diametro": str, "grado_acero": str, "comentario": str}   # "1" no debe leerse como número
+
+# Estado por proceso de trabajo (lo arma _inicializar_proceso)
+_PROCESO = {}
+
+
+def _inicializar_proceso(directorio):
+    # Una vez por proceso: rutas relativas, plantilla compilada, assets en memoria
+    os.chdir(directorio)
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    from histograms import generar_histogramas
+    from report_generator import generar_reporte_pdf, obtener_entorno, crear_url_fetcher, TEMPLATE_REPORTE, ASSETS_REPORTE
+    obtener_entorno().get_template(TEMPLATE_REPORTE)
+    url_fetcher = crear_url_fetcher(ASSETS_REPORTE)
+    for path in ASSETS_REPORTE.values():
+        url_fetcher(f"file://{os.path.abspath(path)}")   # Precarga
+    _PROCESO.update(generar_histogramas=generar_histogramas, generar_reporte_pdf=generar_reporte_pdf,
+                    url_fetcher=url_fetcher)
+
+
+def cabecera_para(cabeceras, nombre):
+    if not cabeceras or not all(isinstance(v, dict) for v in cabeceras.values()):
+        return dict(cabeceras or {})
+    return {**cabeceras.get("*", {}), **cabeceras.get(nombre, {})}
+
+
+def generar_pozo(csv_path, cabecera, salida_dir):
+    # Un trabajo: CSV de conexiones -> histogramas -> PDF. Devuelve (pdf, segundos)
+    from thresholds import IndiceUmbrales, tabla_resumen
+    t0 = time.perf_counter()
+    nombre = os.path.splitext(os.path.basename(csv_path))[0]
+    resultados = pd.read_csv(csv_path, dtype=COLUMNAS_TEXTO)
+
+    hist_dir = os.path.join(salida_dir, "histogramas", nombre)   # Por pozo: la caché sobrevive entre lotes
+    rutas_histo = _PROCESO["generar_histogramas"](resultados, output_dir=hist_dir, max_workers=1)
+    datos = {
+        "cabecera": cabecera,
+        "tabla_resumen": tabla_resumen(IndiceUmbrales.clasificar_resultados(resultados)),
+        "histograms": rutas_histo,
+        "mediciones": resultados.to_dict(orient="records"),
+    }
+    pdf_path = os.path.join(salida_dir, f"Informe_{nombre}.pdf")
+    _PROCESO["generar_reporte_pdf"](datos=datos, pdf_path=pdf_path, url_fetcher=_PROCESO["url_fetcher"])
+    return pdf_path, time.perf_counter() - t0
+
+
+def generar_lote(archivos, cabeceras, salida_dir, workers = None):
+    # Devuelve {csv: (pdf, segundos)} de los exitosos y {csv: error} de los fallidos
+    salida_dir = os.path.abspath(salida_dir)
+    os.makedirs(salida_dir, exist_ok=True)
+    # Los más grandes primero: mejor reparto cuando los pozos son de tamaños distintos
+    archivos = sorted((os.path.abspath(p) for p in archivos), key=os.path.getsize, reverse=True)
+    workers = min(workers or os.cpu_count() or 1, len(archivos)) or 1
+
+    generados, errores = {}, {}
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=contexto,
+                             initializer=_inicializar_proceso, initargs=(DIRECTORIO,)) as pool:
+        futuros = {
+            pool.submit(generar_pozo, path, cabecera_para(cabeceras, os.path.splitext(os.path.basename(path))[0]), salida_dir): path
+            for path in archivos
+        }
+        for futuro in as_completed(futuros):
+            path = futuros[futuro]
+            try:
+                generados[path] = futuro.result()
+                print(f"[OK] {os.path.basename(path)} -> {generados[path][0]} ({generados[path][1]:.1f} s)", flush=True)
+            except Exception as e:
+                errores[path] = f"{type(e).__name__}: {e}"
+                print(f"[ERROR] {os.path.basename(path)}: {errores[path]}", flush=True)
+    return generados, errores
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Genera en paralelo los informes PDF de varios pozos")
+    parser.add_argument("entrada", help=f"directorio con {PATRON_CSV} (o archivos CSV sueltos)", nargs="+")
+    parser.add_argument("--cabecera", help="JSON con los datos de cabecera (comunes y/o por pozo)")
+    parser.add_argument("--salida", default=SALIDA_DIR)
+    parser.add_argument("--patron", default=PATRON_CSV)
+    parser.add_argument("--workers", type=int, help="procesos en paralelo (por defecto, uno por núcleo)")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    archivos = []
+    for entrada in args.entrada:
+        archivos += sorted(glob.glob(os.path.join(entrada, args.patron))) if os.path.isdir(entrada) else [entrada]
+    if not archivos:
+        sys.exit(f"No se encontraron archivos {args.patron} en {', '.join(args.entrada)}")
+    cabeceras = {}
+    if args.cabecera:
+        with open(args.cabecera, encoding="utf-8") as f:
+            cabeceras = json.load(f)
+
+    t0 = time.perf_counter()
+    generados, errores = generar_lote(archivos, cabeceras, args.salida, args.workers)
+    total = time.perf_counter() - t0
+    suma = sum(s for _, s in generados.values())
+    print(f"[OK] {len(generados)}/{len(archivos)} informes en {total:.1f} s "
+          f"({len(generados) / total:.2f} informes/s, paralelismo efectivo {suma / total:.1f}x)")
+    sys.exit(1 if errores else 0)
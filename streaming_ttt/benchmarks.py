@@ -0,0 +1,390 @@
+import os
+import ast
+import sys
+import json
+import time
+import shutil
+import logging
+import platform
+import argparse
+import tempfile
+import subprocess
+import statistics
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+# Suite de benchmarks reproducible sin hardware (usa fake_spidev / buffers
+# cargados a mano). Resultados en JSON para comparar entre versiones:
+#   python benchmarks.py                 -> data/benchmarks/bench_<fecha>.json
+#   python benchmarks.py --rapido        -> tamaños reducidos (CI)
+#   python benchmarks.py --secciones sensor app
+
+# --- CONFIGURACIÓN ---
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(DIRECTORIO, "app.py")
+SALIDA_DIR = os.path.join("data", "benchmarks")
+SECCIONES = ("sensor", "leer_sensor", "rerun", "resultados", "reportes", "historico", "exportacion", "calibracion")
+TAMANOS_DATOS = (1_000, 10_000, 100_000)
+TAMANOS_POZO = (50, 200, 1000)
+TAMANOS_HISTORICO = (10_000, 100_000, 1_000_000)
+TAMANOS_EXPORTACION = (1_000, 10_000, 100_000)
+PASADAS_CALIBRACION = (100, 500)
+NOMBRES_APP = ("COLUMNAS_DATOS", "COLUMNAS_RESULTADOS", "defaults", "THRESHOLDS_PATH", "HIST_DIR", "PDF_DIR", "CRUDO_DIR")
+FUNCIONES_AUXILIARES = ("escritor_crudo", "cerrar_crudo", "guardar_estado", "segmentar", "perfil_calibracion")   # Usadas por leer_sensor
+SEMILLA = 1234
+
+
+def medir(fn, repeticiones = 5, calentamiento = 1):
+    for _ in range(calentamiento):
+        fn()
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        fn()
+        tiempos.append(time.perf_counter() - t0)
+    return {"mediana_s": statistics.median(tiempos), "min_s": min(tiempos), "media_s": statistics.fmean(tiempos),
+            "repeticiones": repeticiones}
+
+
+class EstadoSesion(dict):
+    # Imitación mínima de st.session_state (acceso por clave y por atributo)
+    __getattr__ = dict.__getitem__
+    __setattr__ = dict.__setitem__
+
+
+class StFalso:
+    def __init__(self):
+        self.session_state = EstadoSesion()
+        self.mensajes = []
+
+    def __getattr__(self, nombre):
+        # st.error / st.warning / ... -> se registran para detectar fallas
+        return lambda *args, **kwargs: self.mensajes.append((nombre, args))
+
+
+def cargar_app(funciones):
+    # Ejecuta solo los imports, las constantes y las funciones pedidas de app.py
+    # (sin el cuerpo de la UI ni los decoradores de Streamlit), contra un st falso
+    arbol = ast.parse(open(APP_PATH, encoding="utf-8").read(), APP_PATH)
+    cuerpo = []
+    for nodo in arbol.body:
+        if isinstance(nodo, (ast.Import, ast.ImportFrom)):
+            if not any(alias.name.startswith("streamlit") for alias in nodo.names) and getattr(nodo, "module", None) != "streamlit":
+                cuerpo.append(nodo)
+        elif isinstance(nodo, ast.Assign) and any(isinstance(t, ast.Name) and t.id in NOMBRES_APP for t in nodo.targets):
+            cuerpo.append(nodo)
+        elif isinstance(nodo, ast.FunctionDef) and (nodo.name in funciones or nodo.name in FUNCIONES_AUXILIARES):
+            nodo.decorator_list = []
+            cuerpo.append(nodo)
+    st = StFalso()
+    entorno = {"__name__": "app_benchmark", "st": st}
+    exec(compile(ast.Module(body=cuerpo, type_ignores=[]), APP_PATH, "exec"), entorno)
+    entorno["CRUDO_DIR"] = tempfile.mkdtemp(prefix="bench_crudo_")   # Los .ttt del benchmark no quedan en data/
+    if "IndiceUmbrales" in entorno:
+        entorno["UMBRALES"] = entorno["IndiceUmbrales"](entorno["THRESHOLDS_PATH"])
+    st.session_state.update(entorno["defaults"])
+    return entorno, st
+
+
+class AdquisidorFalso:
+    # Buffer cargado a mano en lugar del hilo de adquisición
+    def __init__(self, muestras):
+        from acquisition import BufferCircular
+        capacidad = 1 << max(10, int(np.ceil(np.log2(max(muestras, 1)))))
+        self.buffer = BufferCircular(capacidad)
+        self.sensor = None
+        self.ultimo_error = None
+
+    def cargar(self, n, rng):
+        t0 = time.time_ns()
+        for i, (dx, dy) in enumerate(rng.integers(-20, 21, size=(n, 2))):
+            self.buffer.escribir(t0 + i * 10_000_000, dx, dy)
+
+    def is_alive(self):
+        return True
+
+    def estadisticas(self):
+        return {"muestras": self.buffer.ultimo_indice(), "atrasadas": 0, "errores": 0, "activo": True}
+
+
+def resultados_sinteticos(n, rng):
+    diametros = rng.choice(["1", "7/8", "3/4"], n)
+    grados = rng.choice(["D", "MMS", "UHS", "ARHS", "ARCS"], n)
+    desplazamiento = rng.normal(12.0, 1.5, n)
+    comentario = np.where((desplazamiento >= 11) & (desplazamiento <= 13), "OK", "NO OK").astype(object)
+    comentario[rng.random(n) < 0.05] = "NO OK - reassembly"
+    return pd.DataFrame({"id_conexion": np.arange(1, n + 1), "diametro": diametros, "grado_acero": grados,
+                         "umbral_min": 11.0, "umbral_max": 13.0, "desplazamiento": desplazamiento, "comentario": comentario})
+
+
+# ==============================
+# SECCIONES
+# ==============================
+def bench_sensor(rapido):
+    from fake_spidev import benchmark_lecturas
+    return benchmark_lecturas(n_muestras=2_000 if rapido else 20_000)
+
+
+def bench_leer_sensor(rapido):
+    # Costo de leer_sensor según cuántas muestras nuevas encuentra en el buffer
+    rng = np.random.default_rng(SEMILLA)
+    resultados = {}
+    for bloque in (1, 5, 100, 1000):
+        repeticiones = 50 if rapido else 200
+        entorno, st = cargar_app({"leer_sensor"})
+        adquisidor = AdquisidorFalso(bloque * (repeticiones + 1))
+        st.session_state.adquisidor = adquisidor
+        adquisidor.cargar(bloque * (repeticiones + 1), rng)
+
+        def leer():
+            fin = st.session_state.cursor_buffer + bloque
+            # Se expone solo un bloque por llamada, como entre dos reruns
+            escritos, adquisidor.buffer.escritos = adquisidor.buffer.escritos, fin
+            entorno["leer_sensor"]()
+            adquisidor.buffer.escritos = escritos
+
+        r = medir(leer, repeticiones=repeticiones)
+        r["us_por_muestra"] = r["mediana_s"] / bloque * 1e6
+        resultados[f"bloque_{bloque}"] = r
+        if st.mensajes:
+            resultados[f"bloque_{bloque}"]["mensajes"] = [str(m) for m in st.mensajes[:5]]
+    return resultados
+
+
+def bench_rerun(rapido):
+    # Tiempo de ejecución completa del script app.py según el tamaño de `datos`
+    from streamlit.testing.v1 import AppTest
+    rng = np.random.default_rng(SEMILLA)
+    resultados = {}
+    for n in TAMANOS_DATOS[:2] if rapido else TAMANOS_DATOS:
+        entorno, st = cargar_app({"leer_sensor"})
+        adquisidor = AdquisidorFalso(n)
+        adquisidor.cargar(n, rng)
+        st.session_state.adquisidor = adquisidor
+        entorno["leer_sensor"]()   # Llena datos y el resumen del gráfico con n muestras
+
+        at = AppTest.from_file(APP_PATH, default_timeout=120)
+        pozo = pd.DataFrame({"Cantidad": [n // 100 + 1], "Diametro": ["7/8"], "Grado de acero": ["UHS"]})
+        for clave in ("datos", "resumen_grafico", "x_acum", "y_acum", "sensor_value", "ultima_lectura"):
+            at.session_state[clave] = st.session_state[clave]
+        at.session_state["pozo_df"] = pozo
+        at.session_state["df_expandido"] = pozo.loc[pozo.index.repeat(pozo["Cantidad"])].reset_index(drop=True)
+        at.session_state["total_conexiones"] = int(pozo["Cantidad"].sum())
+        r = medir(at.run, repeticiones=3 if rapido else 10)
+        if at.exception:
+            r["error"] = str(at.exception[0].message)
+        resultados[f"datos_{n}"] = r
+    return resultados
+
+
+def bench_resultados(rapido):
+    from historico import HistoricoConexiones
+    n = 2_000 if rapido else 20_000
+    entorno, st = cargar_app({"registrar_resultado", "exportacion_resultados"})
+    registrar = entorno["registrar_resultado"]
+    tmp = tempfile.mkdtemp(prefix="bench_historico_")
+    historico = HistoricoConexiones(os.path.join(tmp, "historico.sqlite"))
+    entorno["obtener_historico"] = lambda: historico   # Sin el cache_resource de Streamlit
+    entorno["nombre_exportacion"] = lambda prefijo: os.path.join(tmp, f"{prefijo}.csv")
+
+    def registrar_n():
+        st.session_state.resultados.limpiar()
+        for i in range(n):
+            registrar(i, "7/8", "UHS", 11.0, 13.0, 12.0, "OK")
+
+    try:
+        r = medir(registrar_n, repeticiones=3)
+        historico.cerrar()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    r["n"] = n
+    r["conexiones_por_s"] = n / r["mediana_s"]
+    return r
+
+
+def bench_reportes(rapido):
+    rng = np.random.default_rng(SEMILLA)
+    resultados = {}
+    tmp = tempfile.mkdtemp(prefix="bench_reportes_")
+    try:
+        from histograms import generar_histogramas
+        for n in TAMANOS_POZO[:1] if rapido else TAMANOS_POZO:
+            df = resultados_sinteticos(n, rng)
+            hist_dir = os.path.join(tmp, f"hist_{n}")
+            r = {"histogramas": medir(lambda: generar_histogramas(df, hist_dir, usar_cache=False), repeticiones=1, calentamiento=0)}
+            r["histogramas_cache"] = medir(lambda: generar_histogramas(df, hist_dir), repeticiones=3, calentamiento=0)
+            try:
+                from report_generator import generar_reporte_pdf
+                rutas = generar_histogramas(df, hist_dir)
+                datos = {"cabecera": {"Numero_de_parte": "BENCH"}, "tabla_resumen": {"Total": n},
+                         "histograms": rutas, "mediciones": df.to_dict(orient="records")}
+                pdf_path = os.path.join(tmp, f"bench_{n}.pdf")
+                r["pdf"] = medir(lambda: generar_reporte_pdf(datos, pdf_path), repeticiones=1, calentamiento=0)
+            except (ImportError, OSError) as e:
+                # WeasyPrint necesita Pango del sistema
+                r["pdf"] = {"error": f"{type(e).__name__}: {e}"}
+            resultados[f"conexiones_{n}"] = r
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return resultados
+
+
+def bench_historico(rapido):
+    # Consultas de flota sobre el histórico según la cantidad de conexiones guardadas
+    from historico import HistoricoConexiones
+    rng = np.random.default_rng(SEMILLA)
+    resultados = {}
+    tmp = tempfile.mkdtemp(prefix="bench_historico_")
+    try:
+        historico = HistoricoConexiones(os.path.join(tmp, "historico.sqlite"))
+        ahora, cargadas = time.time(), 0
+        for n in TAMANOS_HISTORICO[:2] if rapido else TAMANOS_HISTORICO:
+            df = resultados_sinteticos(n - cargadas, rng)
+            df["fecha"] = ahora - rng.random(len(df)) * 365 * 86400
+            df["pozo"] = rng.choice([f"POZO-{i}" for i in range(100)], len(df))
+            t0 = time.perf_counter()
+            historico.registrar_dataframe(df)
+            r = {"carga_s": time.perf_counter() - t0, "filas_cargadas": len(df)}
+            cargadas = n
+            seis_meses = dict(grado="UHS", diametro="7/8", desde=ahora - 182 * 86400)
+            r["resumen_todo"] = medir(historico.resumen, repeticiones=3)
+            r["resumen_grado_diametro_6_meses"] = medir(lambda: historico.resumen(**seis_meses), repeticiones=5)
+            r["histograma_grado_diametro_6_meses"] = medir(lambda: historico.histograma(**seis_meses), repeticiones=5)
+            r["resumen_pozo"] = medir(lambda: historico.resumen(pozo="POZO-7"), repeticiones=5)
+            r["consultar_grado_diametro_6_meses"] = medir(lambda: historico.consultar(**seis_meses), repeticiones=3)
+            resultados[f"conexiones_{n}"] = r
+        historico.cerrar()
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return resultados
+
+
+def bench_exportacion(rapido):
+    # Costo por rerun del CSV de conexiones para el botón de descarga: antes se
+    # serializaba todo en cada rerun; ahora solo se agregan las filas nuevas
+    from columnar import AlmacenColumnar
+    from exportacion import ExportacionResultados
+    rng = np.random.default_rng(SEMILLA)
+    resultados = {}
+    tmp = tempfile.mkdtemp(prefix="bench_exportacion_")
+    try:
+        for n in TAMANOS_EXPORTACION[:2] if rapido else TAMANOS_EXPORTACION:
+            df = resultados_sinteticos(n, rng).assign(sensor="sintetico0")
+            almacen = AlmacenColumnar({c: df[c].dtype for c in df.columns}, capacidad=n + 1)
+            almacen.extender(**{c: df[c].to_numpy() for c in df.columns})
+            exportacion = ExportacionResultados(os.path.join(tmp, f"conexiones_{n}.csv"), df.columns).sincronizar(almacen)
+            r = {"csv_completo": medir(lambda: almacen.a_dataframe().to_csv(index=False).encode("utf-8"), repeticiones=3)}
+            r["rerun_sin_cambios"] = medir(lambda: exportacion.sincronizar(almacen).contenido())
+            fila = {c: v for c, v in zip(df.columns, df.iloc[-1])}
+
+            def conexion_nueva():
+                almacen.agregar(**fila)
+                exportacion.sincronizar(almacen).contenido()
+
+            r["rerun_con_conexion_nueva"] = medir(conexion_nueva)
+            r["bytes"] = len(exportacion.contenido())
+            exportacion.cerrar()
+            resultados[f"conexiones_{n}"] = r
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return resultados
+
+
+def bench_calibracion(rapido):
+    # Ajuste de calibración desde pasadas .ttt grabadas (~5 s a 1 kHz cada una)
+    # con un modelo conocido: tiempo de lectura, de ajuste y error de los parámetros
+    from formato_binario import EscritorCrudo
+    from calibracion import cargar_pasadas, ajustar
+    rng = np.random.default_rng(SEMILLA)
+    matriz, offset = np.array([[6.52, 0.08], [-0.05, 6.40]]), np.array([0.3, -0.2])
+    resultados = {}
+    tmp = tempfile.mkdtemp(prefix="bench_calibracion_")
+    try:
+        for n in PASADAS_CALIBRACION[:1] if rapido else PASADAS_CALIBRACION:
+            filas = []
+            for i in range(n):
+                # Pasadas en X, en Y y en diagonal, de distinta longitud y velocidad
+                direccion = np.array([(15.0, 0.0), (0.0, 15.0), (10.0, 10.0)][i % 3]) * rng.uniform(0.5, 2.0)
+                muestras = int(rng.integers(2_000, 8_000))
+                cuentas = np.linalg.solve(matriz, direccion * 1000.0)
+                # Reparto de las cuentas en las muestras, con ruido; la distancia
+                # "medida" sale del modelo aplicado a lo que quedó grabado
+                base = np.diff(np.floor(np.linspace(0.0, 1.0, muestras + 1)[:, None] * cuentas), axis=0)
+                dx, dy = (base + rng.integers(-1, 2, size=(muestras, 2))).astype(np.int64).T
+                con_movimiento = np.count_nonzero((dx != 0) | (dy != 0))
+                distancia = (matriz @ [dx.sum(), dy.sum()] + offset * con_movimiento) / 1000.0
+                path = os.path.join(tmp, f"pasada_{i:04d}.ttt")
+                with EscritorCrudo(path, 6.46, t0_ns=0) as escritor:
+                    escritor.agregar(np.arange(muestras) * 1_000_000, dx, dy, np.zeros(muestras), np.zeros(muestras))
+                filas.append((os.path.basename(path), "spi0.0", *(distancia + rng.normal(0.0, 0.005, 2))))
+            manifiesto = os.path.join(tmp, f"pasadas_{n}.csv")
+            pd.DataFrame(filas, columns=["archivo", "sensor", "distancia_x_mm", "distancia_y_mm"]).to_csv(manifiesto, index=False)
+            t0 = time.perf_counter()
+            pasadas = cargar_pasadas(manifiesto)
+            r = {"lectura_s": time.perf_counter() - t0}
+            r["ajuste"] = medir(lambda: ajustar(pasadas))
+            perfil, _ = ajustar(pasadas)["spi0.0"]
+            r["error_matriz_max"] = float(np.abs(perfil.matriz - matriz).max())
+            r["error_offset_max"] = float(np.abs(perfil.offset - offset).max())
+            r["residuos"] = perfil.residuos
+            resultados[f"pasadas_{n}"] = r
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return resultados
+
+
+BENCHMARKS = {
+    "sensor": bench_sensor,
+    "leer_sensor": bench_leer_sensor,
+    "rerun": bench_rerun,
+    "resultados": bench_resultados,
+    "reportes": bench_reportes,
+    "historico": bench_historico,
+    "exportacion": bench_exportacion,
+    "calibracion": bench_calibracion,
+}
+
+
+def metadatos():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=DIRECTORIO, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit or None,
+        "python": sys.version.split()[0],
+        "plataforma": platform.platform(),
+        "maquina": platform.machine(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks de adquisición, UI, registro de resultados y reportes")
+    parser.add_argument("--secciones", nargs="+", choices=SECCIONES, default=list(SECCIONES))
+    parser.add_argument("--rapido", action="store_true", help="tamaños reducidos")
+    parser.add_argument("--salida", help="archivo JSON de salida")
+    args = parser.parse_args()
+
+    os.chdir(DIRECTORIO)  # app.py usa rutas relativas (thresholds.json, templates)
+    sys.path.insert(0, DIRECTORIO)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    informe = {"metadatos": metadatos(), "rapido": args.rapido, "resultados": {}}
+    for seccion in args.secciones:
+        t0 = time.perf_counter()
+        print(f"[BENCH] {seccion}...", flush=True)
+        try:
+            informe["resultados"][seccion] = BENCHMARKS[seccion](args.rapido)
+        except Exception as e:
+            informe["resultados"][seccion] = {"error": f"{type(e).__name__}: {e}"}
+        print(f"[BENCH] {seccion} listo en {time.perf_counter() - t0:.1f} s", flush=True)
+
+    salida = args.salida or os.path.join(SALIDA_DIR, f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(salida) or ".", exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(informe, f, indent=2, ensure_ascii=False)
+    print(f"[OK] Resultados guardados en {salida}")
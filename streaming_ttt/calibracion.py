@@ -0,0 +1,272 @@
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from formato_binario import ArchivoCrudo, EXTENSION as EXTENSION_CRUDO
+from backends import PATRON_FACTORES, FILAS_POR_CHUNK
+
+# Calibración por mínimos cuadrados a partir de muchas pasadas grabadas sobre
+# distancias conocidas, en lugar de una sola pasada interactiva por eje
+# (SpiSensor.calibrate_x / calibrate_y). Modelo por sensor, en µm:
+#   [dx, dy] = M @ [cuentas_x, cuentas_y] + offset · (muestra con movimiento)
+#   M = [[escala_x, sesgo_xy], [sesgo_yx, escala_y]]   (sesgo: acople entre ejes)
+# Sumado sobre una pasada queda lineal en las sumas de cuentas y en la cantidad
+# de muestras con movimiento, así cada pasada se reduce a 3 números y el ajuste
+# de cientos de pasadas es un único lstsq de N x 3 con dos columnas de salida.
+# "Muestra con movimiento" = cuentas no nulas en algún eje, igual al aplicar.
+#   - Pasadas: .ttt (cuentas crudas) o CSV de read_continuous (los deltas en mm
+#     se vuelven a cuentas con los factores del nombre, como SensorReplay), o
+#     un sensor en reproducción (pasada_desde_sensor).
+#   - Perfiles: calibracion.json guarda todas las versiones de cada sensor
+#     (la última es la vigente), con los residuos del ajuste.
+#   - Aplicación: leer_sensor usa el perfil vigente de la fuente; sin perfil
+#     sigue el factor único de la app.
+#
+#   python calibracion.py pasadas.csv              (archivo,sensor,distancia_x_mm,distancia_y_mm)
+#   python calibracion.py pasadas.csv --guardar
+#   python calibracion.py --listar
+
+# --- CONFIGURACIÓN ---
+CALIBRACION_PATH = "calibracion.json"
+MINIMO_PASADAS = 4            # Pasadas por sensor: 3 parámetros por eje + residuos
+CONDICION_MAXIMA = 100.0      # Número de condición del sistema escalado; más = ejes no separables
+COLUMNAS_PASADAS = ["sensor", "cuentas_x", "cuentas_y", "muestras", "distancia_x_mm", "distancia_y_mm"]
+
+
+class PerfilCalibracion:
+    def __init__(self, sensor, matriz, offset = (0.0, 0.0), version = 0, fecha = None, pasadas = 0, residuos = None):
+        self.sensor = sensor
+        self.matriz = np.asarray(matriz, dtype=np.float64).reshape(2, 2)   # µm por cuenta
+        self.offset = np.asarray(offset, dtype=np.float64).reshape(2)       # µm por muestra con movimiento
+        self.version = version
+        self.fecha = fecha
+        self.pasadas = pasadas
+        self.residuos = residuos or {}
+
+    @classmethod
+    def desde_factor(cls, sensor, factor_x, factor_y = None):
+        # El modelo anterior: un factor por eje, sin acople ni offset
+        return cls(sensor, [[factor_x, 0.0], [0.0, factor_x if factor_y is None else factor_y]])
+
+    @property
+    def escala_x(self):
+        return float(self.matriz[0, 0])
+
+    @property
+    def escala_y(self):
+        return float(self.matriz[1, 1])
+
+    def aplicar(self, dx, dy, movimiento = None):
+        # Cuentas (arrays) -> deltas en mm. Con cuentas ya filtradas (suavizado),
+        # `movimiento` debe salir de las crudas, como en el ajuste
+        dx = np.asarray(dx, dtype=np.float64)
+        dy = np.asarray(dy, dtype=np.float64)
+        if movimiento is None:
+            movimiento = (dx != 0) | (dy != 0)
+        (a, b), (c, d) = self.matriz
+        dx_mm = (a * dx + b * dy + self.offset[0] * movimiento) / 1000.0
+        dy_mm = (c * dx + d * dy + self.offset[1] * movimiento) / 1000.0
+        return dx_mm, dy_mm
+
+    def a_dict(self):
+        return {"version": self.version, "fecha": self.fecha, "matriz": self.matriz.tolist(),
+                "offset": self.offset.tolist(), "pasadas": self.pasadas, "residuos": self.residuos}
+
+    @classmethod
+    def desde_dict(cls, sensor, d):
+        return cls(sensor, d["matriz"], d.get("offset", (0.0, 0.0)), d.get("version", 0), d.get("fecha"),
+                   d.get("pasadas", 0), d.get("residuos"))
+
+    def descripcion(self):
+        r = self.residuos
+        return (f"{self.sensor} v{self.version}: escala {self.escala_x:.4f} / {self.escala_y:.4f} µm/cuenta, "
+                f"sesgo {self.matriz[0, 1]:+.4f} / {self.matriz[1, 0]:+.4f}, offset {self.offset[0]:+.4f} / {self.offset[1]:+.4f} µm"
+                + (f", RMS {r['rms_x_mm'] * 1000:.1f} / {r['rms_y_mm'] * 1000:.1f} µm en {self.pasadas} pasadas" if r else ""))
+
+
+# ==============================
+# PASADAS
+# ==============================
+def resumir_pasada(dx, dy):
+    # (suma de cuentas x, suma de cuentas y, muestras con movimiento)
+    dx = np.asarray(dx, dtype=np.int64)
+    dy = np.asarray(dy, dtype=np.int64)
+    return int(dx.sum()), int(dy.sum()), int(np.count_nonzero((dx != 0) | (dy != 0)))
+
+
+def pasada_desde_archivo(path, factor_x = None, factor_y = None):
+    if path.endswith(EXTENSION_CRUDO):
+        archivo = ArchivoCrudo(path)
+        totales = np.zeros(3, dtype=np.int64)
+        for bloque in archivo.bloques():
+            totales += resumir_pasada(bloque["dx"], bloque["dy"])
+        return tuple(int(v) for v in totales)
+    # CSV de read_continuous: deltas en mm con los factores del nombre del archivo
+    m = PATRON_FACTORES.search(os.path.basename(path))
+    fx, fy = (float(m.group(1)), float(m.group(2))) if m else (None, None)
+    fx, fy = factor_x or fx, factor_y or fy
+    if fx is None or fy is None:
+        raise ValueError(f"{path}: sin factores en el nombre; indicar factor_x/factor_y")
+    totales = np.zeros(3, dtype=np.int64)
+    for chunk in pd.read_csv(path, usecols=["delta_x", "delta_y"], chunksize=FILAS_POR_CHUNK):
+        totales += resumir_pasada(np.rint(chunk["delta_x"].to_numpy() * 1000.0 / fx),
+                                  np.rint(chunk["delta_y"].to_numpy() * 1000.0 / fy))
+    return tuple(int(v) for v in totales)
+
+
+def pasada_desde_sensor(sensor, max_muestras = None):
+    # Un sensor en reproducción (backends: replay, o sintético con duracion_s),
+    # leído hasta que termina o hasta `max_muestras` con movimiento (read_many
+    # solo devuelve esas)
+    totales = np.zeros(3, dtype=np.int64)
+    while not sensor.terminado and (max_muestras is None or totales[2] < max_muestras):
+        muestras = sensor.read_many(FILAS_POR_CHUNK if max_muestras is None else int(min(FILAS_POR_CHUNK, max_muestras - totales[2])))
+        if muestras:
+            dx, dy = np.asarray(muestras, dtype=np.int64).T
+            totales += resumir_pasada(dx, dy)
+    return tuple(int(v) for v in totales)
+
+
+def cargar_pasadas(manifiesto):
+    # CSV con archivo, sensor, distancia_x_mm, distancia_y_mm [, factor_x, factor_y];
+    # las rutas relativas son relativas al manifiesto
+    tabla = pd.read_csv(manifiesto)
+    base = os.path.dirname(os.path.abspath(manifiesto))
+    filas = []
+    for fila in tabla.to_dict(orient="records"):
+        path = fila["archivo"] if os.path.isabs(fila["archivo"]) else os.path.join(base, fila["archivo"])
+        fx, fy = fila.get("factor_x"), fila.get("factor_y")
+        cuentas_x, cuentas_y, muestras = pasada_desde_archivo(path, None if pd.isna(fx) else fx, None if pd.isna(fy) else fy)
+        filas.append((str(fila["sensor"]), cuentas_x, cuentas_y, muestras, float(fila["distancia_x_mm"]), float(fila["distancia_y_mm"])))
+    return pd.DataFrame(filas, columns=COLUMNAS_PASADAS)
+
+
+# ==============================
+# AJUSTE
+# ==============================
+def ajustar_sensor(sensor, pasadas, con_offset = True):
+    # Mínimos cuadrados sobre las pasadas de un sensor (DataFrame con COLUMNAS_PASADAS)
+    if len(pasadas) < MINIMO_PASADAS:
+        raise ValueError(f"{sensor}: {len(pasadas)} pasadas, se necesitan al menos {MINIMO_PASADAS}")
+    columnas = ["cuentas_x", "cuentas_y"] + (["muestras"] if con_offset else [])
+    a = pasadas[columnas].to_numpy(dtype=np.float64)
+    b = pasadas[["distancia_x_mm", "distancia_y_mm"]].to_numpy(dtype=np.float64) * 1000.0   # µm
+    # Columnas escaladas antes de resolver: las sumas de cuentas y la cantidad
+    # de muestras tienen órdenes de magnitud distintos
+    escala = np.abs(a).max(axis=0)
+    escala[escala == 0] = 1.0
+    coef, _, rango, singulares = np.linalg.lstsq(a / escala, b, rcond=None)
+    condicion = singulares[0] / singulares[-1] if singulares[-1] > 0 else np.inf
+    if rango < len(columnas) or condicion > CONDICION_MAXIMA:
+        # P. ej. solo pasadas en X: el acople de Y no se puede distinguir de la escala
+        raise ValueError(f"{sensor}: pasadas insuficientes para separar los ejes (hacen falta pasadas en X y en Y"
+                         + (" de distintas velocidades" if con_offset else "") + ")")
+    coef = coef / escala[:, None]
+    residuos_mm = (b - a @ coef) / 1000.0
+    libres = max(len(pasadas) - len(columnas), 1)
+    perfil = PerfilCalibracion(
+        sensor, coef[:2].T, coef[2] if con_offset else (0.0, 0.0),
+        fecha=datetime.now().isoformat(timespec="seconds"), pasadas=len(pasadas),
+        residuos={
+            "rms_x_mm": float(np.sqrt(np.mean(residuos_mm[:, 0] ** 2))),
+            "rms_y_mm": float(np.sqrt(np.mean(residuos_mm[:, 1] ** 2))),
+            "max_x_mm": float(np.abs(residuos_mm[:, 0]).max()),
+            "max_y_mm": float(np.abs(residuos_mm[:, 1]).max()),
+            "desvio_x_mm": float(np.sqrt(np.sum(residuos_mm[:, 0] ** 2) / libres)),
+            "desvio_y_mm": float(np.sqrt(np.sum(residuos_mm[:, 1] ** 2) / libres)),
+            "condicion": float(condicion),
+        })
+    return perfil, residuos_mm
+
+
+def ajustar(pasadas, con_offset = True):
+    # Un perfil por sensor: {sensor: (perfil, residuos en mm por pasada)}
+    return {sensor: ajustar_sensor(sensor, grupo, con_offset) for sensor, grupo in pasadas.groupby("sensor", sort=True)}
+
+
+# ==============================
+# PERFILES
+# ==============================
+class AlmacenCalibraciones:
+    # calibracion.json: {sensor: [versión 1, versión 2, ...]}; como los umbrales,
+    # se vuelve a leer solo si el archivo cambió en disco
+    def __init__(self, path = CALIBRACION_PATH):
+        self.path = path
+        self._mtime = None
+        self._perfiles = {}
+        self._lock = threading.Lock()
+
+    def _cargar(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            self._perfiles, self._mtime = {}, None
+            return self._perfiles
+        if mtime != self._mtime:
+            try:
+                with open(self.path, "r") as f:
+                    self._perfiles = json.load(f)
+                self._mtime = mtime
+            except ValueError as e:
+                logging.error(f"Calibraciones inválidas en {self.path}, se conservan las anteriores: {e}")
+        return self._perfiles
+
+    def vigente(self, sensor):
+        with self._lock:
+            versiones = self._cargar().get(sensor)
+        return PerfilCalibracion.desde_dict(sensor, versiones[-1]) if versiones else None
+
+    def historial(self, sensor):
+        with self._lock:
+            return [PerfilCalibracion.desde_dict(sensor, d) for d in self._cargar().get(sensor, [])]
+
+    def sensores(self):
+        with self._lock:
+            return sorted(self._cargar())
+
+    def guardar(self, perfil):
+        # Agrega una versión nueva (la vigente); escritura atómica
+        with self._lock:
+            perfiles = {s: list(v) for s, v in self._cargar().items()}
+            versiones = perfiles.setdefault(perfil.sensor, [])
+            perfil.version = (versiones[-1]["version"] if versiones else 0) + 1
+            perfil.fecha = perfil.fecha or datetime.now().isoformat(timespec="seconds")
+            versiones.append(perfil.a_dict())
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(perfiles, f, indent=2, ensure_ascii=False)
+            os.replace(tmp, self.path)
+            self._perfiles, self._mtime = perfiles, os.stat(self.path).st_mtime_ns
+        logging.info(f"Calibración guardada: {perfil.descripcion()}")
+        return perfil
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibración por mínimos cuadrados a partir de pasadas grabadas")
+    parser.add_argument("manifiesto", nargs="?", help="CSV: archivo,sensor,distancia_x_mm,distancia_y_mm[,factor_x,factor_y]")
+    parser.add_argument("--sin-offset", action="store_true", help="ajustar solo escala y sesgo")
+    parser.add_argument("--guardar", action="store_true", help=f"guardar los perfiles en {CALIBRACION_PATH}")
+    parser.add_argument("--perfiles", default=CALIBRACION_PATH)
+    parser.add_argument("--listar", action="store_true", help="mostrar las versiones guardadas")
+    args = parser.parse_args()
+
+    almacen = AlmacenCalibraciones(args.perfiles)
+    if args.listar:
+        for sensor in almacen.sensores():
+            for perfil in almacen.historial(sensor):
+                print(f"{perfil.fecha}  {perfil.descripcion()}")
+    if args.manifiesto:
+        t0 = time.perf_counter()
+        pasadas = cargar_pasadas(args.manifiesto)
+        for sensor, (perfil, residuos) in ajustar(pasadas, con_offset=not args.sin_offset).items():
+            print(perfil.descripcion())
+            print(f"  residuo máximo {perfil.residuos['max_x_mm'] * 1000:.1f} / {perfil.residuos['max_y_mm'] * 1000:.1f} µm, "
+                  f"condición {perfil.residuos['condicion']:.1f}")
+            if args.guardar:
+                almacen.guardar(perfil)
+        print(f"[OK] {len(pasadas)} pasadas ajustadas en {time.perf_counter() - t0:.2f} s")
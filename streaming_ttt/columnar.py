@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+# --- CONFIGURACIÓN ---
+CAPACIDAD_INICIAL = 1024
+FORMATO_TS = "%H:%M:%S.%f"   # Mismo formato que mostraba la app (se recorta a ms)
+
+
+class AlmacenColumnar:
+    # Almacén columnar creciente respaldado por arrays de NumPy.
+    # Cada columna se preasigna y duplica su capacidad al llenarse, por lo que
+    # agregar filas cuesta O(1) amortizado (en lugar del O(n) de pd.concat).
+    # Las vistas devueltas por columna()/cola() no copian datos y dejan de ser
+    # válidas cuando el almacén crece: usarlas en el mismo rerun.
+    def __init__(self, columnas, capacidad = CAPACIDAD_INICIAL):
+        self.dtypes = {nombre: np.dtype(dtype) for nombre, dtype in columnas.items()}
+        self.columnas = list(self.dtypes)
+        self._capacidad = max(1, capacidad)
+        self._datos = {n: np.empty(self._capacidad, dtype=d) for n, d in self.dtypes.items()}
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def empty(self):
+        return self._n == 0
+
+    def _reservar(self, extra):
+        requerido = self._n + extra
+        if requerido <= self._capacidad:
+            return
+        nueva = max(requerido, self._capacidad * 2)
+        for nombre, viejo in self._datos.items():
+            nuevo = np.empty(nueva, dtype=viejo.dtype)
+            nuevo[:self._n] = viejo[:self._n]
+            self._datos[nombre] = nuevo
+        self._capacidad = nueva
+
+    def agregar(self, **fila):
+        self._reservar(1)
+        for nombre in self.columnas:
+            self._datos[nombre][self._n] = fila[nombre]
+        self._n += 1
+
+    def extender(self, **bloque):
+        largo = len(bloque[self.columnas[0]])
+        if largo == 0:
+            return
+        self._reservar(largo)
+        for nombre in self.columnas:
+            self._datos[nombre][self._n:self._n + largo] = bloque[nombre]
+        self._n += largo
+
+    def columna(self, nombre):
+        return self._datos[nombre][:self._n]
+
+    def __getitem__(self, nombre):
+        return self.columna(nombre)
+
+    def cola(self, n, columnas = None):
+        inicio = max(0, self._n - n)
+        return {c: self._datos[c][inicio:self._n] for c in (columnas or self.columnas)}
+
+    def ultima(self):
+        if self._n == 0:
+            return None
+        return {c: self._datos[c][self._n - 1] for c in self.columnas}
+
+    def limpiar(self):
+        self._n = 0
+
+    def a_dataframe(self, columnas = None):
+        # Copia: el DataFrame solo se arma al exportar
+        return pd.DataFrame({c: self._datos[c][:self._n].copy() for c in (columnas or self.columnas)})
+
+
+def formatear_timestamps(t_ns, formato = FORMATO_TS):
+    # int64 (ns desde epoch) -> hora local como texto, recortada a milisegundos
+    tz_local = datetime.now().astimezone().tzinfo
+    ts = pd.to_datetime(np.asarray(t_ns, dtype=np.int64), unit="ns", utc=True).tz_convert(tz_local)
+    return ts.strftime(formato).str[:-3]
@@ -0,0 +1,75 @@
+import numpy as np
+
+# --- CONFIGURACIÓN ---
+N_BUCKETS = 256   # El gráfico nunca recibe más de 2 * N_BUCKETS puntos
+
+
+class ResumenMinMax:
+    # Resumen incremental de tamaño fijo de una serie (t, v): cada bucket guarda
+    # su mínimo y su máximo con el instante en que ocurrieron. Cuando se llenan
+    # los buckets se fusionan de a pares y el ancho (muestras por bucket) se
+    # duplica, así agregar cuesta O(1) amortizado y la forma se preserva.
+    def __init__(self, n_buckets = N_BUCKETS):
+        if n_buckets < 2 or n_buckets % 2:
+            raise ValueError(f"n_buckets debe ser par y >= 2: {n_buckets}")
+        self.n_buckets = n_buckets
+        self.reiniciar()
+
+    def reiniciar(self):
+        n = self.n_buckets
+        self.t_min = np.zeros(n)
+        self.v_min = np.full(n, np.inf)
+        self.t_max = np.zeros(n)
+        self.v_max = np.full(n, -np.inf)
+        self.ancho = 1       # Muestras por bucket
+        self.muestras = 0
+        self.t0_ns = None
+
+    def _compactar(self):
+        # Fusiona los buckets (2i, 2i+1) en el bucket i
+        for t_ext, v_ext, elegir in ((self.t_min, self.v_min, np.less_equal), (self.t_max, self.v_max, np.greater_equal)):
+            pares_v = v_ext.reshape(-1, 2)
+            pares_t = t_ext.reshape(-1, 2)
+            primero = elegir(pares_v[:, 0], pares_v[:, 1])
+            mitad = self.n_buckets // 2
+            v_ext[:mitad] = np.where(primero, pares_v[:, 0], pares_v[:, 1])
+            t_ext[:mitad] = np.where(primero, pares_t[:, 0], pares_t[:, 1])
+            v_ext[mitad:] = np.inf if elegir is np.less_equal else -np.inf
+        self.ancho *= 2
+
+    def agregar_bloque(self, t_ns, valores):
+        t_ns = np.asarray(t_ns, dtype=np.int64)
+        valores = np.asarray(valores, dtype=np.float64)
+        if len(t_ns) == 0:
+            return
+        if self.t0_ns is None:
+            self.t0_ns = int(t_ns[0])
+        t_s = (t_ns - self.t0_ns) / 1e9
+        i = 0
+        while i < len(valores):
+            bucket = self.muestras // self.ancho
+            if bucket >= self.n_buckets:
+                self._compactar()
+                continue
+            # Completa el bucket actual con el tramo del bloque que le corresponde
+            fin = min(len(valores), i + (bucket + 1) * self.ancho - self.muestras)
+            tramo = valores[i:fin]
+            j_min, j_max = int(np.argmin(tramo)), int(np.argmax(tramo))
+            if tramo[j_min] <= self.v_min[bucket]:
+                self.v_min[bucket], self.t_min[bucket] = tramo[j_min], t_s[i + j_min]
+            if tramo[j_max] >= self.v_max[bucket]:
+                self.v_max[bucket], self.t_max[bucket] = tramo[j_max], t_s[i + j_max]
+            self.muestras += fin - i
+            i = fin
+
+    def puntos(self):
+        # (t_s, v) ordenados por tiempo, como máximo 2 * n_buckets puntos
+        usados = min(self.n_buckets, -(-self.muestras // self.ancho))
+        t = np.concatenate([self.t_min[:usados], self.t_max[:usados]])
+        v = np.concatenate([self.v_min[:usados], self.v_max[:usados]])
+        orden = np.argsort(t, kind="stable")
+        t, v = t[orden], v[orden]
+        # Si el mínimo y el máximo del bucket son la misma muestra, queda un solo punto
+        unico = np.ones(len(t), dtype=bool)
+        unico[1:] = (np.diff(t) != 0) | (np.diff(v) != 0)
+        return t[unico], v[unico]
@@ -0,0 +1,227 @@
+import copy
+import math
+import bisect
+import numpy as np
+import pandas as pd
+
+# Estadísticas por (diámetro, grado) que se actualizan con cada conexión
+# registrada, en O(1) por conexión y memoria fija por grupo:
+#   - conteos en una grilla fina de bordes fijos (RESOLUCION_MM), que se
+#     re-agrupan en los bins del histograma del informe sin volver a las filas
+#   - media y varianza (Welford), mínimo y máximo
+#   - cuantiles en línea (P², Jain y Chlamtac 1985): cinco marcadores por cuantil
+#   - tasas OK / NO OK / reassembly
+#   - carta de control de valores individuales (I-MR): límites media ± 3 sigma,
+#     con sigma estimado del rango móvil promedio (MR / d2)
+# Las reassembly cuentan para las tasas pero no para la distribución ni para
+# la carta, igual que en generar_histogramas.
+
+# --- CONFIGURACIÓN ---
+RESOLUCION_MM = 0.01
+RANGO_MM = (0.0, 50.0)        # Fuera de rango se cuenta en la primera/última celda
+CUANTILES = (0.05, 0.5, 0.95)
+BINS_INFORME = 10
+SPC_SIGMAS = 3.0
+SPC_D2 = 1.128                # Constante d2 para rangos móviles de 2 puntos
+SPC_MINIMO = 8                # Conexiones antes de evaluar la carta (fase I)
+SPC_RACHA = 8                 # Puntos seguidos del mismo lado de la media
+N_CELDAS = int(round((RANGO_MM[1] - RANGO_MM[0]) / RESOLUCION_MM))
+OK, NO_OK, REASSEMBLY = "OK", "NO OK", "reassembly"
+
+
+def tipo_resultado(comentario):
+    comentario = str(comentario)
+    if "reassembly" in comentario.lower():
+        return REASSEMBLY
+    return OK if comentario == "OK" else NO_OK
+
+
+class CuantilP2:
+    # Estimador P² de un cuantil: alturas q y posiciones n de cinco marcadores;
+    # los intermedios se corrigen con interpolación parabólica (o lineal)
+    def __init__(self, p):
+        self.p = p
+        self.q = []
+        self.n = [0, 1, 2, 3, 4]
+        self.deseadas = [0.0, 2 * p, 4 * p, 2 + 2 * p, 4.0]
+        self.incrementos = [0.0, p / 2, p, (1 + p) / 2, 1.0]
+
+    def agregar(self, x):
+        q, n = self.q, self.n
+        if len(q) < 5:
+            bisect.insort(q, x)
+            return
+        if x < q[0]:
+            q[0], k = x, 0
+        elif x >= q[4]:
+            q[4], k = x, 3
+        else:
+            k = bisect.bisect_right(q, x) - 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.deseadas[i] += self.incrementos[i]
+        for i in (1, 2, 3):
+            d = self.deseadas[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                parabolica = q[i] + d / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if q[i - 1] < parabolica < q[i + 1]:
+                    q[i] = parabolica
+                else:
+                    q[i] += d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                n[i] += d
+
+    def valor(self):
+        if not self.q:
+            return math.nan
+        if len(self.q) < 5:
+            return float(np.quantile(self.q, self.p))   # Exacto mientras hay pocas muestras
+        return self.q[2]
+
+
+class EstadisticasGrupo:
+    def __init__(self, diametro, grado_acero, umbral_min = math.nan, umbral_max = math.nan):
+        self.diametro, self.grado_acero = diametro, grado_acero
+        self.umbral_min, self.umbral_max = umbral_min, umbral_max
+        self.celdas = np.zeros(N_CELDAS, dtype=np.int64)
+        self.n = 0
+        self.media = 0.0
+        self._m2 = 0.0
+        self.minimo, self.maximo = math.inf, -math.inf
+        self.cuantiles = {p: CuantilP2(p) for p in CUANTILES}
+        self.conteos = {OK: 0, NO_OK: 0, REASSEMBLY: 0}
+        self._ultimo = None
+        self._suma_rangos = 0.0
+        self._racha = 0              # >0 seguidos arriba de la media, <0 abajo
+        self.alarmas = 0
+        self.ultima_alarma = None
+
+    def agregar(self, desplazamiento, comentario = OK):
+        # Devuelve la alarma de la carta de control para esta conexión (o None)
+        tipo = tipo_resultado(comentario)
+        self.conteos[tipo] += 1
+        if tipo == REASSEMBLY:
+            return None
+        x = float(desplazamiento)
+        alarma = self._evaluar_carta(x)
+
+        celda = int((x - RANGO_MM[0]) / RESOLUCION_MM)
+        self.celdas[min(max(celda, 0), N_CELDAS - 1)] += 1
+        self.n += 1
+        delta = x - self.media
+        self.media += delta / self.n
+        self._m2 += delta * (x - self.media)
+        self.minimo, self.maximo = min(self.minimo, x), max(self.maximo, x)
+        for cuantil in self.cuantiles.values():
+            cuantil.agregar(x)
+        if self._ultimo is not None:
+            self._suma_rangos += abs(x - self._ultimo)
+        self._ultimo = x
+
+        self.ultima_alarma = alarma
+        if alarma is not None:
+            self.alarmas += 1
+        return alarma
+
+    def _evaluar_carta(self, x):
+        # Contra los límites de las conexiones anteriores (la nueva aún no entra)
+        if self.n < SPC_MINIMO:
+            return None
+        lci, central, lcs = self.limites_control()
+        self._racha = (max(self._racha, 0) + 1) if x > central else (min(self._racha, 0) - 1) if x < central else 0
+        if not lci <= x <= lcs:
+            return f"fuera de los límites de control ({lci:.3f} - {lcs:.3f} mm)"
+        if abs(self._racha) >= SPC_RACHA:
+            return f"{abs(self._racha)} conexiones seguidas {'sobre' if self._racha > 0 else 'bajo'} la media"
+        return None
+
+    @property
+    def varianza(self):
+        return self._m2 / (self.n - 1) if self.n > 1 else math.nan
+
+    @property
+    def desvio(self):
+        return math.sqrt(self.varianza) if self.n > 1 else math.nan
+
+    def limites_control(self):
+        # (LCI, línea central, LCS) de la carta I-MR
+        if self.n < 2:
+            return math.nan, self.media if self.n else math.nan, math.nan
+        sigma = self._suma_rangos / (self.n - 1) / SPC_D2
+        return self.media - SPC_SIGMAS * sigma, self.media, self.media + SPC_SIGMAS * sigma
+
+    def tasas(self):
+        total = sum(self.conteos.values())
+        return {tipo: (c / total if total else math.nan) for tipo, c in self.conteos.items()}
+
+    def histograma(self, bins = BINS_INFORME):
+        # Re-agrupa la grilla en `bins` intervalos iguales que cubren [mínimo, máximo]
+        # (como np.histogram), con bordes sobre la grilla. Devuelve (cuentas, bordes)
+        ocupadas = np.flatnonzero(self.celdas)
+        if len(ocupadas) == 0:
+            return np.zeros(bins, dtype=np.int64), np.linspace(0.0, 1.0, bins + 1)
+        inicio, fin = int(ocupadas[0]), int(ocupadas[-1]) + 1
+        ancho = -(-(fin - inicio) // bins)                 # Celdas por bin
+        inicio = max(0, min(inicio - (ancho * bins - (fin - inicio)) // 2, N_CELDAS - ancho * bins))
+        tramo = np.zeros(ancho * bins, dtype=np.int64)
+        parte = self.celdas[inicio:inicio + ancho * bins]
+        tramo[:len(parte)] = parte
+        bordes = RANGO_MM[0] + (inicio + ancho * np.arange(bins + 1)) * RESOLUCION_MM
+        return tramo.reshape(bins, ancho).sum(axis=1), bordes
+
+    def resumen(self):
+        lci, _, lcs = self.limites_control()
+        tasas = self.tasas()
+        return {
+            "diametro": self.diametro, "grado_acero": self.grado_acero, "cantidad": self.n,
+            "media": self.media if self.n else math.nan, "desvio": self.desvio,
+            "minimo": self.minimo if self.n else math.nan, "maximo": self.maximo if self.n else math.nan,
+            **{f"p{round(p * 100):02d}": c.valor() for p, c in self.cuantiles.items()},
+            "tasa_ok": tasas[OK], "tasa_no_ok": tasas[NO_OK], "tasa_reassembly": tasas[REASSEMBLY],
+            "lci": lci, "lcs": lcs, "alarmas": self.alarmas, "ultima_alarma": self.ultima_alarma,
+        }
+
+
+class EstadisticasPozo:
+    # Un EstadisticasGrupo por (diámetro, grado); se alimenta desde registrar_resultado
+    def __init__(self):
+        self.grupos = {}
+
+    def agregar(self, diametro, grado_acero, desplazamiento, comentario, umbral_min = math.nan, umbral_max = math.nan):
+        clave = (str(diametro), str(grado_acero))
+        grupo = self.grupos.get(clave)
+        if grupo is None:
+            grupo = self.grupos[clave] = EstadisticasGrupo(*clave)
+        if grupo.n == 0 and tipo_resultado(comentario) != REASSEMBLY:
+            # Umbrales del grupo: los de su primera conexión válida (como en el informe)
+            grupo.umbral_min, grupo.umbral_max = umbral_min, umbral_max
+        return grupo.agregar(desplazamiento, comentario)
+
+    def grupo(self, diametro, grado_acero):
+        return self.grupos.get((str(diametro), str(grado_acero)))
+
+    @classmethod
+    def desde_resultados(cls, resultados):
+        # Reconstrucción desde un DataFrame de resultados (journal recuperado, CSV, informe en lote)
+        estadisticas = cls()
+        columnas = ["diametro", "grado_acero", "desplazamiento", "comentario", "umbral_min", "umbral_max"]
+        for fila in resultados[columnas].itertuples(index=False, name=None):
+            estadisticas.agregar(*fila)
+        return estadisticas
+
+    def copia(self):
+        # Instantánea para el informe: las conexiones siguientes no la modifican
+        return copy.deepcopy(self)
+
+    def resumen(self):
+        return pd.DataFrame([g.resumen() for _, g in sorted(self.grupos.items())])
+
+    def alarmas(self):
+        # Grupos cuya última conexión disparó la carta de control
+        return [(g.grado_acero, g.diametro, g.ultima_alarma) for _, g in sorted(self.grupos.items()) if g.ultima_alarma]
+
+    def __len__(self):
+        return len(self.grupos)
@@ -0,0 +1,208 @@
+import io
+import os
+import csv
+import math
+import hashlib
+import logging
+from datetime import datetime
+from functools import lru_cache
+from formato_binario import ArchivoCrudo, COLUMNAS_CSV, bloque_csv
+from metrics import REGISTRO
+
+# Archivos para los botones de descarga, al día sin re-serializar la sesión en
+# cada rerun:
+#   - ExportacionCSV: CSV en disco que solo crece. sincronizar() agrega al
+#     final las filas nuevas desde la última vez y el sha256 se actualiza con
+#     esos bytes, así la huella del contenido se conoce sin releer el archivo.
+#     contenido() lee el archivo solo si la huella cambió desde la última
+#     lectura: con la sesión quieta, los reruns devuelven los mismos bytes.
+#     Con cachear=False (el CSV crudo, del tamaño de toda la sesión) los
+#     bytes no quedan en la sesión sino en un caché del proceso por (path,
+#     huella) con EXPORTACIONES_EN_MEMORIA entradas: tampoco se relee el
+#     archivo en cada rerun, y la memoria no crece con las sesiones abiertas.
+#   - ExportacionResultados: las conexiones de `resultados` (AlmacenColumnar),
+#     con el mismo formato que to_csv(index=False) del DataFrame completo
+#     (NaN vacío, floats con repr); con csv en lugar de pandas, porque se
+#     llama con una fila por conexión.
+#   - ExportacionCrudo: las muestras de los .ttt de la sesión; de cada archivo
+#     convierte solo los registros que todavía no exportó.
+#   - contenido_archivo(): bytes de un archivo ya generado (el PDF del
+#     informe), leídos una vez mientras no cambie en disco.
+#   - limpiar_exportaciones(): borra los CSV sin modificar hace más de
+#     VIGENCIA_EXPORTACION_S, que ya no pertenecen a ninguna sesión (las
+#     exportaciones no se retoman desde el journal).
+
+# --- CONFIGURACIÓN ---
+EXPORTACION_DIR = os.path.join("data", "exportacion")
+FILAS_POR_BLOQUE = 65_536    # Registros .ttt convertidos por bloque
+EXPORTACIONES_EN_MEMORIA = 2        # CSV crudos leídos que se conservan, entre todas las sesiones
+VIGENCIA_EXPORTACION_S = 24 * 3600   # CSV sin modificar por más tiempo: de una sesión abandonada
+
+EXPORTACION_BYTES = REGISTRO.contador("ttt_exportacion_bytes_total", "Bytes agregados a los CSV de descarga")
+EXPORTACION_LECTURAS = REGISTRO.contador("ttt_exportacion_lecturas_total", "Lecturas de un CSV de descarga desde disco (contenido nuevo)")
+
+
+def nombre_exportacion(prefijo, directorio = EXPORTACION_DIR):
+    return os.path.join(directorio, f"{prefijo}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv")
+
+
+class ExportacionCSV:
+    def __init__(self, path, columnas, cachear = True):
+        self.path = path
+        self.columnas = list(columnas)
+        self.cachear = cachear
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._archivo = None
+        self._leido = (None, b"")    # (huella, bytes) de la última lectura
+        self.reiniciar()
+
+    def reiniciar(self):
+        # Vuelve a empezar el archivo: solo encabezado
+        if self._archivo is not None:
+            self._archivo.close()
+        self._archivo = open(self.path, "wb")
+        self._sha = hashlib.sha256()
+        self.filas = 0
+        self._escribir((",".join(self.columnas) + "\n").encode("utf-8"))
+
+    def _escribir(self, datos):
+        self._archivo.write(datos)
+        self._sha.update(datos)
+        EXPORTACION_BYTES.inc(len(datos))
+
+    def agregar_texto(self, texto, filas):
+        # Filas CSV ya formateadas, sin encabezado
+        if filas:
+            self._escribir(texto.encode("utf-8"))
+            self.filas += filas
+
+    def __len__(self):
+        return self.filas
+
+    def huella(self):
+        # sha256 del contenido completo (encabezado incluido), igual a `sha256sum` del archivo
+        return self._sha.hexdigest()
+
+    def existe(self):
+        return os.path.exists(self.path)
+
+    def contenido(self):
+        huella = self.huella()
+        if not self.cachear:
+            self._archivo.flush()
+            return _leer_exportacion(self.path, huella)
+        if self._leido[0] != huella:
+            self._archivo.flush()
+            self._leido = (huella, _leer_csv(self.path))
+        return self._leido[1]
+
+    def cerrar(self):
+        if self._archivo is not None:
+            self._archivo.close()
+            self._archivo = None
+        self._leido = (None, b"")
+
+    def eliminar(self):
+        # Cierra y borra el CSV (nueva sesión): no queda nada en disco ni en memoria
+        self.cerrar()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class ExportacionResultados(ExportacionCSV):
+    def sincronizar(self, almacen):
+        # Agrega las conexiones registradas desde la última vez; O(nuevas)
+        nuevas = len(almacen) - self.filas
+        if nuevas < 0:
+            # El almacén se vació o se reemplazó: se rehace desde cero
+            self.reiniciar()
+            nuevas = len(almacen)
+        if nuevas > 0:
+            columnas = almacen.cola(nuevas, self.columnas)
+            texto = io.StringIO()
+            escritor = csv.writer(texto, lineterminator="\n")
+            escritor.writerows(zip(*(map(_celda, columnas[c].tolist()) for c in self.columnas)))
+            self.agregar_texto(texto.getvalue(), nuevas)
+        return self
+
+
+def _celda(valor):
+    # Como to_csv: NaN/None vacíos
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return ""
+    return valor
+
+
+class ExportacionCrudo(ExportacionCSV):
+    def __init__(self, path):
+        super().__init__(path, COLUMNAS_CSV, cachear=False)
+        self._exportados = {}        # path .ttt -> registros ya convertidos
+        self._tz_local = datetime.now().astimezone().tzinfo
+
+    def reiniciar(self):
+        super().reiniciar()
+        self._exportados = {}
+
+    def sincronizar(self, paths):
+        # Los .ttt solo crecen y la lista de la sesión solo se alarga: alcanza
+        # con recordar cuántos registros de cada uno ya están en el CSV
+        for path in paths:
+            try:
+                archivo = ArchivoCrudo(path)
+            except ValueError as e:
+                logging.warning(f"Exportación CSV: se omite {path} ({e})")   # Sin muestras todavía
+                continue
+            desde = self._exportados.get(path, 0)
+            for inicio in range(desde, len(archivo), FILAS_POR_BLOQUE):
+                bloque = archivo.registros[inicio:inicio + FILAS_POR_BLOQUE]
+                self.agregar_texto(bloque_csv(archivo.a_mm(bloque), self._tz_local), len(bloque))
+            self._exportados[path] = max(desde, len(archivo))
+        return self
+
+
+def _leer_csv(path):
+    with open(path, "rb") as f:
+        datos = f.read()
+    EXPORTACION_LECTURAS.inc()
+    return datos
+
+
+@lru_cache(maxsize=EXPORTACIONES_EN_MEMORIA)
+def _leer_exportacion(path, huella):
+    # La huella identifica el contenido: mientras no cambie, no se vuelve a leer
+    return _leer_csv(path)
+
+
+@lru_cache(maxsize=2)
+def _leer(path, mtime_ns, tamano):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def contenido_archivo(path):
+    # Bytes de un archivo terminado; se vuelven a leer solo si cambia en disco
+    estado = os.stat(path)
+    return _leer(path, estado.st_mtime_ns, estado.st_size)
+
+
+def limpiar_exportaciones(directorio = EXPORTACION_DIR, vigencia_s = VIGENCIA_EXPORTACION_S):
+    # Borra los CSV sin modificar hace más de `vigencia_s` (0: todos); devuelve cuántos
+    limite = datetime.now().timestamp() - vigencia_s
+    borrados = 0
+    if not os.path.isdir(directorio):
+        return borrados
+    for nombre in os.listdir(directorio):
+        path = os.path.join(directorio, nombre)
+        if not nombre.endswith(".csv") or not os.path.isfile(path):
+            continue
+        try:
+            if os.path.getmtime(path) <= limite:
+                os.remove(path)
+                borrados += 1
+        except FileNotFoundError:
+            pass
+    if borrados:
+        logging.info(f"Exportación CSV: {borrados} archivo(s) viejo(s) borrado(s) de {directorio}")
+    return borrados
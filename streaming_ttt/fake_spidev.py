@@ -0,0 +1,103 @@
+import random
+import time
+import logging
+from sensor import (SpiSensor, SPI_CLOCK_HZ, PRODUCT_ID_ADDR, PRODUCT_ID_VAL, STATUS_REG,
+                    REG_X_L, REG_X_H, REG_Y_L, REG_Y_H, MSB_MASK)
+
+# --- CONFIGURACIÓN ---
+OVERHEAD_IOCTL_S = 50e-6   # Costo fijo estimado de un ioctl SPI en la Raspberry Pi
+
+
+class FakeSpiDev:
+    # Reemplazo de spidev.SpiDev que emula los registros del PAT9130.
+    # Cuenta transacciones y bytes, y estima el tiempo de bus que tendrían
+    # en hardware (sin dormir, para no distorsionar las mediciones).
+    def __init__(self, prob_movimiento = 1.0, max_delta = 20, seed = 0, generador = None):
+        self.prob_movimiento = prob_movimiento
+        self.max_delta = max_delta
+        self.generador = generador  # Callable opcional -> (dx, dy) o None si no hay movimiento
+        self._rng = random.Random(seed)
+        self.max_speed_hz = SPI_CLOCK_HZ
+        self.mode = 0
+        self.abierto = False
+        self.registros = {PRODUCT_ID_ADDR: PRODUCT_ID_VAL}
+        self._pendiente = None  # (dx, dy) latcheado al leer STATUS
+        self.transacciones = 0
+        self.bytes_transferidos = 0
+        self.tiempo_bus_s = 0.0
+
+    def open(self, bus, device):
+        self.bus, self.device = bus, device
+        self.abierto = True
+
+    def close(self):
+        self.abierto = False
+
+    def reiniciar_contadores(self):
+        self.transacciones = 0
+        self.bytes_transferidos = 0
+        self.tiempo_bus_s = 0.0
+
+    def xfer2(self, datos):
+        self.transacciones += 1
+        self.bytes_transferidos += len(datos)
+        self.tiempo_bus_s += OVERHEAD_IOCTL_S + len(datos) * 8 / self.max_speed_hz
+        resp = [0] * len(datos)
+        for i in range(0, len(datos) - 1, 2):
+            cmd = datos[i]
+            if cmd & 0x80:
+                self.registros[cmd & 0x7F] = datos[i + 1]
+            else:
+                resp[i + 1] = self._leer(cmd & 0x7F)
+        return resp
+
+    xfer3 = xfer2
+
+    def _siguiente_movimiento(self):
+        if self.generador is not None:
+            return self.generador()
+        if self._rng.random() >= self.prob_movimiento:
+            return None
+        return (self._rng.randint(-self.max_delta, self.max_delta),
+                self._rng.randint(-self.max_delta, self.max_delta))
+
+    def _leer(self, addr):
+        if addr == STATUS_REG:
+            if self._pendiente is None:
+                self._pendiente = self._siguiente_movimiento()
+            return MSB_MASK if self._pendiente is not None else 0x00
+        if addr in (REG_X_L, REG_X_H, REG_Y_L, REG_Y_H):
+            dx, dy = self._pendiente if self._pendiente is not None else (0, 0)
+            valor = {REG_X_L: dx & 0xFF, REG_X_H: (dx >> 8) & 0xFF,
+                     REG_Y_L: dy & 0xFF, REG_Y_H: (dy >> 8) & 0xFF}[addr]
+            if addr == REG_Y_H:
+                self._pendiente = None  # Leer el último registro libera el reporte
+            return valor
+        return self.registros.get(addr, 0x00)
+
+
+def benchmark_lecturas(n_muestras = 20_000):
+    # Transacciones y tiempo por muestra de cada camino de lectura
+    resultados = {}
+    for nombre, burst in (("registros", False), ("burst", True)):
+        fake = FakeSpiDev()
+        sensor = SpiSensor(spi=fake, burst=burst)
+        leidas = 0
+        t0 = time.perf_counter()
+        while leidas < n_muestras:
+            sensor.read_sensor(timeout=0)
+            leidas += 1
+        dt = time.perf_counter() - t0
+        resultados[nombre] = {
+            "transacciones_por_muestra": fake.transacciones / leidas,
+            "us_por_muestra_python": dt / leidas * 1e6,
+            "us_por_muestra_bus_estimado": fake.tiempo_bus_s / leidas * 1e6,
+        }
+    return resultados
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.WARNING)
+    for nombre, r in benchmark_lecturas().items():
+        print(f"{nombre:10s} | {r['transacciones_por_muestra']:.3f} xfer/muestra | "
+              f"{r['us_por_muestra_python']:.1f} us Python | {r['us_por_muestra_bus_estimado']:.1f} us bus (estimado)")
@@ -0,0 +1,163 @@
+import time
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from acquisition import FRECUENCIA_HZ
+from metrics import FILTRO_BLOQUE, FILTRO_RECHAZADAS
+
+# Filtrado por bloques de los deltas crudos del sensor (en cuentas), antes de
+# acumular y comparar contra umbrales:
+#   1. Hampel causal sobre la velocidad: cada delta, normalizado al período
+#      nominal (el sensor acumula todo el movimiento desde la lectura anterior,
+#      así que un ciclo atrasado trae un delta más grande sin ser espurio), se
+#      compara con la mediana de las últimas `ventana` muestras con movimiento;
+#      si se aparta más de `n_sigmas` desvíos robustos (1.4826 * MAD) se
+#      reemplaza por la mediana. Descarta lecturas espurias aisladas (glitches
+#      del SPI, polvo en la lente) sin tocar el movimiento real.
+#   2. Suavizado exponencial opcional (constante de tiempo `tau_s`), de
+#      ganancia unitaria: la suma de los deltas converge a la del crudo.
+# Las muestras sin movimiento (timeout de lectura, ver BufferCircular.movimiento)
+# pasan como 0 y no entran en la ventana de Hampel: un reposo largo no colapsa
+# el MAD ni convierte el arranque del enrosque en un outlier.
+# El estado (ventana y salida del suavizado) se conserva entre bloques, así el
+# resultado no depende de cómo se partió el flujo: en vivo y en un replay da lo mismo.
+
+# --- CONFIGURACIÓN ---
+VENTANA_HAMPEL = 7
+SIGMAS_HAMPEL = 4.0
+MAD_MINIMO = 4.0            # Cuentas; piso del desvío robusto (deltas casi constantes)
+ESCALA_MAD = 1.4826         # MAD -> desvío estándar para ruido gaussiano
+TAU_SUAVIZADO_S = 0.0       # 0 = sin suavizado
+PERIODO_S = 1.0 / FRECUENCIA_HZ   # Período nominal de muestreo
+MAX_EXPONENTE = 300.0       # log(1e300 / 1): el suavizado se evalúa en tramos sin overflow
+
+
+class FiltroHampel:
+    def __init__(self, ventana = VENTANA_HAMPEL, n_sigmas = SIGMAS_HAMPEL, mad_minimo = MAD_MINIMO):
+        if ventana < 3:
+            raise ValueError(f"La ventana de Hampel debe ser de al menos 3 muestras: {ventana}")
+        self.ventana = ventana
+        self.n_sigmas = n_sigmas
+        self.mad_minimo = mad_minimo
+        self.reiniciar()
+
+    def reiniciar(self):
+        self._historia = np.empty((0, 2), dtype=np.float64)   # Últimas ventana-1 velocidades con movimiento (crudas)
+
+    def procesar(self, d):
+        # d: (n, 2) velocidades [cuentas/período] con movimiento. Devuelve (filtradas, máscara de rechazadas)
+        serie = np.concatenate((self._historia, d))
+        self._historia = serie[-(self.ventana - 1):]
+        salida = d.copy()
+        rechazados = np.zeros(len(d), dtype=bool)
+        n_ventanas = len(serie) - self.ventana + 1
+        if n_ventanas <= 0:
+            return salida, rechazados   # Arranque: todavía no hay ventana completa
+        # (n_ventanas, 2, ventana): la ventana k termina en la muestra k + ventana - 1 de la serie
+        ventanas = sliding_window_view(serie, self.ventana, axis=0)
+        mediana = np.median(ventanas, axis=-1)
+        mad = np.median(np.abs(ventanas - mediana[..., None]), axis=-1)
+        umbral = self.n_sigmas * ESCALA_MAD * np.maximum(mad, self.mad_minimo)
+
+        actuales = min(n_ventanas, len(d))   # Las primeras del bloque pueden no tener ventana (arranque)
+        mediana, umbral = mediana[-actuales:], umbral[-actuales:]
+        cola = salida[-actuales:]
+        fuera = np.abs(cola - mediana) > umbral
+        cola[fuera] = mediana[fuera]
+        rechazados[-actuales:] = fuera.any(axis=1)
+        return salida, rechazados
+
+
+class SuavizadorExponencial:
+    # y[k] = y[k-1] + a * (x[k] - y[k-1]), con a = periodo / (tau + periodo).
+    # Vectorizado: y[k] = b^(k+1) * (y[-1] + a * sum_j b^-(j+1) x[j]), con b = 1 - a,
+    # evaluado en tramos cortos para que b^-k no desborde
+    def __init__(self, tau_s = TAU_SUAVIZADO_S, periodo_s = PERIODO_S):
+        self.tau_s = tau_s
+        self.periodo_s = periodo_s
+        self.alfa = periodo_s / (tau_s + periodo_s) if tau_s > 0 else 1.0
+        b = 1.0 - self.alfa
+        self._tramo = int(max(1, min(4096, MAX_EXPONENTE / -np.log(b)))) if 0 < b < 1 else 4096
+        self.reiniciar()
+
+    def reiniciar(self):
+        self._y = np.zeros(2, dtype=np.float64)
+
+    def procesar(self, d):
+        if self.alfa >= 1.0:
+            return d
+        b = 1.0 - self.alfa
+        salida = np.empty_like(d)
+        for inicio in range(0, len(d), self._tramo):
+            x = d[inicio:inicio + self._tramo]
+            potencias = b ** np.arange(1, len(x) + 1)[:, None]
+            y = potencias * (self._y + self.alfa * np.cumsum(x / potencias, axis=0))
+            salida[inicio:inicio + len(x)] = y
+            self._y = y[-1]
+        return salida
+
+
+class FiltroDeltas:
+    # Etapa completa: Hampel (opcional) + suavizado (opcional) sobre bloques de (dx, dy)
+    def __init__(self, hampel = True, ventana = VENTANA_HAMPEL, n_sigmas = SIGMAS_HAMPEL, mad_minimo = MAD_MINIMO,
+                 tau_s = TAU_SUAVIZADO_S, periodo_s = PERIODO_S):
+        self.hampel = FiltroHampel(ventana, n_sigmas, mad_minimo) if hampel else None
+        self.suavizador = SuavizadorExponencial(tau_s, periodo_s) if tau_s > 0 else None
+        self.periodo_ns = int(periodo_s * 1e9)
+        self._t_prev = None
+        self.procesadas = 0
+        self.rechazadas = 0
+        self.sin_movimiento = 0
+
+    def reiniciar(self):
+        # Al cambiar de fuente: la historia de otro sensor no vale para este
+        self._t_prev = None
+        for etapa in (self.hampel, self.suavizador):
+            if etapa is not None:
+                etapa.reiniciar()
+
+    def procesar(self, t_ns, dx, dy, movimiento = None):
+        # Deltas crudos (cuentas) -> deltas filtrados (cuentas, float64)
+        t0 = time.perf_counter()
+        d = np.column_stack((dx, dy)).astype(np.float64)
+        if len(d) == 0:
+            return d[:, 0], d[:, 1]
+        if movimiento is None:
+            movimiento = np.ones(len(d), dtype=bool)
+        self.procesadas += len(d)
+        self.sin_movimiento += int(len(d) - np.count_nonzero(movimiento))
+        d[~movimiento] = 0.0
+        t_ns = np.asarray(t_ns, dtype=np.int64)
+        if self.hampel is not None and movimiento.any():
+            # Períodos transcurridos desde la lectura anterior (con o sin movimiento).
+            # Mínimo uno: en una lectura adelantada el delta es de pocas cuentas y
+            # normalizarlo solo amplificaría la cuantización
+            dt = np.diff(t_ns, prepend=t_ns[0] - self.periodo_ns if self._t_prev is None else self._t_prev)
+            periodos = np.maximum(dt[movimiento, None] / self.periodo_ns, 1.0)
+            v, rechazados = self.hampel.procesar(d[movimiento] / periodos)
+            d[movimiento] = v * periodos
+            n = int(np.count_nonzero(rechazados))
+            if n:
+                self.rechazadas += n
+                FILTRO_RECHAZADAS.inc(n)
+        self._t_prev = int(t_ns[-1])
+        if self.suavizador is not None:
+            d = self.suavizador.procesar(d)
+        FILTRO_BLOQUE.observe(time.perf_counter() - t0)
+        return d[:, 0], d[:, 1]
+
+    def estadisticas(self):
+        return {"procesadas": self.procesadas, "rechazadas": self.rechazadas, "sin_movimiento": self.sin_movimiento}
+
+
+def filtrar(t_ns, dx, dy, movimiento = None, filas = 65_536, **opciones):
+    # Filtrado de un flujo completo (p. ej. un replay), de a bloques como en vivo
+    filtro = FiltroDeltas(**opciones)
+    partes_x, partes_y = [], []
+    for inicio in range(0, len(dx), filas):
+        fin = inicio + filas
+        fx, fy = filtro.procesar(t_ns[inicio:fin], dx[inicio:fin], dy[inicio:fin], None if movimiento is None else movimiento[inicio:fin])
+        partes_x.append(fx)
+        partes_y.append(fy)
+    if not partes_x:
+        return np.empty(0), np.empty(0)
+    return np.concatenate(partes_x), np.concatenate(partes_y)
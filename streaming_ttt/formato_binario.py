@@ -0,0 +1,223 @@
+import os
+import sys
+import struct
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+# Formato binario de muestras crudas (.ttt): cabecera fija de 64 bytes y
+# registros de tamaño fijo sin padding, legibles sin copia con numpy.memmap.
+#   cabecera: magic, versión, tamaño de cabecera, factor_x, factor_y [µm/cuenta],
+#             id del sensor, t0 (ns desde epoch de la primera muestra)
+#   registro: t_ns int64 (ns desde t0), dx/dy int16 (cuentas crudas del sensor),
+#             x/y float32 (acumulados de la conexión en mm)
+# 20 bytes por muestra contra ~60 del CSV, y el timestamp conserva la fecha.
+
+# --- CONFIGURACIÓN ---
+MAGIC = b"TTTRAW\x00\x00"
+VERSION = 1
+EXTENSION = ".ttt"
+CABECERA = struct.Struct("<8sHHdd16sq12x")
+DTYPE_REGISTRO = np.dtype([("t_ns", "<i8"), ("dx", "<i2"), ("dy", "<i2"), ("x", "<f4"), ("y", "<f4")])
+FILAS_POR_BLOQUE = 1 << 20            # ~20 MB por bloque al recorrer archivos grandes
+COLUMNAS_CSV = ["timestamp", "dx_mm", "dy_mm", "x_mm", "y_mm", "desp_total"]
+FORMATO_TS = "%Y-%m-%d %H:%M:%S.%f"
+INT16_MIN, INT16_MAX = -(1 << 15), (1 << 15) - 1
+
+
+class EscritorCrudo:
+    # Agrega bloques de muestras a un archivo .ttt. La cabecera se escribe al
+    # abrir; t0 es el timestamp de la primera muestra (o el indicado)
+    def __init__(self, path, factor_x, factor_y = None, sensor_id = "", t0_ns = None):
+        self.path = path
+        self.factor_x = float(factor_x)
+        self.factor_y = float(factor_x if factor_y is None else factor_y)
+        self.sensor_id = sensor_id
+        self.t0_ns = t0_ns
+        self.registros = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._archivo = open(path, "wb")
+        if t0_ns is not None:
+            self._escribir_cabecera()
+
+    def _escribir_cabecera(self):
+        self._archivo.write(CABECERA.pack(MAGIC, VERSION, CABECERA.size, self.factor_x, self.factor_y,
+                                          self.sensor_id.encode("ascii", "replace")[:16], self.t0_ns))
+
+    def agregar(self, t_ns, dx, dy, x, y):
+        # t_ns en ns desde epoch (como BufferCircular); dx/dy en cuentas; x/y en mm
+        t_ns = np.asarray(t_ns, dtype=np.int64)
+        if len(t_ns) == 0:
+            return
+        if self.t0_ns is None:
+            self.t0_ns = int(t_ns[0])
+            self._escribir_cabecera()
+        registros = np.empty(len(t_ns), dtype=DTYPE_REGISTRO)
+        registros["t_ns"] = t_ns - self.t0_ns
+        registros["dx"] = np.clip(dx, INT16_MIN, INT16_MAX)
+        registros["dy"] = np.clip(dy, INT16_MIN, INT16_MAX)
+        registros["x"] = x
+        registros["y"] = y
+        self._archivo.write(registros.tobytes())
+        self.registros += len(registros)
+
+    def flush(self, fsync = False):
+        self._archivo.flush()
+        if fsync:
+            os.fsync(self._archivo.fileno())
+
+    def cerrar(self):
+        if self.t0_ns is None:
+            self.t0_ns = 0
+            self._escribir_cabecera()
+        self._archivo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+class ArchivoCrudo:
+    # Lectura sin copia: `registros` es un memmap de solo lectura sobre el
+    # archivo. Un registro incompleto al final (corte durante la escritura) se ignora.
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            crudo = f.read(CABECERA.size)
+        if len(crudo) < CABECERA.size:
+            raise ValueError(f"{path}: archivo sin cabecera completa")
+        magic, version, tam_cabecera, factor_x, factor_y, sensor_id, t0_ns = CABECERA.unpack(crudo)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: no es un archivo {EXTENSION}")
+        if version > VERSION:
+            raise ValueError(f"{path}: versión {version} no soportada (máximo {VERSION})")
+        self.version = version
+        self.factor_x, self.factor_y = factor_x, factor_y
+        self.sensor_id = sensor_id.rstrip(b"\x00").decode("ascii", "replace")
+        self.t0_ns = t0_ns
+        n = (os.path.getsize(path) - tam_cabecera) // DTYPE_REGISTRO.itemsize
+        if n > 0:
+            self.registros = np.memmap(path, dtype=DTYPE_REGISTRO, mode="r", offset=tam_cabecera, shape=(n,))
+        else:
+            self.registros = np.empty(0, dtype=DTYPE_REGISTRO)
+
+    def __len__(self):
+        return len(self.registros)
+
+    def cabecera(self):
+        return {"version": self.version, "factor_x": self.factor_x, "factor_y": self.factor_y,
+                "sensor_id": self.sensor_id, "t0_ns": self.t0_ns, "muestras": len(self)}
+
+    def bloques(self, filas = FILAS_POR_BLOQUE):
+        # Vistas consecutivas del memmap: memoria acotada sin importar el tamaño del archivo
+        for inicio in range(0, len(self.registros), filas):
+            yield self.registros[inicio:inicio + filas]
+
+    def a_mm(self, bloque):
+        # Bloque de registros -> columnas de `datos` (timestamp en ns desde epoch)
+        x = bloque["x"].astype(np.float64)
+        y = bloque["y"].astype(np.float64)
+        return {
+            "timestamp": bloque["t_ns"] + self.t0_ns,
+            "dx_mm": bloque["dx"] * self.factor_x / 1000.0,
+            "dy_mm": bloque["dy"] * self.factor_y / 1000.0,
+            "x_mm": x,
+            "y_mm": y,
+            "desp_total": np.round(np.hypot(x, y), 3),
+        }
+
+
+def abrir(paths):
+    return [ArchivoCrudo(p) for p in ([paths] if isinstance(paths, str) else paths)]
+
+
+def recorrer(paths, filas = FILAS_POR_BLOQUE):
+    # Recorre uno o varios archivos (p. ej. las partes de una campaña) en bloques en mm
+    for archivo in abrir(paths):
+        for bloque in archivo.bloques(filas):
+            yield archivo.a_mm(bloque)
+
+
+def histograma(paths, columna = "desp_total", bins = 100, rango = None):
+    # Histograma por bloques; sin rango se hace una primera pasada para min/max
+    if rango is None:
+        minimo, maximo = np.inf, -np.inf
+        for bloque in recorrer(paths):
+            if len(bloque[columna]):
+                minimo, maximo = min(minimo, bloque[columna].min()), max(maximo, bloque[columna].max())
+        rango = (minimo, maximo) if minimo <= maximo else (0.0, 1.0)
+    cuentas = np.zeros(bins, dtype=np.int64)
+    for bloque in recorrer(paths):
+        c, bordes = np.histogram(bloque[columna], bins=bins, range=rango)
+        cuentas += c
+    return cuentas, np.linspace(rango[0], rango[1], bins + 1)
+
+
+def estadisticas(paths, columna = "desp_total"):
+    n, suma, suma2, minimo, maximo = 0, 0.0, 0.0, np.inf, -np.inf
+    for bloque in recorrer(paths):
+        v = bloque[columna].astype(np.float64)
+        if len(v) == 0:
+            continue
+        n += len(v)
+        suma += v.sum()
+        suma2 += np.square(v).sum()
+        minimo, maximo = min(minimo, v.min()), max(maximo, v.max())
+    if n == 0:
+        return {"muestras": 0, "media": np.nan, "desvio": np.nan, "min": np.nan, "max": np.nan}
+    media = suma / n
+    return {"muestras": n, "media": float(media), "desvio": float(np.sqrt(max(suma2 / n - media ** 2, 0.0))),
+            "min": float(minimo), "max": float(maximo)}
+
+
+def bloque_csv(columnas, tz_local = None):
+    # Columnas en mm (ArchivoCrudo.a_mm) -> filas CSV sin encabezado, hora local a ms
+    tz_local = tz_local or datetime.now().astimezone().tzinfo
+    df = pd.DataFrame(columnas)
+    df["timestamp"] = pd.to_datetime(df["timestamp"], unit="ns", utc=True).dt.tz_convert(tz_local).dt.strftime(FORMATO_TS).str[:-3]
+    return df.to_csv(header=False, index=False)
+
+
+def iterar_csv(paths, filas = 65_536):
+    # Conversión perezosa a CSV: devuelve el texto de a bloques (para escribir
+    # en disco o servir en streaming) sin materializar el archivo completo
+    yield ",".join(COLUMNAS_CSV) + "\n"
+    tz_local = datetime.now().astimezone().tzinfo
+    for columnas in recorrer(paths, filas):
+        yield bloque_csv(columnas, tz_local)
+
+
+def exportar_csv(paths, destino):
+    tmp = destino + ".tmp"
+    with open(tmp, "w", newline="", encoding="utf-8") as f:
+        for texto in iterar_csv(paths):
+            f.write(texto)
+    os.replace(tmp, destino)
+    return destino
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=f"Inspección y conversión de archivos {EXTENSION}")
+    parser.add_argument("accion", choices=("info", "csv", "hist"))
+    parser.add_argument("archivos", nargs="+")
+    parser.add_argument("--salida", help="CSV de salida (accion csv)")
+    parser.add_argument("--bins", type=int, default=50)
+    args = parser.parse_args()
+
+    if args.accion == "info":
+        for archivo in abrir(args.archivos):
+            print(archivo.path, archivo.cabecera())
+        print(estadisticas(args.archivos))
+    elif args.accion == "csv":
+        if args.salida:
+            print(f"[OK] Guardado: {exportar_csv(args.archivos, args.salida)}")
+        else:
+            for texto in iterar_csv(args.archivos):
+                sys.stdout.write(texto)
+    else:
+        cuentas, bordes = histograma(args.archivos, bins=args.bins)
+        for c, a, b in zip(cuentas, bordes[:-1], bordes[1:]):
+            print(f"{a:10.3f} - {b:10.3f} | {c}")
@@ -1,42 +1,100 @@
 import os
-import pandas as pd
-import matplotlib.pyplot as plt
-
-def generar_histogramas(df, output_dir) -> None:
-    
-    orden_diametros = ["1", "7/8", "3/4"]
-    
-    df_filtrado = df[~df['comentario'].str.contains("reassembly", case=False, na=False)].copy()
-    df_filtrado['diametro'] = pd.Categorical(df_filtrado['diametro'], categories=orden_diametros, ordered=True)
-    
+import glob
+import json
+import hashlib
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from estadisticas import EstadisticasPozo, BINS_INFORME
+
+# --- CONFIGURACIÓN ---
+ORDEN_DIAMETROS = ["1", "7/8", "3/4"]
+# jpg: la figura de 6 x 4 pulgadas se imprime a 56 mm de ancho (report.css), así que
+# 110 dpi dan ~300 dpi en papel; más resolución solo agranda el PDF
+FORMATOS = {"jpg": {"dpi": 110}, "svg": {}}   # svg: vectorial, WeasyPrint lo embebe sin decodificar rasters
+VERSION_RENDER = 3   # Incrementar al cambiar el estilo del gráfico para invalidar la caché
+MINIMO_POOL = 8      # Grupos a renderizar desde los que conviene un pool: cada proceso
+                     # spawn vuelve a importar matplotlib (~1 s en la Pi) para pocas figuras
+
+
+def _clave_cache(cuentas, bordes, umbral_min, umbral_max, grado, diametro, formato):
+    # Hash del contenido: mismos bins y umbrales -> mismo archivo
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(cuentas, dtype=np.int64).tobytes())
+    h.update(np.ascontiguousarray(bordes, dtype=np.float64).tobytes())
+    h.update(json.dumps([float(umbral_min), float(umbral_max), str(grado), str(diametro), formato, VERSION_RENDER]).encode())
+    return h.hexdigest()[:16]
+
+
+def _renderizar_histograma(cuentas, bordes, umbral_min, umbral_max, grado, diametro, path, formato):
+    # API orientada a objetos de matplotlib: sin estado global de pyplot, apta para procesos en paralelo
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(6, 4))
+    ax = fig.subplots()
+    ax.hist(bordes[:-1], bins=bordes, weights=cuentas, color='steelblue', edgecolor='black', alpha=0.7)
+
+    ax.axvline(umbral_min, color='red', linestyle='--', linewidth=2, label=f'Umbral min ({umbral_min:.2f})')
+    ax.axvline(umbral_max, color='green', linestyle='--', linewidth=2, label=f'Umbral max ({umbral_max:.2f})')
+
+    ax.set_title(f"Histograma - {grado} - Ø {diametro}", fontsize=12, fontweight='bold')
+    ax.set_xlabel("Desplazamiento [mm]", fontsize=10)
+    ax.set_ylabel("Frecuencia", fontsize=10)
+    ax.grid(alpha=0.3)
+    ax.legend(fontsize=8, loc='upper right', frameon=True)
+    fig.tight_layout()
+
+    # Escritura atómica: una regeneración concurrente nunca ve un archivo a medias
+    tmp_path = f"{path}.tmp"
+    fig.savefig(tmp_path, format=formato, bbox_inches='tight', **FORMATOS[formato])
+    os.replace(tmp_path, path)
+    return path
+
+
+def generar_histogramas(df, output_dir, formato = "jpg", max_workers = None, usar_cache = True, estadisticas = None) -> list:
+    # Los histogramas se dibujan con los bins de EstadisticasPozo (los que la
+    # app mantiene conexión a conexión); sin ellos se calculan de `df`
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de histograma no soportado: {formato} (opciones: {', '.join(FORMATOS)})")
+    if estadisticas is None:
+        estadisticas = EstadisticasPozo.desde_resultados(df)
+
     os.makedirs(output_dir, exist_ok=True)
-    
-    grupos = df_filtrado.groupby(['diametro', 'grado_acero'])
-    output_paths=[]
-    
-    for (diametro, grado), grupo in grupos:
-        desplazamientos = grupo['desplazamiento'].astype(float)
-        umbral_min = grupo['umbral_min'].iloc[0]
-        umbral_max = grupo['umbral_max'].iloc[0]
-        
-        plt.figure(figsize=(6, 4))  
-        plt.hist(desplazamientos, bins=10, color='steelblue', edgecolor='black', alpha=0.7)
-        
-        plt.axvline(umbral_min, color='red', linestyle='--', linewidth=2, label=f'Umbral min ({umbral_min:.2f})')
-        plt.axvline(umbral_max, color='green', linestyle='--', linewidth=2, label=f'Umbral max ({umbral_max:.2f})')
-        
-        plt.title(f"Histograma - {grado} - Ø {diametro}", fontsize=12, fontweight='bold')
-        plt.xlabel("Desplazamiento [mm]", fontsize=10)
-        plt.ylabel("Frecuencia", fontsize=10)
-        plt.grid(alpha=0.3)
-        plt.legend(fontsize=8, loc='upper right', frameon=True)
-        plt.tight_layout()
-        
-        filename = f"hist_{grado}_{diametro}.jpg".replace("/", "-")  # evitar conflictos con nombres tipo 3/4
-        path = os.path.join(output_dir, filename)
-        output_paths.append({"titulo": "{grado} {diametro}", "imagen": path})
-        plt.savefig(path, dpi=300, bbox_inches='tight')
-        plt.close()
-        
+
+    # Solo diámetros conocidos, en su orden; las reassembly no entran en los bins
+    grupos = sorted((g for g in estadisticas.grupos.values() if g.n and g.diametro in ORDEN_DIAMETROS),
+                    key=lambda g: (ORDEN_DIAMETROS.index(g.diametro), g.grado_acero))
+    output_paths = []
+    pendientes = []
+
+    for grupo in grupos:
+        diametro, grado = grupo.diametro, grupo.grado_acero
+        cuentas, bordes = grupo.histograma(BINS_INFORME)
+        umbral_min, umbral_max = grupo.umbral_min, grupo.umbral_max
+
+        base = f"hist_{grado}_{diametro}".replace("/", "-")  # evitar conflictos con nombres tipo 3/4
+        clave = _clave_cache(cuentas, bordes, umbral_min, umbral_max, grado, diametro, formato)
+        path = os.path.join(output_dir, f"{base}_{clave}.{formato}")
+        output_paths.append({"titulo": f"{grado} {diametro}", "imagen": path})
+
+        # Borra versiones anteriores del mismo grupo (datos o umbrales distintos)
+        for viejo in glob.glob(os.path.join(glob.escape(output_dir), f"{glob.escape(base)}_*.{formato}")):
+            if viejo != path:
+                os.remove(viejo)
+
+        if usar_cache and os.path.exists(path):
+            print(f"[CACHE] Reutilizado: {path}")
+            continue
+        pendientes.append((cuentas, bordes, umbral_min, umbral_max, grado, diametro, path, formato))
+
+    if len(pendientes) >= MINIMO_POOL and max_workers != 1:
+        # spawn: seguro aunque el proceso que llama tenga hilos (adquisición, Streamlit)
+        contexto = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=contexto) as pool:
+            rutas = list(pool.map(_renderizar_histograma, *zip(*pendientes)))
+    else:
+        rutas = [_renderizar_histograma(*args) for args in pendientes]
+
+    for path in rutas:
         print(f"[OK] Guardado: {path}")
     return output_paths
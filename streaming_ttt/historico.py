@@ -0,0 +1,318 @@
+import os
+import re
+import glob
+import time
+import queue
+import atexit
+import sqlite3
+import logging
+import argparse
+import threading
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from contextlib import contextmanager
+from metrics import REGISTRO, BUCKETS_UI_S
+
+# Histórico de conexiones de todos los pozos en una base SQLite local (un
+# archivo, sin servidor). Cada fila es un resultado de registrar_resultado con
+# el pozo, el número de parte, la sesión y la fecha, así se pueden responder
+# preguntas de flota: p. ej. la distribución de desplazamiento de UHS 7/8 en
+# los últimos 6 meses.
+#   - Escritura: registrar() solo encola; un hilo propio inserta por lotes
+#     (una transacción cada INTERVALO_LOTE_S), fuera del camino de la UI y de
+#     la adquisición. WAL: las consultas no bloquean al escritor ni al revés.
+#   - Consultas: el índice (grado, diámetro, fecha) incluye el desplazamiento y
+#     el comentario, así los agregados y el histograma se resuelven en SQL sin
+#     leer la tabla ni traer las filas a Python.
+#   - consultar() devuelve las mismas columnas que `resultados` en la app:
+#     generar_histogramas y el informe PDF lo consumen directamente.
+#
+#   python historico.py --grado UHS --diametro 7/8 --meses 6
+#   python historico.py --importar data/conexiones --pozo "LP-1234"   (CSV descargados a mano)
+
+# --- CONFIGURACIÓN ---
+HISTORICO_PATH = os.path.join("data", "historico.sqlite")
+INTERVALO_LOTE_S = 0.5       # Máximo de filas en riesgo ante un corte
+FILAS_LOTE = 1000            # Máximo de filas por transacción
+BINS_HISTOGRAMA = 20
+DIAS_POR_MES = 30.44
+COLUMNAS = ("fecha", "pozo", "numero_parte", "sesion", "id_conexion", "grado_acero", "diametro",
+            "umbral_min", "umbral_max", "desplazamiento", "comentario", "sensor")
+TEXTO_VACIO = ("pozo", "numero_parte", "sesion", "comentario")              # NULL -> ''
+COLUMNAS_TEXTO = {"diametro": str, "grado_acero": str, "comentario": str}   # Para --importar: "1" no es un número
+PATRON_FECHA_CSV = re.compile(r"(\d{8}_\d{6})")                              # conexiones_YYYYmmdd_HHMMSS.csv
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS conexiones (
+    id             INTEGER PRIMARY KEY,
+    fecha          REAL    NOT NULL,          -- Epoch [s]
+    pozo           TEXT    NOT NULL DEFAULT '',
+    numero_parte   TEXT    NOT NULL DEFAULT '',
+    sesion         TEXT    NOT NULL DEFAULT '',
+    id_conexion    INTEGER,
+    grado_acero    TEXT    NOT NULL,
+    diametro       TEXT    NOT NULL,
+    umbral_min     REAL,
+    umbral_max     REAL,
+    desplazamiento REAL    NOT NULL,
+    comentario     TEXT    NOT NULL DEFAULT '',
+    sensor         TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_conexiones_grado_diametro_fecha
+    ON conexiones (grado_acero, diametro, fecha, desplazamiento, comentario);
+CREATE INDEX IF NOT EXISTS ix_conexiones_pozo_fecha ON conexiones (pozo, fecha);
+CREATE INDEX IF NOT EXISTS ix_conexiones_fecha ON conexiones (fecha);
+"""
+
+HISTORICO_LOTE = REGISTRO.histograma("ttt_historico_lote_segundos", "Duración de cada transacción de inserción en el histórico", BUCKETS_UI_S)
+HISTORICO_FILAS = REGISTRO.contador("ttt_historico_filas_total", "Conexiones guardadas en el histórico")
+
+
+def a_epoch(fecha):
+    # datetime, Timestamp, 'YYYY-mm-dd[ HH:MM]' (hora local) o epoch -> epoch [s]
+    if fecha is None or isinstance(fecha, (int, float)):
+        return fecha
+    if isinstance(fecha, str):
+        fecha = datetime.fromisoformat(fecha)
+    return fecha.timestamp()
+
+
+class HistoricoConexiones:
+    def __init__(self, path = HISTORICO_PATH, intervalo_s = INTERVALO_LOTE_S):
+        self.path = path
+        self.intervalo_s = intervalo_s
+        directorio = os.path.dirname(path)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with self._conectar() as con:
+            con.execute("PRAGMA journal_mode=WAL")   # Persistente: queda en el archivo
+            con.executescript(ESQUEMA)
+        self.escritas = 0
+        self._cola = queue.Queue()
+        self._hilo = threading.Thread(target=self._escribir, name="historico", daemon=True)
+        self._hilo.start()
+        atexit.register(self.cerrar)
+
+    @contextmanager
+    def _conectar(self):
+        # Una conexión por operación (commit al salir): Streamlit ejecuta cada
+        # rerun en otro hilo y sqlite3 no comparte conexiones entre hilos
+        con = sqlite3.connect(self.path, timeout=30)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    # ---- Escritura (hilo de la UI): solo encola ----
+    def registrar(self, fecha = None, **fila):
+        fila["fecha"] = time.time() if fecha is None else a_epoch(fecha)
+        self._cola.put(_fila_sql(fila.get(c) for c in COLUMNAS))
+
+    def registrar_dataframe(self, df, **comunes):
+        # Carga masiva (importación de CSV viejos): mismas columnas que `resultados`
+        df = df.assign(**comunes)
+        if "fecha" not in df.columns:
+            df["fecha"] = time.time()
+        df["fecha"] = [a_epoch(f) for f in df["fecha"]]
+        df = df.reindex(columns=list(COLUMNAS))
+        filas = [_fila_sql(fila) for fila in df.itertuples(index=False, name=None)]
+        self._insertar(filas)
+
+    def esperar(self, timeout = 10.0):
+        # Hasta que todo lo encolado esté en disco (p. ej. antes de consultar en un test o en la CLI)
+        limite = time.monotonic() + timeout
+        while self._cola.unfinished_tasks and time.monotonic() < limite:
+            time.sleep(0.01)
+
+    def cerrar(self):
+        if self._hilo.is_alive():
+            self._cola.put(None)
+            self._hilo.join(5)
+
+    # ---- Hilo escritor ----
+    def _insertar(self, filas):
+        t0 = time.perf_counter()
+        with self._conectar() as con:   # Una transacción por lote
+            con.execute("PRAGMA synchronous=NORMAL")
+            con.executemany(f"INSERT INTO conexiones ({', '.join(COLUMNAS)}) VALUES ({', '.join('?' * len(COLUMNAS))})", filas)
+        self.escritas += len(filas)
+        HISTORICO_FILAS.inc(len(filas))
+        HISTORICO_LOTE.observe(time.perf_counter() - t0)
+
+    def _escribir(self):
+        terminar = False
+        while not terminar:
+            fila = self._cola.get()
+            lote = []
+            limite = time.monotonic() + self.intervalo_s
+            # Junta lo que llegue durante el intervalo (o hasta FILAS_LOTE) en una transacción
+            while fila is not None:
+                lote.append(fila)
+                if len(lote) >= FILAS_LOTE:
+                    break
+                try:
+                    fila = self._cola.get(timeout=max(0.0, limite - time.monotonic()))
+                except queue.Empty:
+                    break
+            terminar = fila is None
+            try:
+                if lote:
+                    self._insertar(lote)
+            except sqlite3.Error as e:
+                logging.error(f"Error escribiendo el histórico {self.path} ({len(lote)} conexiones): {e}")
+            for _ in range(len(lote) + terminar):
+                self._cola.task_done()
+
+    # ---- Consultas ----
+    def _filtro(self, grado = None, diametro = None, desde = None, hasta = None, pozo = None, reassembly = False):
+        condiciones, parametros = [], []
+        for columna, valor in (("grado_acero", grado), ("diametro", diametro), ("pozo", pozo)):
+            if valor is not None:
+                condiciones.append(f"{columna} = ?")
+                parametros.append(str(valor).strip())
+        if desde is not None:
+            condiciones.append("fecha >= ?")
+            parametros.append(a_epoch(desde))
+        if hasta is not None:
+            condiciones.append("fecha < ?")
+            parametros.append(a_epoch(hasta))
+        if not reassembly:
+            # Igual que en generar_histogramas: las reassembly no cuentan para la distribución
+            condiciones.append("comentario NOT LIKE '%reassembly%'")
+        return (" WHERE " + " AND ".join(condiciones)) if condiciones else "", parametros
+
+    def consultar(self, columnas = COLUMNAS, **filtro):
+        # Filas que cumplen el filtro, ordenadas por fecha (mismas columnas que `resultados`)
+        donde, parametros = self._filtro(**filtro)
+        with self._conectar() as con:
+            df = pd.read_sql_query(f"SELECT {', '.join(columnas)} FROM conexiones{donde} ORDER BY fecha", con, params=parametros)
+        if "fecha" in df.columns:
+            df["fecha"] = pd.to_datetime(df["fecha"], unit="s", utc=True).dt.tz_convert(datetime.now().astimezone().tzinfo)
+        return df
+
+    def resumen(self, **filtro):
+        # Agregados por (grado, diámetro): cantidad, media, desvío, extremos y fracción OK
+        donde, parametros = self._filtro(**filtro)
+        with self._conectar() as con:
+            df = pd.read_sql_query(
+                "SELECT grado_acero, diametro, COUNT(*) AS cantidad, AVG(desplazamiento) AS media, "
+                "AVG(desplazamiento * desplazamiento) AS media_cuadrados, MIN(desplazamiento) AS minimo, "
+                "MAX(desplazamiento) AS maximo, AVG(comentario = 'OK') AS fraccion_ok, "
+                "MIN(fecha) AS desde, MAX(fecha) AS hasta "
+                f"FROM conexiones{donde} GROUP BY grado_acero, diametro ORDER BY grado_acero, diametro", con, params=parametros)
+        n = df["cantidad"]
+        varianza = (df.pop("media_cuadrados") - df["media"] ** 2) * n / (n - 1).where(n > 1)
+        df.insert(4, "desvio", np.sqrt(varianza.clip(lower=0)))
+        for columna in ("desde", "hasta"):
+            df[columna] = pd.to_datetime(df[columna], unit="s", utc=True).dt.tz_convert(datetime.now().astimezone().tzinfo)
+        return df
+
+    def histograma(self, bins = BINS_HISTOGRAMA, rango = None, **filtro):
+        # Como np.histogram, pero contado en SQL: (cuentas, bordes)
+        donde, parametros = self._filtro(**filtro)
+        with self._conectar() as con:
+            if rango is None:
+                rango = con.execute(f"SELECT MIN(desplazamiento), MAX(desplazamiento) FROM conexiones{donde}", parametros).fetchone()
+            if rango[0] is None:
+                return np.zeros(bins, dtype=np.int64), np.linspace(0.0, 1.0, bins + 1)
+            minimo, maximo = float(rango[0]), float(rango[1])
+            if maximo <= minimo:
+                minimo, maximo = minimo - 0.5, maximo + 0.5   # Mismo criterio que np.histogram con un único valor
+            ancho = (maximo - minimo) / bins
+            rango_sql = "desplazamiento >= ? AND desplazamiento <= ?"
+            filas = con.execute(
+                f"SELECT MIN(CAST((desplazamiento - ?) / ? AS INTEGER), ?) AS bin, COUNT(*) FROM conexiones"
+                f"{donde + ' AND ' if donde else ' WHERE '}{rango_sql} GROUP BY bin",
+                [minimo, ancho, bins - 1] + parametros + [minimo, maximo]).fetchall()
+        cuentas = np.zeros(bins, dtype=np.int64)
+        for i, n in filas:
+            cuentas[i] = n
+        return cuentas, np.linspace(minimo, maximo, bins + 1)
+
+    def combinaciones(self):
+        # (grado, diámetro) con datos, para los selectores de la UI
+        with self._conectar() as con:
+            filas = con.execute("SELECT DISTINCT grado_acero, diametro FROM conexiones ORDER BY grado_acero, diametro").fetchall()
+        return filas
+
+    def cantidad(self):
+        with self._conectar() as con:
+            n = con.execute("SELECT COUNT(*) FROM conexiones").fetchone()[0]
+        return n
+
+
+def _fila_sql(valores):
+    # numpy -> tipos de Python; NaN (umbral faltante) -> NULL; texto faltante -> ''
+    fila = []
+    for columna, valor in zip(COLUMNAS, valores):
+        if isinstance(valor, np.generic):
+            valor = valor.item()
+        if isinstance(valor, float) and np.isnan(valor):
+            valor = None
+        if valor is None and columna in TEXTO_VACIO:
+            valor = ""
+        fila.append(valor)
+    return tuple(fila)
+
+
+def importar_csv(historico, archivos, **comunes):
+    # CSV conexiones_*.csv descargados de la app: la fecha sale del nombre (o del mtime)
+    total = 0
+    for path in archivos:
+        df = pd.read_csv(path, dtype=COLUMNAS_TEXTO)
+        coincidencia = PATRON_FECHA_CSV.search(os.path.basename(path))
+        fecha = datetime.strptime(coincidencia.group(1), "%Y%m%d_%H%M%S") if coincidencia else datetime.fromtimestamp(os.path.getmtime(path))
+        historico.registrar_dataframe(df, fecha=fecha, sesion=os.path.splitext(os.path.basename(path))[0], **comunes)
+        total += len(df)
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Consultas sobre el histórico de conexiones de todos los pozos")
+    parser.add_argument("--base", default=HISTORICO_PATH)
+    parser.add_argument("--grado")
+    parser.add_argument("--diametro")
+    parser.add_argument("--pozo")
+    parser.add_argument("--meses", type=float, help="solo los últimos N meses")
+    parser.add_argument("--desde", help="YYYY-mm-dd (hora local)")
+    parser.add_argument("--hasta", help="YYYY-mm-dd (hora local, excluido)")
+    parser.add_argument("--bins", type=int, default=BINS_HISTOGRAMA)
+    parser.add_argument("--histogramas", metavar="DIR", help="genera los histogramas (como en el informe) en DIR")
+    parser.add_argument("--importar", nargs="+", metavar="CSV", help="carga conexiones_*.csv (archivos o directorios)")
+    parser.add_argument("--numero-parte", default="", help="número de parte de los CSV importados")
+    args = parser.parse_args()
+
+    historico = HistoricoConexiones(args.base)
+    if args.importar:
+        archivos = []
+        for entrada in args.importar:
+            archivos += sorted(glob.glob(os.path.join(entrada, "conexiones_*.csv"))) if os.path.isdir(entrada) else [entrada]
+        n = importar_csv(historico, archivos, pozo=args.pozo or "", numero_parte=args.numero_parte)
+        print(f"[OK] {n} conexiones importadas de {len(archivos)} archivos")
+        historico.cerrar()
+        raise SystemExit(0)
+
+    desde = time.time() - args.meses * DIAS_POR_MES * 86400 if args.meses else args.desde
+    filtro = dict(grado=args.grado, diametro=args.diametro, pozo=args.pozo, desde=desde, hasta=args.hasta)
+    t0 = time.perf_counter()
+    resumen = historico.resumen(**filtro)
+    t_resumen = time.perf_counter() - t0
+    print(f"Histórico {args.base}: {historico.cantidad()} conexiones")
+    print(resumen.to_string(index=False) if len(resumen) else "Sin conexiones para el filtro")
+    print(f"(resumen en {t_resumen * 1000:.0f} ms)")
+
+    if args.grado and args.diametro:
+        t0 = time.perf_counter()
+        cuentas, bordes = historico.histograma(args.bins, **filtro)
+        t_histo = time.perf_counter() - t0
+        escala = 50 / max(1, cuentas.max())
+        for n, izq, der in zip(cuentas, bordes[:-1], bordes[1:]):
+            print(f"  {izq:7.3f} - {der:7.3f} mm {n:8d} {'#' * int(round(n * escala))}")
+        print(f"(histograma en {t_histo * 1000:.0f} ms)")
+
+    if args.histogramas:
+        from histograms import generar_histogramas
+        rutas = generar_histogramas(historico.consultar(**filtro), args.histogramas)
+        print(f"[OK] {len(rutas)} histogramas en {args.histogramas}")
@@ -0,0 +1,229 @@
+import os
+import json
+import time
+import fcntl
+import queue
+import atexit
+import logging
+import threading
+import numpy as np
+from datetime import datetime
+
+# Bitácora append-only de una sesión de medición (un pozo), para sobrevivir a
+# un refresh del navegador, un reinicio de Streamlit o un corte de energía:
+#   muestras.bin     registros binarios de tamaño fijo (columnas de `datos`)
+#   eventos.jsonl    resultados y cambios de estado, un JSON por línea
+#   checkpoint.json  estado completo + offsets de eventos.jsonl (reemplazo atómico)
+# Las escrituras las hace un hilo propio con fsync por lotes, así ni la UI ni
+# la adquisición esperan al disco. Al recuperar se carga el checkpoint y solo
+# se reproducen los eventos posteriores: el tiempo de recuperación no depende
+# de cuánto duró el pozo (las muestras se leen de una vez, sin parsear).
+# Un solo escritor por sesión: Journal toma un flock exclusivo sobre `bloqueo`
+# mientras está abierto; otra instancia (otra pestaña, otro proceso) recibe
+# JournalOcupado en lugar de escribir los mismos archivos o repararlos en uso.
+
+# --- CONFIGURACIÓN ---
+JOURNAL_DIR = os.path.join("data", "journal")
+ARCHIVO_ACTIVO = "activo"            # Nombre de la sesión en curso dentro de JOURNAL_DIR
+INTERVALO_FSYNC_S = 0.5              # Máximo de datos en riesgo ante un corte
+INTERVALO_CHECKPOINT_S = 30.0
+MUESTRAS, EVENTOS, CHECKPOINT = "muestras.bin", "eventos.jsonl", "checkpoint.json"
+BLOQUEO = "bloqueo"
+
+
+class JournalOcupado(RuntimeError):
+    pass
+
+
+def _json_default(valor):
+    if isinstance(valor, np.generic):
+        return valor.item()
+    if isinstance(valor, np.ndarray):
+        return valor.tolist()
+    raise TypeError(f"No serializable: {type(valor).__name__}")
+
+
+def _escribir_atomico(path, texto):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(texto)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def dtype_muestras(columnas):
+    # Registro binario a partir de las columnas de AlmacenColumnar
+    return np.dtype([(nombre, np.dtype(tipo)) for nombre, tipo in columnas.items()])
+
+
+class Journal:
+    def __init__(self, path, columnas):
+        self.path = path
+        self.dtype = dtype_muestras(columnas)
+        os.makedirs(path, exist_ok=True)
+        self._bloqueo = open(os.path.join(path, BLOQUEO), "a")
+        try:
+            fcntl.flock(self._bloqueo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._bloqueo.close()
+            raise JournalOcupado(f"La sesión {path} ya está abierta por otro escritor") from None
+        self.abierto = True
+        self._reparar()
+        self._muestras = open(os.path.join(path, MUESTRAS), "ab")
+        self._eventos = open(os.path.join(path, EVENTOS), "ab")
+        self._cola = queue.Queue()
+        self._ultimo_checkpoint = time.monotonic()
+        self._hilo = threading.Thread(target=self._escribir, name="journal", daemon=True)
+        self._hilo.start()
+        atexit.register(self.cerrar)
+
+    @classmethod
+    def nueva(cls, columnas, base = JOURNAL_DIR):
+        nombre = f"sesion_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        journal = cls(os.path.join(base, nombre), columnas)
+        _escribir_atomico(os.path.join(base, ARCHIVO_ACTIVO), nombre)
+        logging.info(f"Journal de sesión iniciado en {journal.path}")
+        return journal
+
+    def _reparar(self):
+        # Descarta una cola a medio escribir (corte durante un write) antes de seguir agregando
+        path = os.path.join(self.path, MUESTRAS)
+        if os.path.exists(path):
+            tam = os.path.getsize(path)
+            if tam % self.dtype.itemsize:
+                os.truncate(path, tam - tam % self.dtype.itemsize)
+        path = os.path.join(self.path, EVENTOS)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                contenido = f.read()
+            valido = contenido.rfind(b"\n") + 1
+            if valido != len(contenido):
+                os.truncate(path, valido)
+
+    # ---- API (hilo de la UI): solo encola ----
+    def agregar_muestras(self, **bloque):
+        registros = np.empty(len(next(iter(bloque.values()))), dtype=self.dtype)
+        for nombre in self.dtype.names:
+            registros[nombre] = bloque[nombre]
+        self._cola.put(("muestras", registros.tobytes()))
+
+    def registrar(self, tipo, **datos):
+        linea = json.dumps({"tipo": tipo, "t": time.time(), **datos}, default=_json_default) + "\n"
+        self._cola.put(("evento", linea.encode("utf-8")))
+
+    def checkpoint(self, estado):
+        # `estado` debe ser el estado completo (ver recuperar); se guarda junto
+        # con el offset de eventos.jsonl hasta el que ya está incluido
+        self._ultimo_checkpoint = time.monotonic()
+        self._cola.put(("checkpoint", json.dumps(estado, default=_json_default)))
+
+    def checkpoint_vencido(self):
+        return time.monotonic() - self._ultimo_checkpoint >= INTERVALO_CHECKPOINT_S
+
+    def cerrar(self, finalizar = False):
+        # También la llama otra sesión que toma el control: `abierto` queda en False
+        if self._hilo.is_alive():
+            self._cola.put(None)
+            self._hilo.join(5)
+        if self.abierto:
+            self.abierto = False
+            self._bloqueo.close()    # Libera el flock
+            atexit.unregister(self.cerrar)
+        if finalizar:
+            activo = os.path.join(os.path.dirname(self.path), ARCHIVO_ACTIVO)
+            if sesion_activa(os.path.dirname(self.path)) == self.path:
+                os.remove(activo)
+
+    # ---- Hilo escritor ----
+    def _sincronizar(self):
+        for f in (self._muestras, self._eventos):
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _escribir(self):
+        ultimo_fsync = time.monotonic()
+        pendiente = False
+        while True:
+            try:
+                mensaje = self._cola.get(timeout=INTERVALO_FSYNC_S)
+            except queue.Empty:
+                mensaje = ()
+            if mensaje is None:
+                break
+            try:
+                if mensaje:
+                    tipo, contenido = mensaje
+                    if tipo == "muestras":
+                        self._muestras.write(contenido)
+                    elif tipo == "evento":
+                        self._eventos.write(contenido)
+                    else:
+                        self._sincronizar()
+                        offsets = {"eventos": self._eventos.tell(), "muestras": self._muestras.tell() // self.dtype.itemsize}
+                        _escribir_atomico(os.path.join(self.path, CHECKPOINT),
+                                          f'{{"offsets": {json.dumps(offsets)}, "estado": {contenido}}}')
+                    pendiente = True
+                if pendiente and time.monotonic() - ultimo_fsync >= INTERVALO_FSYNC_S:
+                    self._sincronizar()
+                    ultimo_fsync, pendiente = time.monotonic(), False
+            except OSError as e:
+                logging.error(f"Error escribiendo el journal {self.path}: {e}")
+        self._sincronizar()
+        self._muestras.close()
+        self._eventos.close()
+
+
+def sesion_activa(base = JOURNAL_DIR):
+    try:
+        with open(os.path.join(base, ARCHIVO_ACTIVO), encoding="utf-8") as f:
+            nombre = f.read().strip()
+    except OSError:
+        return None
+    path = os.path.join(base, nombre)
+    return path if nombre and os.path.isdir(path) else None
+
+
+def recuperar(path, columnas):
+    # Devuelve (estado, muestras): el estado del último checkpoint con los
+    # eventos posteriores aplicados, y todas las muestras completas en disco.
+    #   estado["valores"]     escalares de sesión (conexiones_realizadas, x_acum, ...)
+    #   estado["resultados"]  filas de resultados en orden
+    #   estado["pozo"]        diseño de pozo y df_expandido con sus umbrales
+    estado = {"valores": {}, "resultados": [], "pozo": None}
+    desde = 0
+    try:
+        with open(os.path.join(path, CHECKPOINT), encoding="utf-8") as f:
+            checkpoint = json.load(f)
+        estado, desde = checkpoint["estado"], checkpoint["offsets"]["eventos"]
+    except (OSError, ValueError, KeyError):
+        pass  # Sin checkpoint (o ilegible): se reproduce todo el journal
+
+    aplicados = 0
+    try:
+        with open(os.path.join(path, EVENTOS), "rb") as f:
+            f.seek(desde)
+            for linea in f:
+                try:
+                    evento = json.loads(linea)
+                except ValueError:
+                    break  # Última línea a medio escribir
+                tipo = evento.pop("tipo")
+                evento.pop("t", None)
+                if tipo == "resultado":
+                    estado["resultados"].append(evento)
+                elif tipo == "pozo":
+                    estado["pozo"] = evento
+                elif tipo == "estado":
+                    estado["valores"].update(evento)
+                aplicados += 1
+    except OSError:
+        pass
+
+    dtype = dtype_muestras(columnas)
+    path_muestras = os.path.join(path, MUESTRAS)
+    n = os.path.getsize(path_muestras) // dtype.itemsize if os.path.exists(path_muestras) else 0
+    muestras = np.fromfile(path_muestras, dtype=dtype, count=n) if n else np.empty(0, dtype=dtype)
+    logging.info(f"Journal {path} recuperado: {len(estado['resultados'])} resultados, {n} muestras, "
+                 f"{aplicados} eventos reproducidos desde el checkpoint")
+    return estado, muestras
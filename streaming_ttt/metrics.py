@@ -0,0 +1,174 @@
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Instrumentación liviana (pensada para quedar siempre activa): contadores,
+# medidores e histogramas de buckets fijos, expuestos en formato de texto de
+# Prometheus (/metrics) y como JSON (/metrics.json y en la UI).
+
+# --- CONFIGURACIÓN ---
+PUERTO_METRICAS = 9108
+HOST_METRICAS = "127.0.0.1"   # Solo local
+BUCKETS_SPI_S = (25e-6, 50e-6, 100e-6, 250e-6, 500e-6, 1e-3, 2.5e-3, 5e-3, 10e-3)
+BUCKETS_UI_S = (5e-3, 10e-3, 25e-3, 50e-3, 100e-3, 250e-3, 500e-3, 1.0, 2.5, 5.0)
+BUCKETS_REPORTE_S = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+BUCKETS_POLLS = (1, 2, 5, 10, 25, 50, 100)
+BUCKETS_JITTER_S = (50e-6, 100e-6, 250e-6, 500e-6, 1e-3, 2.5e-3, 5e-3, 10e-3, 25e-3, 50e-3, 100e-3)
+
+
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda):
+        self.nombre, self.ayuda = nombre, ayuda
+        self.valor = 0
+        self._lock = threading.Lock()
+
+    def inc(self, n = 1):
+        with self._lock:
+            self.valor += n
+
+    def muestras(self):
+        return [(self.nombre, "", self.valor)]
+
+    def instantanea(self):
+        return self.valor
+
+
+class Medidor(Contador):
+    tipo = "gauge"
+
+    def set(self, valor):
+        self.valor = valor
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, buckets):
+        self.nombre, self.ayuda = nombre, ayuda
+        self.buckets = tuple(sorted(buckets))
+        self.cuentas = [0] * (len(self.buckets) + 1)   # El último es +Inf
+        self.suma = 0.0
+        self.cantidad = 0
+        self.maximo = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, valor):
+        i = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            self.cuentas[i] += 1
+            self.suma += valor
+            self.cantidad += 1
+            if valor > self.maximo:
+                self.maximo = valor
+
+    @contextmanager
+    def cronometrar(self):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0)
+
+    def muestras(self):
+        with self._lock:
+            cuentas, suma, cantidad = list(self.cuentas), self.suma, self.cantidad
+        filas, acumulado = [], 0
+        for limite, n in zip(self.buckets + (float("inf"),), cuentas):
+            acumulado += n
+            le = "+Inf" if limite == float("inf") else repr(limite)
+            filas.append((f"{self.nombre}_bucket", f'{{le="{le}"}}', acumulado))
+        filas.append((f"{self.nombre}_sum", "", suma))
+        filas.append((f"{self.nombre}_count", "", cantidad))
+        return filas
+
+    def instantanea(self):
+        with self._lock:
+            return {
+                "cantidad": self.cantidad,
+                "media": self.suma / self.cantidad if self.cantidad else None,
+                "maximo": self.maximo,
+                "buckets": {("+Inf" if i == len(self.buckets) else repr(self.buckets[i])): n for i, n in enumerate(self.cuentas)},
+            }
+
+
+class Registro:
+    def __init__(self):
+        self._metricas = {}
+        self._lock = threading.Lock()
+
+    def _obtener(self, clase, nombre, *args):
+        with self._lock:
+            if nombre not in self._metricas:
+                self._metricas[nombre] = clase(nombre, *args)
+            return self._metricas[nombre]
+
+    def contador(self, nombre, ayuda):
+        return self._obtener(Contador, nombre, ayuda)
+
+    def medidor(self, nombre, ayuda):
+        return self._obtener(Medidor, nombre, ayuda)
+
+    def histograma(self, nombre, ayuda, buckets):
+        return self._obtener(Histograma, nombre, ayuda, buckets)
+
+    def texto_prometheus(self):
+        lineas = []
+        for m in list(self._metricas.values()):
+            lineas.append(f"# HELP {m.nombre} {m.ayuda}")
+            lineas.append(f"# TYPE {m.nombre} {m.tipo}")
+            lineas.extend(f"{nombre}{etiquetas} {valor}" for nombre, etiquetas, valor in m.muestras())
+        return "\n".join(lineas) + "\n"
+
+    def instantanea(self):
+        return {nombre: m.instantanea() for nombre, m in list(self._metricas.items())}
+
+
+REGISTRO = Registro()
+
+# ==== MÉTRICAS DEL PIPELINE ====
+SPI_TRANSFERENCIA = REGISTRO.histograma("ttt_spi_transferencia_segundos", "Duración de cada xfer2 al sensor", BUCKETS_SPI_S)
+SENSOR_POLLS = REGISTRO.histograma("ttt_sensor_polls_por_lectura", "Iteraciones de polling de STATUS por read_sensor", BUCKETS_POLLS)
+SENSOR_TIMEOUTS = REGISTRO.contador("ttt_sensor_timeouts_total", "Lecturas con timeout > 0 que vencieron sin movimiento (return 0,0)")
+SENSOR_SIN_MOVIMIENTO = REGISTRO.contador("ttt_sensor_lecturas_sin_movimiento_total", "Lecturas sin espera (timeout 0, adquisición) que no tenían movimiento")
+ADQ_JITTER = REGISTRO.histograma("ttt_adquisicion_jitter_segundos", "Desvío absoluto entre muestras respecto del período nominal", BUCKETS_JITTER_S)
+ADQ_ATRASADAS = REGISTRO.contador("ttt_adquisicion_atrasadas_total", "Ciclos de adquisición que no llegaron a su deadline")
+ADQ_PERDIDAS = REGISTRO.contador("ttt_adquisicion_perdidas_total", "Muestras pisadas en el buffer antes de ser leídas por la UI")
+FILTRO_BLOQUE = REGISTRO.histograma("ttt_filtro_bloque_segundos", "Duración del filtrado de cada bloque de deltas", BUCKETS_SPI_S)
+FILTRO_RECHAZADAS = REGISTRO.contador("ttt_filtro_rechazadas_total", "Deltas reemplazados por el filtro de Hampel")
+UI_RERUN = REGISTRO.histograma("ttt_ui_rerun_segundos", "Duración de cada ejecución del script de Streamlit", BUCKETS_UI_S)
+UI_FRAGMENTO = REGISTRO.histograma("ttt_ui_fragmento_segundos", "Duración de cada refresco de la región en vivo", BUCKETS_UI_S)
+REPORTE_HISTOGRAMAS = REGISTRO.histograma("ttt_reporte_histogramas_segundos", "Duración de la generación de histogramas", BUCKETS_REPORTE_S)
+REPORTE_PDF = REGISTRO.histograma("ttt_reporte_pdf_segundos", "Duración del render del PDF", BUCKETS_REPORTE_S)
+
+
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            cuerpo, tipo = REGISTRO.texto_prometheus().encode(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            cuerpo, tipo = json.dumps(REGISTRO.instantanea()).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass  # Sin log por request
+
+
+def iniciar_servidor(puerto = PUERTO_METRICAS, host = HOST_METRICAS):
+    servidor = ThreadingHTTPServer((host, puerto), _ManejadorMetricas)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name="metricas-http", daemon=True).start()
+    logging.info(f"Métricas disponibles en http://{host}:{puerto}/metrics")
+    return servidor
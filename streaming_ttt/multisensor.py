@@ -0,0 +1,225 @@
+import os
+import time
+import logging
+import threading
+import numpy as np
+from acquisition import AdquisidorSensor, BufferCircular, FRECUENCIA_HZ
+from backends import BACKENDS, sensor_desde_entorno
+from calibracion import AlmacenCalibraciones, PerfilCalibracion
+
+# Varios sensores (p. ej. CE0/CE1 del mismo bus, o dos estaciones de enrosque
+# en una misma Pi), cada uno con su propio hilo de adquisición y su propia
+# cadencia: la tasa total crece con la cantidad de sensores en lugar de
+# repartirse. Un hilo de fusión alinea los flujos en el tiempo y publica el
+# desplazamiento promedio en un BufferCircular con la misma interfaz que un
+# AdquisidorSensor, así la UI puede consumir un sensor o la fusión sin cambios.
+# Si todos los sensores tienen perfil de calibración (calibracion.py), cada
+# flujo se pasa a µm con el suyo antes de promediar y la fusión publica
+# cuentas de una escala común (`perfil`, el promedio de las escalas); si no,
+# promedia cuentas crudas y `perfil` es None.
+#
+#   TTT_SENSORES="0:0,0:1"          -> SPI bus 0, CE0 y CE1 a FRECUENCIA_HZ
+#   TTT_SENSORES="0:0@200,0:1@100"  -> frecuencia por sensor
+#   TTT_SENSORES="sintetico,sintetico@50"  -> backends sin hardware (ver backends.py)
+
+# --- CONFIGURACIÓN ---
+FUSIONADO = "fusionado"        # Nombre de la fuente con el promedio de todos los sensores
+INTERVALO_FUSION_S = 0.01
+
+
+def parsear_sensores(texto):
+    # "bus:device[@hz]" o "<backend>[@hz]" separados por coma -> [(id, tipo, opciones, frecuencia_hz)]
+    especificaciones = []
+    for i, token in enumerate(t.strip() for t in texto.split(",") if t.strip()):
+        nombre, _, frecuencia = token.partition("@")
+        frecuencia_hz = float(frecuencia) if frecuencia else FRECUENCIA_HZ
+        if ":" in nombre:
+            bus, device = (int(v) for v in nombre.split(":"))
+            especificaciones.append((f"spi{bus}.{device}", "spi", {"bus": bus, "device": device}, frecuencia_hz))
+        elif nombre in BACKENDS:
+            especificaciones.append((f"{nombre}{i}", nombre, {}, frecuencia_hz))
+        else:
+            raise ValueError(f"Sensor inválido en TTT_SENSORES: {token}")
+    ids = [e[0] for e in especificaciones]
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"Sensores repetidos en TTT_SENSORES: {texto}")
+    return especificaciones
+
+
+class FusionSensores(threading.Thread):
+    # Alinea los flujos de varios adquisidores y publica el promedio de sus
+    # posiciones. Cada sensor muestrea con su propio reloj, así que la posición
+    # de un sensor en el instante de una muestra de otro es su último valor
+    # acumulado (retención de orden cero). Solo se emite hasta la marca de agua
+    # (el timestamp más viejo entre los últimos de cada sensor): más allá de
+    # ella todavía pueden llegar muestras de los sensores más lentos.
+    def __init__(self, adquisidores, intervalo_s=INTERVALO_FUSION_S, buffer=None, perfiles=None):
+        super().__init__(name="fusion-sensores", daemon=True)
+        self.adquisidores = list(adquisidores)
+        self.perfiles = None
+        self.perfil = None
+        if perfiles is not None and all(p is not None for p in perfiles):
+            self.perfiles = list(perfiles)
+            escala = float(np.mean([(p.escala_x + p.escala_y) / 2 for p in self.perfiles]))
+            self.perfil = PerfilCalibracion.desde_factor(FUSIONADO, escala)
+        self.sensor = tuple(a.sensor for a in self.adquisidores)
+        self.intervalo_s = intervalo_s
+        self.buffer = buffer if buffer is not None else BufferCircular()
+        self.ultimo_error = None
+        self.perdidas = 0
+        self._detener = threading.Event()
+
+        n = len(self.adquisidores)
+        self._cursores = [a.buffer.ultimo_indice() for a in self.adquisidores]
+        self._acumulado = np.zeros((n, 2), dtype=np.float64)   # Cuentas totales leídas por sensor (escala común si hay perfiles)
+        self._base = np.zeros((n, 2), dtype=np.float64)        # Posición de cada sensor en la marca de agua
+        self._pendientes_t = [np.empty(0, dtype=np.int64) for _ in range(n)]
+        self._pendientes_xy = [np.empty((0, 2), dtype=np.float64) for _ in range(n)]
+        self._pendientes_mov = [np.empty(0, dtype=bool) for _ in range(n)]
+        self._ultimo_t = [None] * n
+        self._emitido = np.zeros(2, dtype=np.int64)          # Posición fusionada ya publicada
+
+    def _leer_fuentes(self):
+        for k, adquisidor in enumerate(self.adquisidores):
+            t_ns, dx, dy, movimiento, self._cursores[k], perdidas = adquisidor.buffer.leer_desde(self._cursores[k])
+            self.perdidas += perdidas
+            if len(t_ns) == 0:
+                continue
+            if self.perfiles is not None:
+                # Cuentas del sensor -> mm con su perfil -> cuentas de la escala común
+                dx, dy = self.perfiles[k].aplicar(dx, dy)
+                dx, dy = dx * 1000.0 / self.perfil.escala_x, dy * 1000.0 / self.perfil.escala_y
+            xy = self._acumulado[k] + np.cumsum(np.column_stack((dx, dy)), axis=0, dtype=np.float64)
+            self._acumulado[k] = xy[-1]
+            self._pendientes_t[k] = np.concatenate((self._pendientes_t[k], t_ns))
+            self._pendientes_xy[k] = np.concatenate((self._pendientes_xy[k], xy))
+            self._pendientes_mov[k] = np.concatenate((self._pendientes_mov[k], movimiento))
+            self._ultimo_t[k] = int(t_ns[-1])
+
+    def fusionar(self):
+        # Un paso de fusión: devuelve la cantidad de muestras publicadas
+        self._leer_fuentes()
+        if any(t is None for t in self._ultimo_t):
+            return 0
+        marca = min(self._ultimo_t)
+        tiempos = np.unique(np.concatenate([t[t <= marca] for t in self._pendientes_t]))
+        if len(tiempos) == 0:
+            return 0
+
+        posiciones = np.empty((len(self.adquisidores), len(tiempos), 2), dtype=np.float64)
+        movimiento = np.zeros(len(tiempos), dtype=bool)   # Algún sensor reportó movimiento en ese instante
+        for k, (t, xy, mov) in enumerate(zip(self._pendientes_t, self._pendientes_xy, self._pendientes_mov)):
+            i = np.searchsorted(t, tiempos, side="right") - 1
+            posiciones[k] = np.where((i >= 0)[:, None], xy[np.maximum(i, 0)], self._base[k])
+            if len(t):
+                j = np.maximum(i, 0)
+                movimiento |= (i >= 0) & (t[j] == tiempos) & mov[j]
+            comprometidas = np.searchsorted(t, marca, side="right")
+            if comprometidas:
+                self._base[k] = xy[comprometidas - 1]
+                self._pendientes_t[k] = t[comprometidas:]
+                self._pendientes_xy[k] = xy[comprometidas:]
+                self._pendientes_mov[k] = mov[comprometidas:]
+
+        # Se redondea la posición (no el delta) para que la suma de deltas no derive
+        fusion = np.rint(posiciones.mean(axis=0)).astype(np.int64)
+        deltas = np.diff(fusion, axis=0, prepend=self._emitido[None, :])
+        self._emitido = fusion[-1]
+        self.buffer.escribir_bloque(tiempos, deltas[:, 0], deltas[:, 1], movimiento)
+        return len(tiempos)
+
+    def run(self):
+        logging.info(f"Fusión de {len(self.adquisidores)} sensores iniciada")
+        while not self._detener.wait(self.intervalo_s):
+            caido = next((a for a in self.adquisidores if not a.is_alive()), None)
+            if caido is not None:
+                self.ultimo_error = f"{caido.name} detenido ({caido.ultimo_error})"
+                logging.error(f"Fusión detenida: {self.ultimo_error}")
+                break
+            self.fusionar()
+        logging.info("Fusión de sensores detenida")
+
+    def detener(self, timeout=1.0):
+        self._detener.set()
+        self.join(timeout)
+
+    def estadisticas(self):
+        por_sensor = [a.estadisticas() for a in self.adquisidores]
+        return {
+            "muestras": self.buffer.ultimo_indice(),
+            "atrasadas": sum(s["atrasadas"] for s in por_sensor),
+            "errores": sum(s["errores"] for s in por_sensor),
+            "activo": self.is_alive(),
+            "perdidas_fusion": self.perdidas,
+            "por_sensor": {a.name: s for a, s in zip(self.adquisidores, por_sensor)},
+        }
+
+
+class GestorSensores:
+    # Abre N sensores, cada uno con su AdquisidorSensor, y la fusión si hay más de
+    # uno. `perfiles`: {id: PerfilCalibracion o None} para fusionar en mm
+    def __init__(self, especificaciones, perfiles = None):
+        self.adquisidores = {}
+        for id_sensor, tipo, opciones, frecuencia_hz in especificaciones:
+            sensor = sensor_desde_entorno(tipo, **opciones)
+            self.adquisidores[id_sensor] = AdquisidorSensor(sensor, frecuencia_hz, nombre=f"adquisicion-{id_sensor}")
+        if not self.adquisidores:
+            raise ValueError("No hay sensores configurados")
+        if len(self.adquisidores) > 1:
+            perfiles = perfiles or {}
+            self.fusion = FusionSensores(self.adquisidores.values(), perfiles=[perfiles.get(i) for i in self.adquisidores])
+            if self.fusion.perfil is None:
+                logging.warning("Fusión sin calibrar: no todos los sensores tienen perfil, se promedian cuentas crudas")
+        else:
+            self.fusion = None
+
+    @property
+    def ids(self):
+        return list(self.adquisidores)
+
+    def fuentes(self):
+        # Nombres aceptados por fuente(): la fusión (si hay varios sensores) y cada sensor
+        return ([FUSIONADO] if self.fusion is not None else []) + self.ids
+
+    def fuente(self, nombre = FUSIONADO):
+        if nombre == FUSIONADO:
+            return self.fusion if self.fusion is not None else next(iter(self.adquisidores.values()))
+        return self.adquisidores[nombre]
+
+    def iniciar(self, timeout = 10):
+        for id_sensor, adquisidor in self.adquisidores.items():
+            adquisidor.sensor.initialize(timeout=timeout)
+            _,_ = adquisidor.sensor.read_sensor(timeout=0.2) # Vacio el buffer del sensor
+            logging.info(f"Sensor {id_sensor} inicializado")
+        # Los hilos arrancan juntos para que los flujos empiecen alineados
+        for adquisidor in self.adquisidores.values():
+            adquisidor.start()
+        if self.fusion is not None:
+            self.fusion.start()
+
+    def detener(self):
+        if self.fusion is not None:
+            self.fusion.detener()
+        for adquisidor in self.adquisidores.values():
+            adquisidor.detener()
+            adquisidor.sensor.close()
+
+
+def gestor_desde_entorno():
+    # TTT_SENSORES (lista de sensores); por defecto un único sensor según TTT_SENSOR
+    tipo = os.environ.get("TTT_SENSOR", "spi")
+    texto = os.environ.get("TTT_SENSORES", "0:0" if tipo == "spi" else tipo)
+    especificaciones = parsear_sensores(texto)
+    calibraciones = AlmacenCalibraciones()   # Los perfiles vigentes al arrancar; la fusión no cambia de escala en marcha
+    return GestorSensores(especificaciones, {e[0]: calibraciones.vigente(e[0]) for e in especificaciones})
+
+
+if __name__ == "__main__":
+    # Prueba rápida sin hardware: python multisensor.py sintetico,sintetico@50
+    import sys
+    gestor = GestorSensores(parsear_sensores(sys.argv[1] if len(sys.argv) > 1 else "sintetico,sintetico@50"))
+    gestor.iniciar()
+    time.sleep(2.0)
+    stats = gestor.fuente().estadisticas()
+    gestor.detener()
+    print(f"[OK] {stats}")
@@ -1,22 +1,114 @@
+from functools import lru_cache
 from jinja2 import Environment, FileSystemLoader
-from weasyprint import HTML
+from weasyprint import HTML, CSS, default_url_fetcher
+from weasyprint.text.fonts import FontConfiguration
 import os
+import time
+import logging
 
 # --- CONFIGURACIÓN ---
 TEMPLATES_DIR = "templates"
+TEMPLATE_REPORTE = "report_template.html"
+CSS_REPORTE = os.path.join(TEMPLATES_DIR, "report.css")
+ASSETS_REPORTE = {"utils/TenarisLogo.png": os.path.join("utils", "TenarisLogo.png")}   # Sufijo de URL -> archivo local
+DPI_IMPRESION = 300          # Resolución máxima de las imágenes embebidas en el PDF
+FILAS_POR_PARTE = 400        # Informe grande: filas de la tabla por parte (~7 páginas A4); None = siempre de una vez
 
-def generar_reporte_pdf(datos, pdf_path, flag_html=False):
+@lru_cache(maxsize=None)
+def obtener_entorno():
+    # Un único Environment por proceso: Jinja compila la plantilla una sola vez
+    # y, con auto_reload, la recompila solo si el archivo cambia en disco
+    return Environment(loader=FileSystemLoader(TEMPLATES_DIR), auto_reload=True)
+
+@lru_cache(maxsize=4)
+def _estilos(path, mtime):
+    font_config = FontConfiguration()
+    return CSS(filename=path, font_config=font_config), font_config
+
+def obtener_estilos(path = CSS_REPORTE):
+    # Hoja de estilos parseada y configuración de fuentes (fontconfig), una vez
+    # por proceso y compartidas entre informes y partes; como la plantilla, se
+    # vuelven a cargar si el archivo cambia en disco
+    return _estilos(path, os.stat(path).st_mtime_ns)
+
+def crear_url_fetcher(assets):
+    # url_fetcher de WeasyPrint que sirve desde memoria los recursos fijos de la
+    # plantilla (logo, etc.): {sufijo de URL: ruta local}. Se leen una vez por proceso.
+    cache = {}
+
+    def fetcher(url, *args, **kwargs):
+        for sufijo, path in assets.items():
+            if url.endswith(sufijo):
+                if sufijo not in cache:
+                    with open(path, "rb") as f:
+                        cache[sufijo] = f.read()
+                return {"string": cache[sufijo], "redirected_url": url}
+        return default_url_fetcher(url, *args, **kwargs)
+
+    return fetcher
+
+def _escribir_pdf(html_content, destino, url_fetcher):
+    css, font_config = obtener_estilos()
+    HTML(string=html_content, base_url=os.getcwd(), url_fetcher=url_fetcher or default_url_fetcher).write_pdf(
+        destino, stylesheets=[css], font_config=font_config,
+        dpi=DPI_IMPRESION, optimize_images=True)   # Imágenes a resolución de impresión (el logo es de 2560 px)
+
+def unir_pdfs(partes, destino):
+    # Une las partes página por página sin volver a maquetar; escritura atómica
+    from pypdf import PdfWriter
+    escritor = PdfWriter()
+    for parte in partes:
+        escritor.append(parte)
+    tmp = f"{destino}.tmp"
+    with open(tmp, "wb") as f:
+        escritor.write(f)
+    os.replace(tmp, destino)
+
+def generar_reporte_pdf(datos, pdf_path, flag_html=False, url_fetcher=None, filas_por_parte=FILAS_POR_PARTE, progreso=None):
     # --- CARGA DE PLANTILLA ---
-    env = Environment(loader=FileSystemLoader(TEMPLATES_DIR))
-    template = env.get_template("report_template.html")
+    template = obtener_entorno().get_template(TEMPLATE_REPORTE)
+    mediciones = datos.get("mediciones") or []
 
-    # --- RENDER HTML ---
-    html_content = template.render(datos)
     if flag_html:
+        # Vista previa autocontenida (estilos en línea), con la tabla completa
         with open("reporte_preview.html", "w", encoding="utf-8") as f:
-            f.write(html_content)
+            f.write(template.render(datos, estilos_en_linea=True))
 
-    # --- EXPORTAR A PDF ---
-    HTML(string=html_content, base_url=os.getcwd()).write_pdf(pdf_path)
+    if filas_por_parte and len(mediciones) > filas_por_parte:
+        try:
+            import pypdf  # noqa: F401  (solo para verificar que está disponible)
+        except ImportError:
+            logging.warning("pypdf no está instalado: el informe grande se genera de una sola vez")
+        else:
+            _generar_por_partes(template, datos, mediciones, pdf_path, filas_por_parte, url_fetcher, progreso)
+            print(f"✅ PDF generado correctamente: {pdf_path}")
+            return
+
+    # --- RENDER HTML + EXPORTAR A PDF ---
+    _escribir_pdf(template.render(datos), pdf_path, url_fetcher)
 
     print(f"✅ PDF generado correctamente: {pdf_path}")
+
+def _generar_por_partes(template, datos, mediciones, pdf_path, filas_por_parte, url_fetcher, progreso):
+    # Informe grande: WeasyPrint maqueta todo el documento en memoria y el costo
+    # de paginar una tabla crece más rápido que sus filas. Cada parte (la primera
+    # con cabecera, resumen e histogramas; las demás solo con la tabla y su
+    # encabezado) se maqueta y se escribe a disco por separado, así la memoria
+    # queda acotada por el tamaño de una parte y el tiempo crece linealmente.
+    # Cada parte empieza en una página nueva.
+    n_partes = -(-len(mediciones) // filas_por_parte)
+    partes = []
+    t0 = time.perf_counter()
+    try:
+        for i in range(n_partes):
+            bloque = mediciones[i * filas_por_parte:(i + 1) * filas_por_parte]
+            parte = f"{pdf_path}.parte{i:03d}"
+            _escribir_pdf(template.render(datos, mediciones=bloque, continuacion=i > 0), parte, url_fetcher)
+            partes.append(parte)
+            if progreso is not None:
+                progreso((i + 1) / (n_partes + 1))
+        unir_pdfs(partes, pdf_path)
+    finally:
+        for parte in partes:
+            os.remove(parte)
+    logging.info(f"Informe {pdf_path}: {len(mediciones)} filas en {n_partes} partes ({time.perf_counter() - t0:.1f} s)")
@@ -0,0 +1,200 @@
+import time
+import queue
+import atexit
+import logging
+import itertools
+import threading
+import multiprocessing
+from metrics import REPORTE_HISTOGRAMAS, REPORTE_PDF
+
+# Estados de un trabajo de reporte
+PENDIENTE = "pendiente"
+EJECUTANDO = "ejecutando"
+TERMINADO = "terminado"
+ERROR = "error"
+CANCELADO = "cancelado"
+FINALES = (TERMINADO, ERROR, CANCELADO)
+
+INTERVALO_SONDEO_S = 0.2
+MAXIMO_FINALIZADOS = 20      # Trabajos terminados que se recuerdan (estado y ruta del PDF)
+
+
+def _proceso_reportes(entrada, salida):
+    # Proceso hijo de larga vida: importa WeasyPrint/matplotlib y compila la
+    # plantilla una sola vez, y genera los reportes que le llegan por `entrada`.
+    # Al ser otro proceso, el render no compite por el GIL con la adquisición.
+    modulos = None
+    while True:
+        mensaje = entrada.get()
+        if mensaje is None:
+            return
+        id_trabajo, parametros = mensaje
+        try:
+            if modulos is None:
+                from histograms import generar_histogramas
+                from report_generator import generar_reporte_pdf, obtener_entorno, crear_url_fetcher, TEMPLATE_REPORTE, ASSETS_REPORTE
+                obtener_entorno().get_template(TEMPLATE_REPORTE)
+                modulos = (generar_histogramas, generar_reporte_pdf, crear_url_fetcher(ASSETS_REPORTE))
+            generar_histogramas, generar_reporte_pdf, url_fetcher = modulos
+
+            resultados = parametros["resultados"]
+            salida.put((id_trabajo, "histogramas", 0.1, None))
+            # En serie: este proceso ya tiene matplotlib cargado, y un pool propio quedaría
+            # huérfano al cancelar (terminate)
+            rutas_histo = generar_histogramas(resultados, output_dir=parametros["hist_dir"], max_workers=1,
+                                              estadisticas=parametros.get("estadisticas"))
+
+            salida.put((id_trabajo, "pdf", 0.4, None))
+            datos = dict(parametros["datos"], histograms=rutas_histo, mediciones=resultados.to_dict(orient="records"))
+            # Informe grande: avanza parte por parte
+            progreso = lambda fraccion: salida.put((id_trabajo, "pdf", 0.4 + 0.6 * fraccion, None))
+            generar_reporte_pdf(datos=datos, pdf_path=parametros["pdf_path"], url_fetcher=url_fetcher, progreso=progreso)
+            salida.put((id_trabajo, TERMINADO, 1.0, parametros["pdf_path"]))
+        except Exception as e:
+            salida.put((id_trabajo, ERROR, 1.0, f"{type(e).__name__}: {e}"))
+
+
+class TrabajoReporte:
+    def __init__(self, id_trabajo, parametros):
+        self.id = id_trabajo
+        self.parametros = parametros
+        self.pdf_path = parametros["pdf_path"]
+        self.estado = PENDIENTE
+        self.etapa = PENDIENTE
+        self.progreso = 0.0
+        self.detalle = None
+        self.cancelar = False
+        self.creado = time.time()
+        self.finalizado = None
+
+    def resumen(self):
+        return {
+            "id": self.id,
+            "estado": self.estado,
+            "etapa": self.etapa,
+            "progreso": self.progreso,
+            "detalle": self.detalle,
+            "pdf_path": self.pdf_path,
+            "duracion_s": (self.finalizado or time.time()) - self.creado,
+        }
+
+
+class ColaReportes:
+    # Cola de reportes PDF en segundo plano. Un hilo despachador envía los
+    # trabajos de a uno al proceso de reportes y actualiza su estado; la UI solo
+    # consulta estado() y puede cancelar. Cancelar un trabajo en curso termina
+    # el proceso hijo, que se vuelve a crear para el siguiente trabajo.
+    def __init__(self):
+        self._contexto = multiprocessing.get_context("spawn")
+        self._pendientes = queue.Queue()
+        self._trabajos = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._proceso = None
+        self._entrada = self._salida = None
+        self._atexit_registrado = False
+        self._hilo = threading.Thread(target=self._despachar, name="cola-reportes", daemon=True)
+        self._hilo.start()
+
+    def encolar(self, resultados, datos, pdf_path, hist_dir, estadisticas = None):
+        # `estadisticas`: EstadisticasPozo de los mismos resultados (los histogramas salen de sus bins)
+        trabajo = TrabajoReporte(next(self._ids), {
+            "resultados": resultados, "datos": datos, "pdf_path": pdf_path, "hist_dir": hist_dir,
+            "estadisticas": estadisticas,
+        })
+        with self._lock:
+            self._trabajos[trabajo.id] = trabajo
+        self._pendientes.put(trabajo)
+        return trabajo.id
+
+    def estado(self, id_trabajo):
+        trabajo = self._trabajos.get(id_trabajo)
+        return trabajo.resumen() if trabajo is not None else None
+
+    def cancelar(self, id_trabajo):
+        trabajo = self._trabajos.get(id_trabajo)
+        if trabajo is None or trabajo.estado in FINALES:
+            return
+        trabajo.cancelar = True
+        if trabajo.estado == PENDIENTE:
+            self._finalizar(trabajo, CANCELADO)
+
+    def _finalizar(self, trabajo, estado, detalle = None):
+        trabajo.estado = trabajo.etapa = estado
+        trabajo.detalle = detalle
+        trabajo.finalizado = time.time()
+        # La cola vive lo que el proceso (cache_resource): sin los resultados, los
+        # datos ni la copia de las estadísticas, un trabajo terminado es solo su estado
+        trabajo.parametros = None
+        with self._lock:
+            finalizados = [t for t in self._trabajos.values() if t.estado in FINALES]
+            for viejo in finalizados[:-MAXIMO_FINALIZADOS]:
+                del self._trabajos[viejo.id]
+
+    def _asegurar_proceso(self):
+        if self._proceso is not None and self._proceso.is_alive():
+            return
+        self._entrada = self._contexto.Queue()
+        self._salida = self._contexto.Queue()
+        # No daemon: generar_histogramas puede abrir su propio pool de procesos
+        self._proceso = self._contexto.Process(target=_proceso_reportes, args=(self._entrada, self._salida),
+                                               name="reportes-pdf")
+        self._proceso.start()
+        if not self._atexit_registrado:
+            # Se registra después del primer start(): atexit es LIFO y así cerrar()
+            # corre antes de que multiprocessing espere a los hijos no daemon
+            atexit.register(self.cerrar)
+            self._atexit_registrado = True
+
+    def _terminar_proceso(self):
+        if self._proceso is not None:
+            self._proceso.terminate()
+            self._proceso.join(5)
+            self._proceso = None
+
+    def _despachar(self):
+        while True:
+            trabajo = self._pendientes.get()
+            if trabajo is None:
+                return
+            if trabajo.estado == CANCELADO:
+                continue
+            self._asegurar_proceso()
+            trabajo.estado = EJECUTANDO
+            self._entrada.put((trabajo.id, trabajo.parametros))
+            inicio_etapa = time.perf_counter()
+            while trabajo.estado not in FINALES:
+                if trabajo.cancelar:
+                    self._terminar_proceso()
+                    self._finalizar(trabajo, CANCELADO)
+                    break
+                try:
+                    id_trabajo, etapa, progreso, detalle = self._salida.get(timeout=INTERVALO_SONDEO_S)
+                except queue.Empty:
+                    if not self._proceso.is_alive():
+                        self._proceso = None
+                        self._finalizar(trabajo, ERROR, "El proceso de reportes terminó inesperadamente")
+                    continue
+                if id_trabajo != trabajo.id:
+                    continue
+                # Duración de cada etapa medida desde este proceso (el hijo tiene su propio registro);
+                # una etapa puede mandar varios avances (partes del PDF)
+                ahora = time.perf_counter()
+                if etapa != trabajo.etapa:
+                    if trabajo.etapa == "histogramas":
+                        REPORTE_HISTOGRAMAS.observe(ahora - inicio_etapa)
+                    elif trabajo.etapa == "pdf" and etapa == TERMINADO:
+                        REPORTE_PDF.observe(ahora - inicio_etapa)
+                    inicio_etapa = ahora
+                if etapa in FINALES:
+                    self._finalizar(trabajo, etapa, detalle)
+                else:
+                    trabajo.etapa, trabajo.progreso = etapa, progreso
+            trabajo.progreso = 1.0
+            logging.info(f"Reporte {trabajo.id}: {trabajo.estado} ({trabajo.detalle})")
+
+    def cerrar(self):
+        if self._proceso is not None and self._proceso.is_alive():
+            self._entrada.put(None)
+            self._proceso.join(2)
+        self._terminar_proceso()
@@ -0,0 +1,101 @@
+from collections import namedtuple
+
+# Segmentación automática de conexiones a partir de desp_total, muestra a
+# muestra y con estado O(1). La velocidad se estima con un promedio
+# exponencial (constante de tiempo `tau_s`) y una máquina de estados recorre
+#   reposo -> enrosque -> hombro -> cierre
+# - enrosque: la velocidad supera `v_inicio`
+# - hombro: la velocidad queda por debajo de `v_reposo` durante `t_meseta_s`
+#   después de avanzar al menos `desp_minimo_mm`
+# - cierre: el hombro se mantiene `t_cierre_s` más; el desplazamiento
+#   propuesto es el promedio de la meseta
+# Si el movimiento se reanuda en el hombro se vuelve a enrosque (hombro falso).
+# `sensibilidad` escala los umbrales de velocidad: mayor sensibilidad detecta
+# enrosques más lentos.
+
+# --- CONFIGURACIÓN ---
+REPOSO, ENROSQUE, HOMBRO, CERRADA = "reposo", "enrosque", "hombro", "cerrada"
+V_INICIO_MM_S = 0.5
+V_REPOSO_MM_S = 0.15
+TAU_S = 0.5
+T_MESETA_S = 1.0
+T_CIERRE_S = 2.0
+DESP_MINIMO_MM = 1.0
+
+EventoSegmentacion = namedtuple("EventoSegmentacion", "tipo t_ns indice desplazamiento")
+
+
+class SegmentadorConexiones:
+    def __init__(self, sensibilidad = 1.0, tau_s = TAU_S, t_meseta_s = T_MESETA_S, t_cierre_s = T_CIERRE_S,
+                 desp_minimo_mm = DESP_MINIMO_MM):
+        self.configurar(sensibilidad, tau_s, t_meseta_s, t_cierre_s, desp_minimo_mm)
+        self.reiniciar()
+
+    def configurar(self, sensibilidad = 1.0, tau_s = TAU_S, t_meseta_s = T_MESETA_S, t_cierre_s = T_CIERRE_S,
+                   desp_minimo_mm = DESP_MINIMO_MM):
+        self.sensibilidad = sensibilidad
+        self.v_inicio = V_INICIO_MM_S / sensibilidad
+        self.v_reposo = V_REPOSO_MM_S / sensibilidad
+        self.tau_s = tau_s
+        self.t_meseta_s = t_meseta_s
+        self.t_cierre_s = t_cierre_s
+        self.desp_minimo_mm = desp_minimo_mm
+
+    def reiniciar(self):
+        # Al cerrar una conexión (desp_total vuelve a cero)
+        self.estado = REPOSO
+        self.velocidad = 0.0
+        self._t_prev = None
+        self._d_prev = 0.0
+        self._d_inicio = 0.0
+        self._quieto_desde = None
+        self._suma_meseta = 0.0
+        self._n_meseta = 0
+
+    def procesar_bloque(self, t_ns, desp_total):
+        # Devuelve los eventos (hombro / cierre) detectados en el bloque; `indice`
+        # es la posición dentro del bloque de la muestra en la que se detectan:
+        # para HOMBRO, t_meseta_s después de que empezó la meseta
+        eventos = []
+        if self.estado == CERRADA:
+            return eventos
+        estado, v, t_prev, d_prev = self.estado, self.velocidad, self._t_prev, self._d_prev
+        quieto_desde = self._quieto_desde
+        for i, (t_i, d) in enumerate(zip(t_ns.tolist(), desp_total.tolist())):
+            t = t_i * 1e-9
+            if t_prev is None or t <= t_prev:
+                t_prev, d_prev = t, d
+                continue
+            dt = t - t_prev
+            v += dt / (self.tau_s + dt) * ((d - d_prev) / dt - v)
+            t_prev, d_prev = t, d
+            quieto = abs(v) < self.v_reposo
+            if quieto and quieto_desde is None:
+                quieto_desde = t
+            elif not quieto:
+                quieto_desde = None
+
+            if estado == REPOSO:
+                if v > self.v_inicio:
+                    estado, self._d_inicio = ENROSQUE, d
+            elif estado == ENROSQUE:
+                if quieto_desde is not None and t - quieto_desde >= self.t_meseta_s:
+                    if d - self._d_inicio >= self.desp_minimo_mm:
+                        estado = HOMBRO
+                        self._suma_meseta, self._n_meseta = d, 1
+                        eventos.append(EventoSegmentacion(HOMBRO, t_i, i, d))
+                    else:
+                        estado = REPOSO   # Arranque falso: se movió menos que el mínimo
+            elif estado == HOMBRO:
+                if v > self.v_inicio:
+                    estado = ENROSQUE     # Hombro falso: el enrosque continúa
+                else:
+                    self._suma_meseta += d
+                    self._n_meseta += 1
+                    if quieto_desde is not None and t - quieto_desde >= self.t_meseta_s + self.t_cierre_s:
+                        estado = CERRADA
+                        eventos.append(EventoSegmentacion(CERRADA, t_i, i, round(self._suma_meseta / self._n_meseta, 3)))
+                        break
+        self.estado, self.velocidad, self._t_prev, self._d_prev = estado, v, t_prev, d_prev
+        self._quieto_desde = quieto_desde
+        return eventos
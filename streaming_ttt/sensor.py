@@ -1,9 +1,14 @@
-import spidev
 import time
 import logging
-import csv
 from datetime import datetime
 from typing import Tuple
+from sinks import crear_sumidero, ReporteConsola
+from metrics import SPI_TRANSFERENCIA, SENSOR_POLLS, SENSOR_TIMEOUTS, SENSOR_SIN_MOVIMIENTO
+
+try:
+    import spidev
+except ImportError:  # Fuera de la Raspberry Pi se puede inyectar fake_spidev.FakeSpiDev
+    spidev = None
 
 # Configuración de logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -28,14 +33,26 @@ MSB_MASK = 0x80        # Máscara para extraer el bit 7
 POLL_INTERVAL = 0.008  # 8 ms
 DEFAULT_TIMEOUT = 600.0 # 60 segundos
 
+# Lectura en ráfaga: status + los 4 registros de desplazamiento en una sola
+# transacción (CS bajo durante toda la trama), pares [dirección, dummy]
+BURST_FRAME = [STATUS_REG, 0x00, REG_X_L, 0x00, REG_X_H, 0x00, REG_Y_L, 0x00, REG_Y_H, 0x00]
+
 class SpiSensor:
-    def __init__(self, bus = SPI_BUS, device = SPI_DEVICE):
-        self.spi = spidev.SpiDev()
+    def __init__(self, bus = SPI_BUS, device = SPI_DEVICE, spi = None, burst = True):
+        if spi is None:
+            if spidev is None:
+                raise RuntimeError("spidev no está disponible en este sistema")
+            spi = spidev.SpiDev()
+        self.spi = spi
+        self.burst = burst
         self.spi.open(bus, device)
         self.spi.max_speed_hz = SPI_CLOCK_HZ
         self.spi.mode = SPI_MODE
         logging.info(f"SPI abierto en bus {bus}, dispositivo {device}, modo {SPI_MODE}")
 
+    def close(self):
+        self.spi.close()
+
     def read_register(self, address):
         if not 0 <= address <= 0x7F:
             raise ValueError(f"Dirección inválida: 0x{address:02X}")
@@ -66,26 +83,90 @@ class SpiSensor:
         ms = self.read_register(STATUS_REG)
         return bool(ms & MSB_MASK)
 
+    @staticmethod
+    def _to_int16(raw):
+        return raw - (1 << 16) if (raw & (1 << 15)) else raw
+
+    @staticmethod
+    def _decode_frame(resp):
+        # Respuesta de una trama BURST_FRAME: los datos están en los bytes impares
+        status = resp[1]
+        raw_x = (resp[5] << 8) | resp[3]
+        raw_y = (resp[9] << 8) | resp[7]
+        return bool(status & MSB_MASK), SpiSensor._to_int16(raw_x), SpiSensor._to_int16(raw_y)
+
+    def read_burst(self):
+        # Status y desplazamientos en una única transacción: X/Y consistentes
+        t0 = time.perf_counter()
+        resp = self.spi.xfer2(BURST_FRAME)
+        SPI_TRANSFERENCIA.observe(time.perf_counter() - t0)
+        return self._decode_frame(resp)
+
     def read_sensor(self, timeout = DEFAULT_TIMEOUT):
+        _, x, y = self.read_sample(timeout)
+        return x, y
+
+    def read_sample(self, timeout = DEFAULT_TIMEOUT):
+        # Como read_sensor pero con el bit de movimiento: (False, 0, 0) si venció
+        # el timeout, para distinguirlo de un reporte real de desplazamiento nulo
+        if not self.burst:
+            return self._read_sensor_registers(timeout)
+        start = time.time()
+        polls = 0
+        while True:
+            motion, x, y = self.read_burst()
+            polls += 1
+            if motion:
+                SENSOR_POLLS.observe(polls)
+                return True, x, y
+            if time.time() - start > timeout:
+                return self._sin_movimiento(timeout, polls)
+            time.sleep(POLL_INTERVAL)
+
+    @staticmethod
+    def _sin_movimiento(timeout, polls):
+        # Con timeout 0 (hilo de adquisición) no haber movimiento es el estado
+        # normal en reposo, no un timeout: se cuenta aparte
+        SENSOR_POLLS.observe(polls)
+        (SENSOR_TIMEOUTS if timeout > 0 else SENSOR_SIN_MOVIMIENTO).inc()
+        return False, 0, 0
+
+    def _read_sensor_registers(self, timeout = DEFAULT_TIMEOUT):
+        # Camino registro a registro (5 transacciones por muestra)
         start = time.time()
+        polls = 1
         while not self.is_motion_status_on():
             if time.time() - start > timeout:
-                return 0,0
+                return self._sin_movimiento(timeout, polls)
             time.sleep(POLL_INTERVAL)
+            polls += 1
+        SENSOR_POLLS.observe(polls)
         x_l = self.read_register(REG_X_L)
         x_h = self.read_register(REG_X_H)
         y_l = self.read_register(REG_Y_L)
         y_h = self.read_register(REG_Y_H)
-        raw_x = (x_h << 8) | x_l
-        raw_y = (y_h << 8) | y_l
-        x = raw_x - (1 << 16) if (raw_x & (1 << 15)) else raw_x
-        y = raw_y - (1 << 16) if (raw_y & (1 << 15)) else raw_y
-        return x, y
-
-    def read_continuous(self, factor_x = 1.0, factor_y = 1.0, save_csv = False):
+        x = self._to_int16((x_h << 8) | x_l)
+        y = self._to_int16((y_h << 8) | y_l)
+        return True, x, y
+
+    def read_many(self, n):
+        # Interfaz común con los backends (replay/sintético drenan hasta n
+        # muestras grabadas). El PAT9130 no encola reportes: los registros de
+        # desplazamiento acumulan y se limpian al leerlos, así que nunca hay más
+        # de uno pendiente. Es una sola ráfaga: 0 o 1 muestra, sin importar n
+        motion, x, y = self.read_burst()
+        return [(x, y)] if motion else []
+
+    def read_continuous(self, factor_x = 1.0, factor_y = 1.0, save_csv = False, formato = "csv", rotar_filas = None):
         x_sum = 0.0
         y_sum = 0.0
-        records = []  # Lista de tuplas para CSV
+        sink = None
+        if save_csv:
+            # Escritura incremental: memoria acotada y datos en disco ante un corte
+            now_str = datetime.now().strftime("%Y%m%d_%H%M%S")
+            factores = {"factor_x": factor_x, "factor_y": factor_y} if formato == "ttt" else {}
+            sink = crear_sumidero(formato, "LecturasCSV/PAT9130", now_str, f"-{factor_x:.3f}-{factor_y:.3f}", rotar_filas=rotar_filas, **factores)
+        reporte = ReporteConsola()
         logging.info("Inicio de lectura continua calibrada (Ctrl+C para detener)")
         _,_ = self.read_sensor() # Vacio el buffer del sensor
         try:
@@ -95,20 +176,16 @@ class SpiSensor:
                 delta_y = raw_y * factor_y
                 x_sum += delta_x
                 y_sum += delta_y
-                timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-                records.append((timestamp, delta_x/1000, delta_y/1000, x_sum/1000, y_sum/1000))
-                print(f"\r{timestamp} | ΔX={delta_x/1000:.3f}, ΔY={delta_y/1000:.3f} | SumX={abs(x_sum/1000):.3f}, SumY={abs(y_sum/1000):.3f}  ", end="", flush=True)
+                t_ns = time.time_ns()
+                if sink is not None:
+                    sink.agregar(t_ns, delta_x/1000, delta_y/1000, x_sum/1000, y_sum/1000)
+                reporte.actualizar(t_ns, delta_x/1000, delta_y/1000, x_sum/1000, y_sum/1000)
         except KeyboardInterrupt:
             logging.info("Lectura continua detenida por usuario")
-            if save_csv:
-                # Guardar CSV
-                now_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"LecturasCSV/PAT9130/{now_str}-{factor_x:.3f}-{factor_y:.3f}.csv"
-                with open(filename, 'w', newline='') as csvfile:
-                    writer = csv.writer(csvfile)
-                    writer.writerow(['timestamp', 'delta_x', 'delta_y', 'acumulado_x', 'acumulado_y'])
-                    writer.writerows(records)
-                logging.info(f"Datos guardados en {filename}")
+        finally:
+            if sink is not None:
+                sink.cerrar()
+                logging.info(f"Datos guardados en {', '.join(sink.archivos)}")
         return x_sum/1000, y_sum/1000 # divido por 1000 para pasar a mm
 
     def calibrate_x(self, known_distance_x):
@@ -0,0 +1,439 @@
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import struct
+import signal
+import logging
+import argparse
+import threading
+from collections import deque
+import numpy as np
+from acquisition import BufferCircular
+from multisensor import gestor_desde_entorno
+from calibracion import PerfilCalibracion
+from metrics import REGISTRO, iniciar_servidor
+
+# Servidor de adquisición compartido: un único proceso es dueño de los sensores
+# (SPI) y publica las muestras por un socket local; cualquier cantidad de
+# sesiones de Streamlit o herramientas de línea de comandos se suscriben en
+# solo lectura sin competir por el dispositivo.
+#   python servidor.py                       -> socket Unix en SOCKET_PATH
+#   python servidor.py --tcp 127.0.0.1:9110  -> además TCP local
+#   TTT_SERVIDOR=/tmp/ttt_adquisicion.sock streamlit run app.py
+#   python servidor.py --escuchar            -> monitor de un suscriptor
+#
+# Tramas: cabecera fija CABECERA_TRAMA (magic, tipo, versión, largo) + payload
+#   HOLA        servidor -> cliente   JSON {"fuentes": [...], "version": N, "escalas": {fuente: µm/cuenta}}
+#               (escalas: solo las fuentes que ya publican cuentas calibradas, la fusión con perfiles)
+#   SUSCRIBIR   cliente -> servidor   JSON {"fuente": nombre}
+#   MUESTRAS    servidor -> cliente   CABECERA_MUESTRAS (perdidas) + registros DTYPE_TRAMA
+#   RESULTADO   ambos sentidos        JSON de una conexión cerrada; el servidor la reenvía a todos
+# Contrapresión: cada cliente tiene su cola acotada y su hilo de envío. Si un
+# cliente lento la llena, sus tramas se descartan (y se le informan como
+# perdidas en la siguiente); ni el muestreo ni los demás clientes esperan.
+
+# --- CONFIGURACIÓN ---
+SOCKET_PATH = os.environ.get("TTT_SERVIDOR", "/tmp/ttt_adquisicion.sock")
+MAGIC_TRAMA = b"TS"
+VERSION_TRAMA = 1
+CABECERA_TRAMA = struct.Struct("<2sBBI")
+CABECERA_MUESTRAS = struct.Struct("<I")
+DTYPE_TRAMA = np.dtype([("t_ns", "<i8"), ("dx", "<i4"), ("dy", "<i4"), ("movimiento", "u1")])   # 17 bytes
+HOLA, SUSCRIBIR, MUESTRAS, RESULTADO = 1, 2, 3, 4
+INTERVALO_PUBLICACION_S = 0.01
+COLA_CLIENTE = 500              # Tramas en espera por cliente (~5 s a INTERVALO_PUBLICACION_S)
+TIMEOUT_SUSCRIPCION_S = 5.0
+MAX_PAYLOAD = 16 << 20
+RESULTADOS_RETENIDOS = 256      # Últimos resultados recibidos que guarda cada cliente
+
+SERVIDOR_CLIENTES = REGISTRO.medidor("ttt_servidor_clientes", "Suscriptores conectados al servidor de adquisición")
+SERVIDOR_DESCARTADAS = REGISTRO.contador("ttt_servidor_muestras_descartadas_total", "Muestras no enviadas a clientes lentos")
+
+
+def empaquetar(tipo, payload):
+    return CABECERA_TRAMA.pack(MAGIC_TRAMA, tipo, VERSION_TRAMA, len(payload)) + payload
+
+
+def _json_default(valor):
+    return valor.item() if isinstance(valor, np.generic) else str(valor)
+
+
+def empaquetar_json(tipo, datos):
+    return empaquetar(tipo, json.dumps(datos, default=_json_default).encode("utf-8"))
+
+
+def empaquetar_muestras(t_ns, dx, dy, movimiento, perdidas = 0):
+    registros = np.empty(len(t_ns), dtype=DTYPE_TRAMA)
+    registros["t_ns"] = t_ns
+    registros["dx"] = dx
+    registros["dy"] = dy
+    registros["movimiento"] = movimiento
+    return empaquetar(MUESTRAS, CABECERA_MUESTRAS.pack(perdidas) + registros.tobytes())
+
+
+def _recibir_exacto(sock, n):
+    partes = []
+    while n:
+        parte = sock.recv(n)
+        if not parte:
+            raise ConnectionError("Conexión cerrada por el otro extremo")
+        partes.append(parte)
+        n -= len(parte)
+    return b"".join(partes)
+
+
+def recibir_trama(sock):
+    # Devuelve (tipo, payload)
+    magic, tipo, version, largo = CABECERA_TRAMA.unpack(_recibir_exacto(sock, CABECERA_TRAMA.size))
+    if magic != MAGIC_TRAMA or version > VERSION_TRAMA:
+        raise ValueError(f"Trama inválida (magic={magic!r}, versión={version})")
+    if largo > MAX_PAYLOAD:
+        raise ValueError(f"Trama demasiado grande: {largo} bytes")
+    return tipo, _recibir_exacto(sock, largo)
+
+
+def desempaquetar_muestras(payload):
+    (perdidas,) = CABECERA_MUESTRAS.unpack_from(payload)
+    return np.frombuffer(payload, dtype=DTYPE_TRAMA, offset=CABECERA_MUESTRAS.size), perdidas
+
+
+def conectar(direccion = SOCKET_PATH, timeout = TIMEOUT_SUSCRIPCION_S):
+    # "host:puerto" para TCP; cualquier otra cosa es la ruta de un socket Unix
+    host, _, puerto = direccion.rpartition(":")
+    if host and puerto.isdigit():
+        sock = socket.create_connection((host, int(puerto)), timeout=timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    else:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(direccion)
+    return sock
+
+
+# ==============================
+# SERVIDOR
+# ==============================
+class Suscriptor:
+    # Un cliente conectado: cola acotada + hilo de envío propio
+    def __init__(self, servidor, sock, nombre):
+        self.servidor = servidor
+        self.sock = sock
+        self.nombre = nombre
+        self.fuente = None
+        self.cola = queue.Queue(maxsize=COLA_CLIENTE)
+        self.descartadas = 0    # Muestras pendientes de informar como perdidas
+        self.activo = True
+
+    def encolar(self, trama, muestras = 0):
+        if self.descartadas and muestras:
+            # Se informa lo descartado en la primera trama que sí entra
+            perdidas = CABECERA_MUESTRAS.unpack_from(trama, CABECERA_TRAMA.size)[0] + self.descartadas
+            trama = trama[:CABECERA_TRAMA.size] + CABECERA_MUESTRAS.pack(perdidas) + trama[CABECERA_TRAMA.size + CABECERA_MUESTRAS.size:]
+        try:
+            self.cola.put_nowait(trama)
+            if muestras:
+                self.descartadas = 0
+        except queue.Full:
+            self.descartadas += muestras
+            SERVIDOR_DESCARTADAS.inc(muestras)
+
+    def atender(self):
+        # Hilo del cliente: saludo, suscripción y después solo envío
+        try:
+            self.sock.sendall(empaquetar_json(HOLA, {"fuentes": self.servidor.gestor.fuentes(), "version": VERSION_TRAMA,
+                                                     "escalas": self.servidor.escalas()}))
+            self.sock.settimeout(TIMEOUT_SUSCRIPCION_S)
+            tipo, payload = recibir_trama(self.sock)
+            if tipo != SUSCRIBIR:
+                raise ValueError(f"Se esperaba SUSCRIBIR y llegó la trama {tipo}")
+            fuente = json.loads(payload).get("fuente")
+            if fuente is not None and fuente not in self.servidor.gestor.fuentes():
+                raise ValueError(f"Fuente desconocida: {fuente}")
+            self.sock.settimeout(None)
+            self.fuente = fuente
+            threading.Thread(target=self._recibir, name=f"{self.nombre}-rx", daemon=True).start()
+            while self.activo:
+                trama = self.cola.get()
+                if trama is None:
+                    break
+                self.sock.sendall(trama)
+        except (OSError, ValueError) as e:
+            logging.info(f"Cliente {self.nombre} desconectado: {e}")
+        finally:
+            self.cerrar()
+
+    def _recibir(self):
+        # Lo único que un suscriptor puede enviar son resultados, que se reenvían a todos
+        try:
+            while self.activo:
+                tipo, payload = recibir_trama(self.sock)
+                if tipo == RESULTADO:
+                    self.servidor.difundir(empaquetar(RESULTADO, payload))
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.cerrar()
+
+    def cerrar(self):
+        if not self.activo:
+            return
+        self.activo = False
+        self.servidor.quitar(self)
+        try:
+            self.cola.put_nowait(None)
+        except queue.Full:
+            pass
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class ServidorAdquisicion:
+    def __init__(self, gestor, socket_path = SOCKET_PATH, tcp = None, intervalo_s = INTERVALO_PUBLICACION_S):
+        self.gestor = gestor
+        self.socket_path = socket_path
+        self.tcp = tcp
+        self.intervalo_s = intervalo_s
+        self.suscriptores = set()
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._escuchas = []
+        self._cursores = {}
+        self._contador = 0
+
+    def escalas(self):
+        # µm por cuenta de las fuentes que publican cuentas ya calibradas (la fusión con perfiles)
+        escalas = {}
+        for fuente in self.gestor.fuentes():
+            perfil = getattr(self.gestor.fuente(fuente), "perfil", None)
+            if perfil is not None:
+                escalas[fuente] = perfil.escala_x
+        return escalas
+
+    def quitar(self, suscriptor):
+        with self._lock:
+            self.suscriptores.discard(suscriptor)
+            SERVIDOR_CLIENTES.set(len(self.suscriptores))
+
+    def difundir(self, trama):
+        with self._lock:
+            destinos = list(self.suscriptores)
+        for suscriptor in destinos:
+            suscriptor.encolar(trama)
+
+    def _escuchar(self, sock):
+        while not self._detener.is_set():
+            try:
+                cliente, _ = sock.accept()
+            except OSError:
+                break
+            if cliente.family != socket.AF_UNIX:
+                cliente.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._lock:
+                self._contador += 1
+                suscriptor = Suscriptor(self, cliente, f"cliente-{self._contador}")
+                self.suscriptores.add(suscriptor)
+                SERVIDOR_CLIENTES.set(len(self.suscriptores))
+            threading.Thread(target=suscriptor.atender, name=suscriptor.nombre, daemon=True).start()
+
+    def _publicar(self):
+        # Una trama por fuente y por ciclo, compartida entre todos sus suscriptores
+        fuentes = self.gestor.fuentes()
+        self._cursores = {f: self.gestor.fuente(f).buffer.ultimo_indice() for f in fuentes}
+        while not self._detener.wait(self.intervalo_s):
+            with self._lock:
+                por_fuente = {}
+                for suscriptor in self.suscriptores:
+                    if suscriptor.fuente is not None:
+                        por_fuente.setdefault(suscriptor.fuente, []).append(suscriptor)
+            for fuente in fuentes:
+                t_ns, dx, dy, movimiento, self._cursores[fuente], perdidas = self.gestor.fuente(fuente).buffer.leer_desde(self._cursores[fuente])
+                if len(t_ns) == 0 or fuente not in por_fuente:
+                    continue
+                trama = empaquetar_muestras(t_ns, dx, dy, movimiento, perdidas)
+                for suscriptor in por_fuente[fuente]:
+                    suscriptor.encolar(trama, len(t_ns))
+
+    def iniciar(self):
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)   # Socket de una ejecución anterior
+        unix = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        unix.bind(self.socket_path)
+        unix.listen()
+        self._escuchas.append(unix)
+        if self.tcp:
+            host, puerto = self.tcp.rsplit(":", 1)
+            tcp = socket.create_server((host, int(puerto)))
+            self._escuchas.append(tcp)
+        for sock in self._escuchas:
+            threading.Thread(target=self._escuchar, args=(sock,), name="servidor-escucha", daemon=True).start()
+        threading.Thread(target=self._publicar, name="servidor-publicacion", daemon=True).start()
+        logging.info(f"Servidor de adquisición en {self.socket_path}" + (f" y tcp://{self.tcp}" if self.tcp else ""))
+
+    def detener(self):
+        self._detener.set()
+        for sock in self._escuchas:
+            sock.close()
+        with self._lock:
+            suscriptores = list(self.suscriptores)
+        for suscriptor in suscriptores:
+            suscriptor.cerrar()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+# ==============================
+# CLIENTE
+# ==============================
+class ClienteAdquisicion(threading.Thread):
+    # Suscripción a una fuente del servidor. Expone la misma interfaz que
+    # AdquisidorSensor (buffer, sensor, is_alive, ultimo_error, estadisticas,
+    # detener): la UI la consume sin cambios.
+    def __init__(self, direccion = SOCKET_PATH, fuente = None, buffer = None):
+        super().__init__(name=f"cliente-{fuente or 'servidor'}", daemon=True)
+        self.direccion = direccion
+        self.sensor = None            # El sensor vive en el servidor
+        self.buffer = buffer if buffer is not None else BufferCircular()
+        self.ultimo_error = None
+        self.perdidas_red = 0         # Muestras que el servidor descartó por atraso de este cliente (también en leer_desde)
+        self.resultados = deque(maxlen=RESULTADOS_RETENIDOS)   # Últimos resultados publicados por cualquier cliente
+        self.resultados_recibidos = 0
+        self._detener = threading.Event()
+        self.sock = conectar(direccion)
+        tipo, payload = recibir_trama(self.sock)
+        if tipo != HOLA:
+            raise ValueError(f"Se esperaba HOLA y llegó la trama {tipo}")
+        hola = json.loads(payload)
+        self.fuentes = hola["fuentes"]
+        self.fuente = fuente if fuente is not None else (self.fuentes[0] if self.fuentes else None)
+        # Como FusionSensores.perfil: la fuente ya llega calibrada, en cuentas de esta escala
+        escala = hola.get("escalas", {}).get(self.fuente)
+        self.perfil = PerfilCalibracion.desde_factor(self.fuente, escala) if escala is not None else None
+        self.sock.sendall(empaquetar_json(SUSCRIBIR, {"fuente": self.fuente}))
+        self.sock.settimeout(None)
+
+    def run(self):
+        try:
+            while not self._detener.is_set():
+                tipo, payload = recibir_trama(self.sock)
+                if tipo == MUESTRAS:
+                    registros, perdidas = desempaquetar_muestras(payload)
+                    self.perdidas_red += perdidas
+                    self.buffer.escribir_bloque(registros["t_ns"], registros["dx"], registros["dy"], registros["movimiento"].astype(bool), perdidas)
+                elif tipo == RESULTADO:
+                    self.resultados.append(json.loads(payload))
+                    self.resultados_recibidos += 1
+        except (OSError, ValueError) as e:
+            if not self._detener.is_set():
+                self.ultimo_error = e
+                logging.error(f"Conexión con el servidor de adquisición perdida: {e}")
+
+    def publicar_resultado(self, **resultado):
+        self.sock.sendall(empaquetar_json(RESULTADO, resultado))
+
+    def detener(self, timeout = 1.0):
+        self._detener.set()
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self.join(timeout)
+
+    def estadisticas(self):
+        return {
+            "muestras": self.buffer.ultimo_indice(),
+            "atrasadas": 0,
+            "errores": int(self.ultimo_error is not None),
+            "activo": self.is_alive(),
+            "perdidas_red": self.perdidas_red,
+        }
+
+
+class GestorRemoto:
+    # Misma interfaz que multisensor.GestorSensores, pero las fuentes son
+    # suscripciones al servidor (una conexión por fuente, abierta al pedirla)
+    def __init__(self, direccion = SOCKET_PATH):
+        self.direccion = direccion
+        self._fuentes = []
+        self.clientes = {}
+
+    @property
+    def ids(self):
+        return list(self._fuentes)
+
+    def fuentes(self):
+        return list(self._fuentes)
+
+    def fuente(self, nombre = None):
+        nombre = nombre if nombre in self._fuentes else self._fuentes[0]
+        cliente = self.clientes.get(nombre)
+        if cliente is None or not cliente.is_alive():
+            cliente = ClienteAdquisicion(self.direccion, nombre)
+            cliente.start()
+            self.clientes[nombre] = cliente
+        return cliente
+
+    def iniciar(self, timeout = TIMEOUT_SUSCRIPCION_S):
+        sock = conectar(self.direccion, timeout)
+        try:
+            tipo, payload = recibir_trama(sock)
+            if tipo != HOLA:
+                raise ValueError(f"Se esperaba HOLA y llegó la trama {tipo}")
+            self._fuentes = json.loads(payload)["fuentes"]
+        finally:
+            sock.close()
+        logging.info(f"Conectado al servidor de adquisición {self.direccion} (fuentes: {', '.join(self._fuentes)})")
+
+    def detener(self):
+        for cliente in self.clientes.values():
+            cliente.detener()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor de adquisición compartido (o monitor de un suscriptor)")
+    parser.add_argument("--socket", default=SOCKET_PATH)
+    parser.add_argument("--tcp", help="host:puerto para aceptar también clientes TCP locales")
+    parser.add_argument("--metricas", type=int, help="puerto del endpoint /metrics")
+    parser.add_argument("--escuchar", action="store_true", help="conectarse como suscriptor y mostrar la tasa recibida")
+    parser.add_argument("--fuente", help="fuente a la que suscribirse con --escuchar")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.INFO)
+
+    if args.escuchar:
+        cliente = ClienteAdquisicion(args.tcp or args.socket, args.fuente)
+        cliente.start()
+        print(f"[OK] Suscripto a {cliente.fuente} (fuentes: {', '.join(cliente.fuentes)})")
+        anterior, vistos = 0, 0
+        while cliente.is_alive():
+            time.sleep(1.0)
+            muestras = cliente.buffer.ultimo_indice()
+            recibidos = cliente.resultados_recibidos
+            print(f"{muestras - anterior} muestras/s | perdidas {cliente.perdidas_red} | resultados {recibidos}", flush=True)
+            nuevos = min(recibidos - vistos, len(cliente.resultados))
+            for resultado in list(cliente.resultados)[len(cliente.resultados) - nuevos:]:
+                print(f"  resultado: {resultado}")
+            anterior, vistos = muestras, recibidos
+        print(f"[ERROR] {cliente.ultimo_error}")
+    else:
+        gestor = gestor_desde_entorno()
+        gestor.iniciar(timeout=10)
+        if args.metricas:
+            iniciar_servidor(args.metricas)
+        servidor = ServidorAdquisicion(gestor, args.socket, args.tcp)
+        servidor.iniciar()
+        print(f"[OK] Servidor de adquisición escuchando en {args.socket}", flush=True)
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))   # systemctl stop: cierre ordenado
+        try:
+            while True:
+                time.sleep(1.0)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            servidor.detener()
+            gestor.detener()
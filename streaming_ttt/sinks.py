@@ -0,0 +1,184 @@
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+# --- CONFIGURACIÓN ---
+COLUMNAS = ['timestamp', 'delta_x', 'delta_y', 'acumulado_x', 'acumulado_y']
+FORMATO_TS = "%Y-%m-%d %H:%M:%S.%f"   # Se recorta a milisegundos como en read_continuous
+FILAS_BUFFER = 4096                   # Filas en memoria antes de bajar a disco
+INTERVALO_FLUSH_S = 1.0               # Flush periódico aunque el buffer no se llene
+INTERVALO_CONSOLA_S = 0.2             # Máximo 5 actualizaciones por segundo en consola
+
+
+class SumideroMuestras:
+    # Escritura incremental de muestras con memoria acotada: las filas se
+    # acumulan en arrays preasignados y se vuelcan a disco cuando se llena el
+    # buffer o pasa `intervalo_flush_s`. Con `rotar_filas` o `rotar_s` se abre
+    # un archivo nuevo (<prefijo>_pNNN<sufijo>) al superar el límite.
+    extension = ""
+
+    def __init__(self, directorio, prefijo, sufijo = "", filas_buffer = FILAS_BUFFER,
+                 intervalo_flush_s = INTERVALO_FLUSH_S, rotar_filas = None, rotar_s = None):
+        os.makedirs(directorio, exist_ok=True)
+        self.directorio = directorio
+        self.prefijo = prefijo
+        self.sufijo = sufijo
+        self.intervalo_flush_s = intervalo_flush_s
+        self.rotar_filas = rotar_filas
+        self.rotar_s = rotar_s
+        self.archivos = []
+        self._t_ns = np.empty(filas_buffer, dtype=np.int64)
+        self._valores = np.empty((filas_buffer, len(COLUMNAS) - 1), dtype=np.float64)
+        self._n = 0
+        self._parte = -1
+        self._filas_archivo = 0
+        self._ultimo_flush = time.monotonic()
+        self._abrir_siguiente()
+
+    def _ruta(self, parte):
+        nombre = self.prefijo if parte == 0 else f"{self.prefijo}_p{parte:03d}"
+        return os.path.join(self.directorio, f"{nombre}{self.sufijo}{self.extension}")
+
+    def _abrir_siguiente(self):
+        self._parte += 1
+        self._filas_archivo = 0
+        self._inicio_archivo = time.monotonic()
+        path = self._ruta(self._parte)
+        self._abrir(path)
+        self.archivos.append(path)
+
+    def _abrir(self, path):
+        raise NotImplementedError
+
+    def _escribir(self, t_ns, valores):
+        raise NotImplementedError
+
+    def _cerrar_archivo(self):
+        raise NotImplementedError
+
+    def agregar(self, t_ns, delta_x, delta_y, acumulado_x, acumulado_y):
+        i = self._n
+        self._t_ns[i] = t_ns
+        self._valores[i] = (delta_x, delta_y, acumulado_x, acumulado_y)
+        self._n = i + 1
+        if self._n == len(self._t_ns) or time.monotonic() - self._ultimo_flush >= self.intervalo_flush_s:
+            self.flush()
+
+    def flush(self):
+        self._ultimo_flush = time.monotonic()
+        if self._n == 0:
+            return
+        self._escribir(self._t_ns[:self._n], self._valores[:self._n])
+        self._filas_archivo += self._n
+        self._n = 0
+        if ((self.rotar_filas is not None and self._filas_archivo >= self.rotar_filas) or
+                (self.rotar_s is not None and time.monotonic() - self._inicio_archivo >= self.rotar_s)):
+            self._cerrar_archivo()
+            self._abrir_siguiente()
+
+    def cerrar(self):
+        self.flush()
+        self._cerrar_archivo()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+
+class SumideroCSV(SumideroMuestras):
+    # Mismo formato que el CSV original de read_continuous (compatible con SensorReplay)
+    extension = ".csv"
+
+    def _abrir(self, path):
+        self._archivo = open(path, "w", newline="")
+        self._archivo.write(",".join(COLUMNAS) + "\n")
+
+    def _escribir(self, t_ns, valores):
+        tz_local = datetime.now().astimezone().tzinfo
+        ts = pd.to_datetime(t_ns, unit="ns", utc=True).tz_convert(tz_local).strftime(FORMATO_TS).str[:-3]
+        bloque = pd.DataFrame(valores, columns=COLUMNAS[1:])
+        bloque.insert(0, "timestamp", ts)
+        bloque.to_csv(self._archivo, header=False, index=False)
+        self._archivo.flush()
+        os.fsync(self._archivo.fileno())
+
+    def _cerrar_archivo(self):
+        self._archivo.close()
+
+
+class SumideroParquet(SumideroMuestras):
+    # Formato binario columnar: timestamp en ns y float64; un row group por flush
+    extension = ".parquet"
+
+    def _abrir(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        self._schema = pa.schema([("timestamp", pa.timestamp("ns", tz="UTC"))] +
+                                 [(c, pa.float64()) for c in COLUMNAS[1:]])
+        self._writer = pq.ParquetWriter(path, self._schema, compression="zstd")
+
+    def _escribir(self, t_ns, valores):
+        pa = self._pa
+        columnas = [pa.array(t_ns, type=pa.int64()).cast(self._schema.field("timestamp").type)]
+        columnas += [pa.array(valores[:, i]) for i in range(valores.shape[1])]
+        self._writer.write_table(pa.Table.from_arrays(columnas, schema=self._schema))
+
+    def _cerrar_archivo(self):
+        self._writer.close()
+
+
+class SumideroBinario(SumideroMuestras):
+    # Formato .ttt de registros fijos (ver formato_binario.py); guarda los deltas
+    # como cuentas crudas, por eso necesita los factores de calibración
+    extension = ".ttt"
+
+    def __init__(self, directorio, prefijo, sufijo = "", factor_x = 1.0, factor_y = 1.0, sensor_id = "", **opciones):
+        self.factor_x, self.factor_y, self.sensor_id = factor_x, factor_y, sensor_id
+        super().__init__(directorio, prefijo, sufijo, **opciones)
+
+    def _abrir(self, path):
+        from formato_binario import EscritorCrudo
+        self._escritor = EscritorCrudo(path, self.factor_x, self.factor_y, self.sensor_id)
+
+    def _escribir(self, t_ns, valores):
+        # Los deltas llegan en mm: se vuelven a cuentas con el factor [µm/cuenta]
+        dx = np.rint(valores[:, 0] * 1000.0 / self.factor_x)
+        dy = np.rint(valores[:, 1] * 1000.0 / self.factor_y)
+        self._escritor.agregar(t_ns, dx, dy, valores[:, 2], valores[:, 3])
+        self._escritor.flush(fsync=True)
+
+    def _cerrar_archivo(self):
+        self._escritor.cerrar()
+
+
+FORMATOS = {"csv": SumideroCSV, "parquet": SumideroParquet, "ttt": SumideroBinario}
+
+
+def crear_sumidero(formato, directorio, prefijo, sufijo = "", **opciones):
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconocido: {formato} (opciones: {', '.join(FORMATOS)})")
+    return FORMATOS[formato](directorio, prefijo, sufijo, **opciones)
+
+
+class ReporteConsola:
+    # Muestra la última lectura como máximo cada `intervalo_s`: el formateo y el
+    # print quedan fuera del camino caliente de adquisición
+    def __init__(self, intervalo_s = INTERVALO_CONSOLA_S, salida = sys.stdout):
+        self.intervalo_s = intervalo_s
+        self.salida = salida
+        self._proximo = 0.0
+
+    def actualizar(self, t_ns, delta_x, delta_y, suma_x, suma_y):
+        ahora = time.monotonic()
+        if ahora < self._proximo:
+            return
+        self._proximo = ahora + self.intervalo_s
+        timestamp = datetime.fromtimestamp(t_ns / 1e9).strftime(FORMATO_TS)[:-3]
+        print(f"\r{timestamp} | ΔX={delta_x:.3f}, ΔY={delta_y:.3f} | SumX={abs(suma_x):.3f}, SumY={abs(suma_y):.3f}  ",
+              end="", flush=True, file=self.salida)
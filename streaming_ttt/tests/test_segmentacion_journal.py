@@ -0,0 +1,96 @@
+import gc
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+from acquisition import BufferCircular
+from historico import HistoricoConexiones
+
+# Cierre automático en medio de un bloque, corte y recuperación desde el journal:
+# la conexión nueva tiene que retomarse desde el punto de cierre, no desde el
+# total de la anterior.
+
+DIRECTORIO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(DIRECTORIO, "app.py")
+PERIODO_NS = 10_000_000      # 100 Hz
+CUENTAS = 20                 # Cuentas por muestra en los enrosques
+
+
+class AdquisidorFijo:
+    # Mismo contrato que AdquisidorSensor, con el buffer ya cargado
+    def __init__(self, dx):
+        self.buffer = BufferCircular()
+        t_ns = 1_700_000_000_000_000_000 + np.arange(len(dx), dtype=np.int64) * PERIODO_NS
+        self.buffer.escribir_bloque(t_ns, dx, np.zeros(len(dx), dtype=np.int32), dx != 0)
+        self.sensor = None
+        self.ultimo_error = None
+
+    def is_alive(self):
+        return True
+
+    def estadisticas(self):
+        return {"muestras": self.buffer.ultimo_indice(), "atrasadas": 0, "errores": 0, "activo": True}
+
+
+@pytest.fixture
+def directorio_app(tmp_path, monkeypatch):
+    shutil.copy(os.path.join(DIRECTORIO, "thresholds.json"), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("TTT_SENSOR", "sintetico")   # La UI consulta el gestor de sensores; sin hardware
+    st.cache_resource.clear()    # Recursos por proceso (histórico, gestor) con rutas relativas a tmp_path
+    yield tmp_path
+    for historico in [o for o in gc.get_objects() if isinstance(o, HistoricoConexiones)]:
+        historico.cerrar()       # Antes de volver al directorio anterior
+    st.cache_resource.clear()
+
+
+def nueva_app():
+    return AppTest.from_file(APP, default_timeout=60)
+
+
+def test_cierre_automatico_corte_y_recuperacion(directorio_app):
+    from journal import Journal
+    # Enrosque de 100 muestras, meseta de 6 s (cierra a los ~3 s) y 50 muestras de la conexión siguiente
+    dx = np.concatenate([np.full(100, CUENTAS), np.zeros(600), np.full(50, CUENTAS)]).astype(np.int32)
+
+    at = nueva_app()
+    at.run()
+    pozo = pd.DataFrame({"Cantidad": [2], "Diametro": ["7/8"], "Grado de acero": ["UHS"]})
+    at.session_state["pozo_df"] = pozo
+    at.session_state["df_expandido"] = pozo.loc[pozo.index.repeat(pozo["Cantidad"])].reset_index(drop=True)
+    at.session_state["total_conexiones"] = 2
+    at.session_state["journal"] = Journal.nueva(at.session_state["datos"].dtypes)
+    at.session_state["modo_segmentacion"] = "automatico"
+    at.session_state["adquisidor"] = AdquisidorFijo(dx)
+    at.session_state["cursor_buffer"] = 0
+    at.session_state["sensor_inicializado"] = True
+    at.session_state["medicion_activa"] = True
+    at.run()     # Un único leer_sensor con todo el buffer: cierre en medio del bloque
+    assert not at.exception
+
+    factor = at.session_state["factor"]
+    resultados = at.session_state["resultados"].a_dataframe()
+    assert len(resultados) == 1
+    assert resultados["desplazamiento"].iloc[0] == pytest.approx(100 * CUENTAS * factor / 1000, abs=0.05)
+
+    datos = at.session_state["datos"]
+    inicio = at.session_state["inicio_conexion"]
+    assert 0 < inicio < len(datos) == len(dx)
+    x_nueva = datos["x_mm"][inicio:]
+    assert x_nueva[-1] == pytest.approx(50 * CUENTAS * factor / 1000, abs=0.05)   # Medida desde el cierre
+    assert at.session_state["x_acum"] == pytest.approx(x_nueva[-1])
+    assert at.session_state["resumen_grafico"].muestras == len(datos) - inicio
+
+    # Corte: el proceso muere sin cerrar la sesión (atexit solo vacía el journal)
+    at.session_state["journal"].cerrar()
+    recuperada = nueva_app()
+    recuperada.run()
+    assert not recuperada.exception
+    assert recuperada.session_state["conexiones_realizadas"] == 1
+    assert recuperada.session_state["inicio_conexion"] == inicio
+    assert recuperada.session_state["x_acum"] == pytest.approx(x_nueva[-1])
+    assert recuperada.session_state["sensor_value"] == pytest.approx(at.session_state["sensor_value"])
+    recuperada.session_state["journal"].cerrar()
@@ -0,0 +1,97 @@
+import os
+import json
+import logging
+import threading
+import numpy as np
+import pandas as pd
+
+# --- CONFIGURACIÓN ---
+THRESHOLDS_PATH = "thresholds.json"
+COLUMNA_GRADO = "Grado de acero"     # Columnas del CSV de diseño de pozo
+COLUMNA_DIAMETRO = "Diametro"
+
+
+class IndiceUmbrales:
+    # Índice de umbrales (grado, diámetro) -> (min, max) cacheado en memoria.
+    # recargar_si_cambio() solo hace un stat del archivo; si cambió el mtime se
+    # reconstruye el índice completo y se reemplaza de una vez (los lectores ven
+    # el índice viejo o el nuevo, nunca uno a medio cargar).
+    def __init__(self, path = THRESHOLDS_PATH):
+        self.path = path
+        self.version = 0
+        self._mtime = None
+        self._tabla = pd.DataFrame(columns=["grado_acero", "diametro", "umbral_min", "umbral_max"])
+        self._lock = threading.Lock()
+        self.recargar_si_cambio()
+
+    @property
+    def tabla(self):
+        return self._tabla
+
+    def recargar_si_cambio(self):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError as e:
+            logging.error(f"No se puede leer {self.path}: {e}")
+            return False
+        if mtime == self._mtime:
+            return False
+        with self._lock:
+            if mtime == self._mtime:
+                return False
+            try:
+                with open(self.path, "r") as f:
+                    umbrales = json.load(f)
+                filas = [(str(grado).strip(), str(diametro).strip(), float(v["min"]), float(v["max"]))
+                         for grado, por_diametro in umbrales.items() for diametro, v in por_diametro.items()]
+            except (ValueError, KeyError, TypeError, AttributeError) as e:
+                # Archivo a medio escribir o inválido: se mantiene el índice anterior
+                logging.error(f"Umbrales inválidos en {self.path}, se conserva la versión anterior: {e}")
+                return False
+            self._tabla = pd.DataFrame(filas, columns=["grado_acero", "diametro", "umbral_min", "umbral_max"])
+            self._mtime = mtime
+            self.version += 1
+        logging.info(f"Umbrales cargados desde {self.path} ({len(filas)} combinaciones, versión {self.version})")
+        return True
+
+    def buscar(self, grado, diametro):
+        fila = self._tabla[(self._tabla["grado_acero"] == str(grado).strip()) & (self._tabla["diametro"] == str(diametro).strip())]
+        if fila.empty:
+            return None
+        return float(fila["umbral_min"].iloc[0]), float(fila["umbral_max"].iloc[0])
+
+    def asignar(self, df_expandido):
+        # Agrega grado_acero/diametro normalizados y umbral_min/umbral_max a todas
+        # las filas con un único join. Devuelve también las combinaciones sin umbral.
+        df = df_expandido.drop(columns=["grado_acero", "diametro", "umbral_min", "umbral_max"], errors="ignore")
+        df["grado_acero"] = df[COLUMNA_GRADO].astype(str).str.strip()
+        df["diametro"] = df[COLUMNA_DIAMETRO].astype(str).str.strip()
+        df = df.merge(self._tabla, on=["grado_acero", "diametro"], how="left", validate="many_to_one")
+        sin_umbral = df["umbral_min"].isna()
+        faltantes = list(df.loc[sin_umbral, ["grado_acero", "diametro"]].drop_duplicates().itertuples(index=False, name=None))
+        return df, faltantes
+
+    @staticmethod
+    def clasificar(desplazamiento, umbral_min, umbral_max):
+        # OK / NO OK vectorizado (acepta escalares o arrays); sin umbral -> NO OK
+        desplazamiento = np.asarray(desplazamiento, dtype=float)
+        dentro = (np.asarray(umbral_min, dtype=float) <= desplazamiento) & (desplazamiento <= np.asarray(umbral_max, dtype=float))
+        comentario = np.where(dentro, "OK", "NO OK").astype(object)
+        return comentario if comentario.ndim else comentario.item()
+
+    @staticmethod
+    def clasificar_resultados(resultados):
+        # Reclasifica las conexiones no marcadas como reassembly con sus umbrales registrados
+        # (los del CSV, no los de la tabla: no hace falta cargar el índice)
+        comentario = resultados["comentario"].astype(str)
+        reassembly = comentario.str.contains("reassembly", case=False)
+        nuevo = IndiceUmbrales.clasificar(resultados["desplazamiento"], resultados["umbral_min"], resultados["umbral_max"])
+        return pd.Series(np.where(reassembly, comentario, nuevo), index=resultados.index)
+
+
+def tabla_resumen(clasificacion):
+    # Conteos de la tabla resumen del informe a partir de la clasificación de cada conexión
+    total = int(len(clasificacion))
+    ok = int((clasificacion == "OK").sum())
+    nok = int((clasificacion == "NO OK").sum())
+    return {"Total": total, "OK": ok, "NO_OK": nok, "NO_OK_Reassembly": total - ok - nok}